@@ -1,11 +1,16 @@
 """Ollama API client for local AI model inference."""
 
 import logging
+import time
 import requests
 from typing import Dict, Any, Optional, List
 
 logger = logging.getLogger(__name__)
 
+# Seconds an is_available() probe result is reused. A DM or command often
+# checks availability several times within a moment of the first probe.
+AVAILABILITY_CACHE_TTL = 2.0
+
 
 class OllamaException(Exception):
     """Exception raised for Ollama API errors."""
@@ -32,6 +37,8 @@ class OllamaClient:
         self.model = model
         self.api_url = f"{self.host}/api"
         self.max_input_tokens = max_input_tokens
+        # (monotonic time of last probe, result); probed on first use
+        self._availability = (None, False)
 
     def _estimate_tokens(self, text: str) -> int:
         """Estimate the number of tokens in text.
@@ -78,15 +85,24 @@ class OllamaClient:
     def is_available(self) -> bool:
         """Check if Ollama is available and responding.
 
+        The result is reused for AVAILABILITY_CACHE_TTL seconds.
+
         Returns:
             True if Ollama is available, False otherwise
         """
+        now = time.monotonic()
+        checked_at, available = self._availability
+        if checked_at is not None and now - checked_at < AVAILABILITY_CACHE_TTL:
+            return available
+
         try:
             response = requests.get(f"{self.host}/", timeout=5)
-            return response.status_code == 200
+            available = response.status_code == 200
         except requests.RequestException as e:
             logger.warning(f"Ollama not available: {e}")
-            return False
+            available = False
+        self._availability = (now, available)
+        return available
 
     def list_models(self) -> List[Dict[str, Any]]:
         """List available models.
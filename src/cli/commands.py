@@ -5,11 +5,13 @@ import logging
 import os
 import time
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 
 from ..signal.cli_wrapper import SignalCLI
 from ..signal.setup import SetupWizard
 from ..database.repository import DatabaseRepository
+from ..database.writer import MessageWriter
 from ..utils.timezone import now_in_timezone
 from ..utils.message_utils import split_long_message
 from ..ai.ollama_client import OllamaClient
@@ -18,6 +20,81 @@ from ..scheduler.jobs import ExportScheduler
 
 logger = logging.getLogger(__name__)
 
+# Weekday tables, indexed 0=Monday .. 6=Sunday (matches schedule_day_of_week)
+_DAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+_DAY_NAMES = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+
+# Heavy modules are imported lazily to keep CLI startup fast, but memoized so
+# repeated invocations within one process (daemon, API) only pay the cost once.
+@lru_cache(maxsize=None)
+def _pytz():
+    """Return the pytz module, importing it on first use."""
+    import pytz
+    return pytz
+
+
+@lru_cache(maxsize=None)
+def _uvicorn():
+    """Return the uvicorn module, importing it on first use.
+
+    Raises:
+        ImportError: If uvicorn is not installed (not cached, so a later
+            install is picked up)
+    """
+    import uvicorn
+    return uvicorn
+
+
+@lru_cache(maxsize=4)
+def _repo(db_path: str) -> DatabaseRepository:
+    """Return a shared DatabaseRepository for db_path.
+
+    Constructing a repository opens the engine and runs schema checks and
+    migrations, so commands invoked repeatedly in one process reuse it. The
+    engine is created with check_same_thread=False and each operation opens
+    its own session, so sharing across threads is safe.
+    """
+    return DatabaseRepository(db_path)
+
+
+# Parsed DM settings, resolved from the environment on first use.
+# dm enable/disable update 'enabled' directly so no re-parse is needed.
+_dm_cfg = {'enabled': None, 'retention': None}
+
+
+def _refresh_dm_cfg() -> dict:
+    """Re-read DM_CHAT_ENABLED / DM_RETENTION_HOURS into the cache."""
+    _dm_cfg['enabled'] = os.getenv("DM_CHAT_ENABLED", "true").lower() in ("true", "1", "yes")
+    _dm_cfg['retention'] = int(os.getenv("DM_RETENTION_HOURS", "48"))
+    return _dm_cfg
+
+
+def _dm_enabled() -> bool:
+    """Whether the DM chat feature is enabled."""
+    value = _dm_cfg['enabled']
+    return value if value is not None else _refresh_dm_cfg()['enabled']
+
+
+def _dm_retention_hours() -> int:
+    """Default DM retention period in hours."""
+    value = _dm_cfg['retention']
+    return value if value is not None else _refresh_dm_cfg()['retention']
+
+
+@lru_cache(maxsize=None)
+def _summary_poster_cls():
+    """Return the SummaryPoster class, importing it on first use."""
+    from ..exporter.summary_poster import SummaryPoster
+    return SummaryPoster
+
+
+@lru_cache(maxsize=None)
+def _message_collector_cls():
+    """Return the MessageCollector class, importing it on first use."""
+    from ..exporter.message_exporter import MessageCollector
+    return MessageCollector
+
 
 @click.group()
 @click.pass_context
@@ -267,7 +344,7 @@ def accept_invite(phone, config_dir, group_id, list_only):
 @click.option('--hours', default=24, help='Hours to look back for messages (default: 24)')
 def summarize(phone, config_dir, db_path, ollama_host, ollama_model, group, hours):
     """Generate on-demand privacy-focused summary for a group (transient processing)."""
-    from ..exporter.message_exporter import MessageCollector
+    MessageCollector = _message_collector_cls()
 
     click.echo(f"Generating privacy-focused summary for '{group}' (last {hours} hours)...")
 
@@ -402,6 +479,19 @@ def _is_member_of_group(signal_cli, group_id: str, sender_uuid: str, sender_numb
         return False
 
 
+def _is_valid_hhmm(time_str: str) -> bool:
+    """Check that a string is a valid 24-hour HH:MM time.
+
+    Uses explicit checks rather than try/except so invalid input never
+    raises on the validation path.
+    """
+    parts = time_str.split(":")
+    if len(parts) != 2 or not all(part.isascii() and part.isdigit() for part in parts):
+        return False
+    hour, minute = int(parts[0]), int(parts[1])
+    return 0 <= hour <= 23 and 0 <= minute <= 59
+
+
 def _parse_quoted_args(text: str) -> list:
     """Parse arguments that may be quoted.
 
@@ -443,9 +533,10 @@ def _handle_schedule_command(
     """
     import os
     import re
-    import pytz
     from src.utils.message_utils import anonymize_group_id
 
+    pytz = _pytz()
+
     # Parse the command
     text = message_text.strip()
     # Remove "!schedule" prefix
@@ -778,9 +869,9 @@ Be friendly and concise."""
 @click.option('--auto-accept-invites/--no-auto-accept-invites', envvar='AUTO_ACCEPT_GROUP_INVITES', default=True, help='Auto-accept group invites')
 def daemon(phone, config_dir, db_path, ollama_host, ollama_model, auto_accept_invites):
     """Run Privacy Summarizer daemon with real-time message handling."""
-    from ..exporter.summary_poster import SummaryPoster
-    from ..exporter.message_exporter import MessageCollector
     from ..dm.handler import DMHandler
+    SummaryPoster = _summary_poster_cls()
+    MessageCollector = _message_collector_cls()
     import threading
     import subprocess
     import json
@@ -812,14 +903,15 @@ def daemon(phone, config_dir, db_path, ollama_host, ollama_model, auto_accept_in
             from ..signal.sse_client import SignalSSEClient
             sse_client = SignalSSEClient(phone, sse_host, sse_port)
             groups = sse_client.list_groups()
-            group_count = 0
-            for group in groups:
-                group_id = group.get("id")
-                name = group.get("name", "Unknown Group")
-                description = group.get("description", "")
-                if group_id:
-                    db_repo.create_group(group_id=group_id, name=name, description=description)
-                    group_count += 1
+            group_count = db_repo.upsert_groups([
+                {
+                    "group_id": group["id"],
+                    "name": group.get("name", "Unknown Group"),
+                    "description": group.get("description", "")
+                }
+                for group in groups
+                if group.get("id")
+            ])
         else:
             group_count = message_collector.sync_groups()
         click.echo(f"✓ Synced {group_count} groups from Signal")
@@ -850,7 +942,11 @@ def daemon(phone, config_dir, db_path, ollama_host, ollama_model, auto_accept_in
     else:
         dm_signal_client = signal_cli
 
-    dm_handler = DMHandler(ollama, dm_signal_client, db_repo)
+    # Hand over the already-parsed DM settings rather than re-reading the environment
+    dm_handler = DMHandler(
+        ollama, dm_signal_client, db_repo,
+        enabled=_dm_enabled(), retention_hours=_dm_retention_hours()
+    )
     message_collector.dm_handler = dm_handler
 
     summary_poster = SummaryPoster(signal_cli, summarizer, db_repo, message_collector)
@@ -1041,8 +1137,9 @@ def daemon(phone, config_dir, db_path, ollama_host, ollama_model, auto_accept_in
             logger.error(f"Summarize callback failed: {e}")
             return f"Failed to generate summary: {str(e)[:100]}"
 
-    # Track running state
+    # Track running state; shutdown_event lets loops wake immediately on Ctrl+C
     running = True
+    shutdown_event = threading.Event()
 
     # Start message polling in background thread
     def realtime_loop():
@@ -1055,16 +1152,22 @@ def daemon(phone, config_dir, db_path, ollama_host, ollama_model, auto_accept_in
         processed_timestamps = set()
         MAX_PROCESSED_CACHE = 1000  # Limit cache size to prevent memory growth
 
-        while running:
+        # Messages from one receive cycle are committed together
+        message_writer = MessageWriter(db_repo)
+
+        while running and not shutdown_event.is_set():
             try:
                 # Use signal-cli directly to receive messages (with short timeout)
                 # Note: -o json is a global option, not a receive subcommand option
+                # Keep the per-cycle wait short so shutdown is never blocked for
+                # long; the outer timeout leaves headroom for JVM startup.
                 result = subprocess.run(
                     ["signal-cli", "--config", config_dir, "-a", phone,
-                     "-o", "json", "receive", "--timeout", "5"],
+                     "-o", "json", "receive", "--timeout", "2",
+                     "--ignore-attachments", "--ignore-stories"],
                     capture_output=True,
                     text=True,
-                    timeout=30
+                    timeout=10
                 )
 
                 if result.stdout:
@@ -1072,6 +1175,10 @@ def daemon(phone, config_dir, db_path, ollama_host, ollama_model, auto_accept_in
                     for line in result.stdout.strip().split('\n'):
                         if not line:
                             continue
+                        # Receipts, typing indicators and sync messages carry no
+                        # dataMessage; skip them without paying for a JSON parse
+                        if '"dataMessage"' not in line:
+                            continue
                         try:
                             envelope = json.loads(line)
 
@@ -1122,9 +1229,11 @@ def daemon(phone, config_dir, db_path, ollama_host, ollama_model, auto_accept_in
 
                                 logger.info(f"Received message in group {group_id[:20]}...")
 
-                                # Check if this is a command (don't store commands to database)
-                                text_lower = message_text.strip().lower()
-                                is_command = text_lower.startswith('!')
+                                # Check if this is a command (don't store commands to database).
+                                # Only commands are lowercased; every branch below matches on "!"
+                                stripped_text = message_text.strip()
+                                is_command = stripped_text.startswith('!')
+                                text_lower = stripped_text.lower() if is_command else ""
 
                                 # Store non-command messages to database (respecting opt-out)
                                 if group_id and source_uuid and not is_command:
@@ -1134,19 +1243,11 @@ def daemon(phone, config_dir, db_path, ollama_host, ollama_model, auto_accept_in
                                     else:
                                         try:
                                             # Auto-update retention from Signal's disappearing messages setting
-                                            settings = db_repo.get_group_settings(group_id)
-                                            if settings is None or settings.source == "signal":
-                                                if expires_in_seconds > 0:
-                                                    retention_hours = max(1, expires_in_seconds // 3600)
-                                                else:
-                                                    retention_hours = 48  # Default when no disappearing messages
-
-                                                current = db_repo.get_group_retention_hours(group_id)
-                                                if retention_hours != current:
-                                                    db_repo.set_group_retention_hours(group_id, retention_hours, source="signal")
-                                                    logger.info(f"Auto-set retention for {group_id[:20]}... to {retention_hours}h from Signal")
-
-                                            db_repo.store_message(
+                                            retention_hours = db_repo.sync_signal_retention(group_id, expires_in_seconds)
+                                            if retention_hours is not None:
+                                                logger.info(f"Auto-set retention for {group_id[:20]}... to {retention_hours}h from Signal")
+
+                                            message_writer.add_message(
                                                 signal_timestamp=timestamp,
                                                 sender_uuid=source_uuid,
                                                 group_id=group_id,
@@ -1155,6 +1256,13 @@ def daemon(phone, config_dir, db_path, ollama_host, ollama_model, auto_accept_in
                                         except Exception as e:
                                             logger.error(f"Failed to store message: {e}")
 
+                                # Commands may read messages back - write the buffer first
+                                if is_command:
+                                    try:
+                                        message_writer.flush()
+                                    except Exception as e:
+                                        logger.error(f"Failed to store messages: {e}")
+
                                 # Process commands
                                 if text_lower == "!help" and group_id:
                                     logger.info("Processing !help command")
@@ -1475,13 +1583,14 @@ Provide a clear, concise summary. Remember: no names, no quotes, use general ter
                         except json.JSONDecodeError as e:
                             logger.debug(f"Failed to parse JSON line: {e}")
 
+                    message_writer.flush()
+
             except subprocess.TimeoutExpired:
                 logger.debug("Receive timeout (normal)")
             except Exception as e:
                 logger.error(f"Real-time loop error: {e}")
 
-            import time as time_module
-            time_module.sleep(1)  # Brief pause between receive cycles
+            shutdown_event.wait(0.1)  # Brief pause between receive cycles
         logger.info("Real-time message loop stopped")
 
     def sse_loop():
@@ -1498,15 +1607,14 @@ Provide a clear, concise summary. Remember: no names, no quotes, use general ter
         )
 
         # Wait for daemon to be ready
-        import time as time_module
         for attempt in range(30):
-            if not running:
+            if not running or shutdown_event.is_set():
                 return
             if client.is_daemon_running():
                 logger.info("Connected to signal-daemon")
                 break
             logger.info(f"Waiting for signal-daemon... (attempt {attempt + 1}/30)")
-            time_module.sleep(2)
+            shutdown_event.wait(2)
         else:
             logger.error("Failed to connect to signal-daemon after 30 attempts")
             return
@@ -1555,8 +1663,10 @@ Provide a clear, concise summary. Remember: no names, no quotes, use general ter
             # Group message handling
             logger.info(f"Received message in group {msg.group_id[:20]}...")
 
-            text_lower = msg.message.strip().lower()
-            is_command = text_lower.startswith('!')
+            # Only commands are lowercased; every branch below matches on "!"
+            stripped_text = msg.message.strip()
+            is_command = stripped_text.startswith('!')
+            text_lower = stripped_text.lower() if is_command else ""
 
             # Store non-command messages
             if msg.source_uuid and not is_command:
@@ -1565,16 +1675,9 @@ Provide a clear, concise summary. Remember: no names, no quotes, use general ter
                 else:
                     try:
                         # Auto-update retention from Signal's disappearing messages
-                        settings = db_repo.get_group_settings(msg.group_id)
-                        if settings is None or settings.source == "signal":
-                            if msg.expires_in_seconds > 0:
-                                retention_hours = max(1, msg.expires_in_seconds // 3600)
-                            else:
-                                retention_hours = 48
-                            current = db_repo.get_group_retention_hours(msg.group_id)
-                            if retention_hours != current:
-                                db_repo.set_group_retention_hours(msg.group_id, retention_hours, source="signal")
-                                logger.info(f"Auto-set retention for {msg.group_id[:20]}... to {retention_hours}h")
+                        retention_hours = db_repo.sync_signal_retention(msg.group_id, msg.expires_in_seconds)
+                        if retention_hours is not None:
+                            logger.info(f"Auto-set retention for {msg.group_id[:20]}... to {retention_hours}h")
 
                         db_repo.store_message(
                             signal_timestamp=msg.timestamp,
@@ -1889,9 +1992,8 @@ Provide a clear, concise summary. Remember: no names, no quotes, use general ter
         client.start_streaming()
 
         # Keep running while daemon is active
-        import time as time_module
-        while running:
-            time_module.sleep(1)
+        while running and not shutdown_event.is_set():
+            shutdown_event.wait(1)
 
         client.stop_streaming()
         logger.info("SSE loop stopped")
@@ -1913,17 +2015,19 @@ Provide a clear, concise summary. Remember: no names, no quotes, use general ter
     click.echo(f"\n✓ Enabled Scheduled Summaries: {len(scheduled_summaries)}")
 
     if scheduled_summaries:
+        # Build the listing once and echo it in a single write
+        lines = []
         for schedule in scheduled_summaries:
             schedule_type = getattr(schedule, 'schedule_type', 'daily')
             if schedule_type == 'weekly':
                 day_of_week = getattr(schedule, 'schedule_day_of_week', 0)
-                day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-                day_name = day_names[day_of_week] if 0 <= day_of_week <= 6 else f"Day {day_of_week}"
+                day_name = _DAY_NAMES[day_of_week] if 0 <= day_of_week <= 6 else f"Day {day_of_week}"
                 time_str = schedule.schedule_times[0] if schedule.schedule_times else "Unknown"
-                click.echo(f"  - {schedule.name}: {day_name}s at {time_str} ({schedule.timezone})")
+                lines.append(f"  - {schedule.name}: {day_name}s at {time_str} ({schedule.timezone})")
             else:
                 times_str = ', '.join(schedule.schedule_times)
-                click.echo(f"  - {schedule.name}: Daily at {times_str} ({schedule.timezone})")
+                lines.append(f"  - {schedule.name}: Daily at {times_str} ({schedule.timezone})")
+        click.echo("\n".join(lines))
     else:
         click.echo(f"\n⚠ No scheduled summaries configured.")
         click.echo(f"   Use 'schedule-summary add' to create schedules")
@@ -1940,6 +2044,7 @@ Provide a clear, concise summary. Remember: no names, no quotes, use general ter
     except KeyboardInterrupt:
         click.echo("\nStopping daemon...")
         running = False
+        shutdown_event.set()
         scheduler.stop()
         click.echo("✓ Privacy Summarizer daemon stopped")
 
@@ -1957,7 +2062,7 @@ def schedule_summary():
 @click.option('--type', 'schedule_type', type=click.Choice(['daily', 'weekly']), default='daily', help='Schedule type: daily or weekly (default: daily)')
 @click.option('--times', multiple=True, help='Schedule times for daily summaries in HH:MM format (e.g., --times 08:00 --times 20:00)')
 @click.option('--time', 'weekly_time', help='Schedule time for weekly summaries in HH:MM format (e.g., --time 20:00)')
-@click.option('--day-of-week', type=click.Choice(['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']), help='Day of week for weekly summaries')
+@click.option('--day-of-week', type=click.Choice(_DAYS), help='Day of week for weekly summaries')
 @click.option('--timezone', default='UTC', help='Timezone for scheduled times (e.g., America/Chicago, US/Central)')
 @click.option('--period-hours', default=24, type=int, help='Hours to look back for summary (default: 24 for daily, 168 for weekly)')
 @click.option('--retention-hours', default=48, type=int, help='Hours to retain messages for this schedule (default: 48, use higher for weekly)')
@@ -1966,7 +2071,7 @@ def schedule_summary():
 @click.option('--config-dir', envvar='SIGNAL_CLI_CONFIG_DIR', default='/signal-cli-config', help='Signal-CLI config directory')
 def add_schedule(name, source_group, target_group, schedule_type, times, weekly_time, day_of_week, timezone, period_hours, retention_hours, db_path, phone, config_dir):
     """Add a new scheduled summary."""
-    import pytz
+    pytz = _pytz()
 
     try:
         # Validate based on schedule type
@@ -1980,20 +2085,12 @@ def add_schedule(name, source_group, target_group, schedule_type, times, weekly_
                 exit(1)
 
             # Validate time format
-            try:
-                hour, minute = map(int, weekly_time.split(":"))
-                if not (0 <= hour <= 23 and 0 <= minute <= 59):
-                    raise ValueError()
-            except:
+            if not _is_valid_hhmm(weekly_time):
                 click.echo(f"✗ Invalid time format: {weekly_time}. Must be HH:MM (e.g., 08:00, 20:00)")
                 exit(1)
 
             # Map day name to number (0=Monday, 6=Sunday)
-            day_map = {
-                'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
-                'friday': 4, 'saturday': 5, 'sunday': 6
-            }
-            day_of_week_num = day_map[day_of_week]
+            day_of_week_num = _DAYS.index(day_of_week.lower())
 
             # Use weekly_time as the single schedule time
             schedule_times = [weekly_time]
@@ -2009,11 +2106,7 @@ def add_schedule(name, source_group, target_group, schedule_type, times, weekly_
 
             # Validate times format
             for time_str in times:
-                try:
-                    hour, minute = map(int, time_str.split(":"))
-                    if not (0 <= hour <= 23 and 0 <= minute <= 59):
-                        raise ValueError()
-                except:
+                if not _is_valid_hhmm(time_str):
                     click.echo(f"✗ Invalid time format: {time_str}. Must be HH:MM (e.g., 08:00, 20:00)")
                     exit(1)
 
@@ -2027,13 +2120,13 @@ def add_schedule(name, source_group, target_group, schedule_type, times, weekly_
         # Validate timezone
         try:
             pytz.timezone(timezone)
-        except Exception:
+        except pytz.UnknownTimeZoneError:
             click.echo(f"✗ Invalid timezone: {timezone}")
             click.echo(f"\nValid timezone examples: UTC, America/New_York, America/Chicago, America/Los_Angeles, US/Central, US/Eastern")
             exit(1)
 
         # Initialize components
-        db_repo = DatabaseRepository(db_path)
+        db_repo = _repo(db_path)
         signal_cli = SignalCLI(phone, config_dir)
 
         # Get groups
@@ -2099,7 +2192,7 @@ def add_schedule(name, source_group, target_group, schedule_type, times, weekly_
 @click.option('--enabled-only', is_flag=True, help='Show only enabled schedules')
 def list_schedules(db_path, enabled_only):
     """List all scheduled summaries."""
-    db_repo = DatabaseRepository(db_path)
+    db_repo = _repo(db_path)
 
     if enabled_only:
         schedules = db_repo.get_enabled_scheduled_summaries()
@@ -2114,27 +2207,30 @@ def list_schedules(db_path, enabled_only):
         click.echo("No scheduled summaries found.")
         return
 
+    # Build the whole listing and echo it in a single write
+    lines = []
     for schedule in schedules:
         status_icon = "✓" if schedule.enabled else "✗"
         schedule_type = getattr(schedule, 'schedule_type', 'daily')
-        click.echo(f"{status_icon} [{schedule.id}] {schedule.name} ({schedule_type})")
-        click.echo(f"    Source: {schedule.source_group.name}")
-        click.echo(f"    Target: {schedule.target_group.name}")
+        lines.append(f"{status_icon} [{schedule.id}] {schedule.name} ({schedule_type})")
+        lines.append(f"    Source: {schedule.source_group.name}")
+        lines.append(f"    Target: {schedule.target_group.name}")
 
         if schedule_type == 'weekly':
             day_of_week = getattr(schedule, 'schedule_day_of_week', None)
-            day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-            day_name = day_names[day_of_week] if day_of_week is not None and 0 <= day_of_week <= 6 else 'Unknown'
+            day_name = _DAY_NAMES[day_of_week] if day_of_week is not None and 0 <= day_of_week <= 6 else 'Unknown'
             time_str = schedule.schedule_times[0] if schedule.schedule_times else 'Unknown'
-            click.echo(f"    Schedule: {day_name}s at {time_str} ({schedule.timezone})")
+            lines.append(f"    Schedule: {day_name}s at {time_str} ({schedule.timezone})")
         else:
-            click.echo(f"    Times: {', '.join(schedule.schedule_times)} ({schedule.timezone})")
+            lines.append(f"    Times: {', '.join(schedule.schedule_times)} ({schedule.timezone})")
 
-        click.echo(f"    Period: {schedule.summary_period_hours} hours")
-        click.echo(f"    Enabled: {'Yes' if schedule.enabled else 'No'}")
+        lines.append(f"    Period: {schedule.summary_period_hours} hours")
+        lines.append(f"    Enabled: {'Yes' if schedule.enabled else 'No'}")
         if schedule.last_run:
-            click.echo(f"    Last Run: {schedule.last_run.strftime('%Y-%m-%d %H:%M:%S UTC')}")
-        click.echo()
+            lines.append(f"    Last Run: {schedule.last_run.strftime('%Y-%m-%d %H:%M:%S UTC')}")
+        lines.append("")
+
+    click.echo("\n".join(lines))
 
 
 @schedule_summary.command(name='update')
@@ -2145,10 +2241,10 @@ def list_schedules(db_path, enabled_only):
 @click.option('--db-path', envvar='DB_PATH', default='/data/privacy_summarizer.db', help='Database path')
 def update_schedule(schedule_id, times, timezone, period_hours, db_path):
     """Update a scheduled summary."""
-    import pytz
+    pytz = _pytz()
 
     try:
-        db_repo = DatabaseRepository(db_path)
+        db_repo = _repo(db_path)
 
         # Check if schedule exists
         schedule = db_repo.get_scheduled_summary_by_id(schedule_id)
@@ -2162,11 +2258,7 @@ def update_schedule(schedule_id, times, timezone, period_hours, db_path):
         if times:
             # Validate times format
             for time_str in times:
-                try:
-                    hour, minute = map(int, time_str.split(":"))
-                    if not (0 <= hour <= 23 and 0 <= minute <= 59):
-                        raise ValueError()
-                except:
+                if not _is_valid_hhmm(time_str):
                     click.echo(f"✗ Invalid time format: {time_str}")
                     exit(1)
             updates['schedule_times'] = list(times)
@@ -2176,7 +2268,7 @@ def update_schedule(schedule_id, times, timezone, period_hours, db_path):
             try:
                 pytz.timezone(timezone)
                 updates['timezone'] = timezone
-            except:
+            except pytz.UnknownTimeZoneError:
                 click.echo(f"✗ Invalid timezone: {timezone}")
                 exit(1)
 
@@ -2209,7 +2301,7 @@ def update_schedule(schedule_id, times, timezone, period_hours, db_path):
 @click.confirmation_option(prompt='Are you sure you want to remove this schedule?')
 def remove_schedule(schedule_id, name, db_path):
     """Remove a scheduled summary."""
-    db_repo = DatabaseRepository(db_path)
+    db_repo = _repo(db_path)
 
     if not schedule_id and not name:
         click.echo("✗ Must specify --id or --name")
@@ -2243,7 +2335,7 @@ def remove_schedule(schedule_id, name, db_path):
 @click.option('--db-path', envvar='DB_PATH', default='/data/privacy_summarizer.db', help='Database path')
 def enable_schedule(schedule_id, name, db_path):
     """Enable a scheduled summary."""
-    db_repo = DatabaseRepository(db_path)
+    db_repo = _repo(db_path)
 
     if not schedule_id and not name:
         click.echo("✗ Must specify --id or --name")
@@ -2272,7 +2364,7 @@ def enable_schedule(schedule_id, name, db_path):
 @click.option('--db-path', envvar='DB_PATH', default='/data/privacy_summarizer.db', help='Database path')
 def disable_schedule(schedule_id, name, db_path):
     """Disable a scheduled summary."""
-    db_repo = DatabaseRepository(db_path)
+    db_repo = _repo(db_path)
 
     if not schedule_id and not name:
         click.echo("✗ Must specify --id or --name")
@@ -2306,11 +2398,11 @@ def disable_schedule(schedule_id, name, db_path):
 @click.option('--ollama-model', envvar='OLLAMA_MODEL', default='dolphin-mistral:7b', help='Ollama model name')
 def run_now(schedule_id, name, dry_run, db_path, phone, config_dir, ollama_host, ollama_model):
     """Manually run a scheduled summary immediately."""
-    from ..exporter.summary_poster import SummaryPoster
-    from ..exporter.message_exporter import MessageCollector
+    SummaryPoster = _summary_poster_cls()
+    MessageCollector = _message_collector_cls()
 
     try:
-        db_repo = DatabaseRepository(db_path)
+        db_repo = _repo(db_path)
 
         if not schedule_id and not name:
             click.echo("✗ Must specify --id or --name")
@@ -2380,7 +2472,7 @@ def api(host, port, auto_reload):
     import os
 
     try:
-        import uvicorn
+        uvicorn = _uvicorn()
     except ImportError:
         click.echo("✗ uvicorn is not installed. Install with: pip install uvicorn")
         exit(1)
@@ -2418,13 +2510,11 @@ def dm():
 @click.option('--db-path', envvar='DB_PATH', default='/data/privacy_summarizer.db', help='Database path')
 def dm_status(db_path):
     """Show DM chat feature status and statistics."""
-    import os
-
-    db_repo = DatabaseRepository(db_path)
+    db_repo = _repo(db_path)
 
     # Get DM status
-    dm_enabled = os.getenv("DM_CHAT_ENABLED", "true").lower() in ("true", "1", "yes")
-    dm_retention = int(os.getenv("DM_RETENTION_HOURS", "48"))
+    dm_enabled = _dm_enabled()
+    dm_retention = _dm_retention_hours()
 
     # Get statistics
     stats = db_repo.get_dm_stats()
@@ -2451,8 +2541,8 @@ def dm_enable():
     Note: This sets the environment variable for the current process.
     For persistent changes, update DM_CHAT_ENABLED in your .env file.
     """
-    import os
     os.environ["DM_CHAT_ENABLED"] = "true"
+    _dm_cfg['enabled'] = True
     click.echo("✓ DM chat feature enabled (for this session)")
     click.echo("  To make this permanent, set DM_CHAT_ENABLED=true in your .env file")
 
@@ -2467,8 +2557,8 @@ def dm_disable():
     Note: This sets the environment variable for the current process.
     For persistent changes, update DM_CHAT_ENABLED in your .env file.
     """
-    import os
     os.environ["DM_CHAT_ENABLED"] = "false"
+    _dm_cfg['enabled'] = False
     click.echo("✓ DM chat feature disabled (for this session)")
     click.echo("  Messages will still be stored but AI responses are paused")
     click.echo("  To make this permanent, set DM_CHAT_ENABLED=false in your .env file")
@@ -2487,9 +2577,8 @@ def dm_purge(db_path, phone, purge_all):
     Use --all to purge ALL DM messages (dangerous!).
     """
     from datetime import datetime, timedelta
-    import os
 
-    db_repo = DatabaseRepository(db_path)
+    db_repo = _repo(db_path)
 
     if phone:
         # Purge specific phone number
@@ -2505,7 +2594,7 @@ def dm_purge(db_path, phone, purge_all):
 
     else:
         # Purge expired based on retention
-        retention_hours = int(os.getenv("DM_RETENTION_HOURS", "48"))
+        retention_hours = _dm_retention_hours()
         cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
         count = db_repo.purge_expired_dm_messages(before=cutoff)
         click.echo(f"✓ Purged {count} DM messages older than {retention_hours} hours")
@@ -0,0 +1,214 @@
+"""Database engine factory - Privacy Summarizer.
+
+Builds the SQLAlchemy engine (SQLCipher when available, plain SQLite
+otherwise) and applies the per-connection PRAGMA tuning block.
+"""
+
+import hashlib
+import logging
+import os
+from typing import Optional, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Valid values for the SQLITE_SYNCHRONOUS toggle. NORMAL is safe under WAL
+# (a power loss can drop the last commits but never corrupts the database)
+# and avoids an fsync on every commit.
+SQLITE_SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+# Connection pool sizing for file databases. Opening a SQLCipher connection
+# runs the key derivation, so connections are kept and reused across threads
+# (the API's worker threads, the scheduler and the realtime listener).
+POOL_SIZE = 5
+POOL_MAX_OVERFLOW = 10
+
+# SQLCipher 4 default key derivation: PBKDF2-HMAC-SHA512 over the passphrase,
+# salted with the first 16 bytes of the database file, giving a 32-byte key.
+SQLCIPHER_KDF_ITERATIONS = 256000
+SQLCIPHER_SALT_SIZE = 16
+SQLCIPHER_KEY_SIZE = 32
+
+
+def read_sqlcipher_salt(db_path: str) -> Optional[bytes]:
+    """Read the KDF salt from the head of an existing SQLCipher database.
+
+    Args:
+        db_path: Path to the database file
+
+    Returns:
+        The 16-byte salt, or None if the file doesn't exist or is too short
+    """
+    try:
+        with open(db_path, 'rb') as f:
+            salt = f.read(SQLCIPHER_SALT_SIZE)
+    except OSError:
+        return None
+    return salt if len(salt) == SQLCIPHER_SALT_SIZE else None
+
+
+def derive_raw_key(passphrase: str, salt: bytes) -> str:
+    """Derive the key SQLCipher would derive from a passphrase, as hex.
+
+    Passing the result as a raw key (PRAGMA key = "x'...'") opens the same
+    database without SQLCipher re-running the KDF on every connection.
+
+    Args:
+        passphrase: Encryption passphrase
+        salt: Salt read from the database file
+
+    Returns:
+        64-character hex string
+    """
+    return hashlib.pbkdf2_hmac(
+        'sha512', passphrase.encode('utf-8'), salt, SQLCIPHER_KDF_ITERATIONS, SQLCIPHER_KEY_SIZE
+    ).hex()
+
+
+def init_engine(db_path: str, encryption_key: str) -> Tuple[Engine, bool]:
+    """Create the database engine with SQLCipher encryption if available.
+
+    Reads SQLITE_SYNCHRONOUS from the environment (default NORMAL).
+
+    Args:
+        db_path: Path to SQLite database file
+        encryption_key: Encryption key passed to SQLCipher's PRAGMA key
+
+    Returns:
+        Tuple of (engine, True if SQLCipher encryption is active)
+
+    Raises:
+        ValueError: If SQLITE_SYNCHRONOUS is not a valid mode
+    """
+    synchronous = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+    if synchronous not in SQLITE_SYNCHRONOUS_MODES:
+        raise ValueError(
+            f"SQLITE_SYNCHRONOUS must be one of {', '.join(SQLITE_SYNCHRONOUS_MODES)}, "
+            f"got '{synchronous}'"
+        )
+
+    # In-memory databases keep SQLAlchemy's default pool: each new connection
+    # would be a separate, empty database.
+    if db_path == ':memory:':
+        pool_args = {}
+    else:
+        pool_args = {
+            'poolclass': QueuePool,
+            'pool_size': POOL_SIZE,
+            'max_overflow': POOL_MAX_OVERFLOW,
+        }
+
+    # Try to use SQLCipher for encryption if available
+    try:
+        import pysqlcipher3.dbapi2 as sqlcipher
+
+        # Create a wrapper class to handle create_function compatibility
+        # pysqlcipher3 doesn't support the 'deterministic' kwarg that SQLAlchemy uses
+        class ConnectionWrapper:
+            """Wrapper around pysqlcipher3 connection to handle API differences."""
+
+            def __init__(self, conn):
+                self._conn = conn
+
+            def create_function(self, name, num_params, func, deterministic=False):
+                # Ignore deterministic parameter - pysqlcipher3 doesn't support it
+                return self._conn.create_function(name, num_params, func)
+
+            def __getattr__(self, name):
+                return getattr(self._conn, name)
+
+        # Raw key derived once per process; None until the database file exists
+        # (SQLCipher picks the salt when it creates the file), False if unusable
+        raw_key = {'hex': None}
+
+        # PRAGMA arguments can't be bound parameters and pysqlcipher3 has no
+        # key() call, so the quoted statement is built once, not per connect.
+        # SQLCipher PRAGMA key requires the key in quotes, so we escape any quotes in the key
+        escaped_key = encryption_key.replace("'", "''")
+        passphrase_pragma = f"PRAGMA key = '{escaped_key}'"
+
+        def connect_with_passphrase():
+            conn = sqlcipher.connect(db_path, check_same_thread=False)
+            cursor = conn.cursor()
+            cursor.execute(passphrase_pragma)
+            cursor.close()
+            return conn
+
+        def connection_creator():
+            if raw_key['hex'] is None:
+                salt = read_sqlcipher_salt(db_path)
+                if salt is None:
+                    return ConnectionWrapper(connect_with_passphrase())
+                raw_key['hex'] = derive_raw_key(encryption_key, salt)
+            if raw_key['hex'] is False:
+                return ConnectionWrapper(connect_with_passphrase())
+
+            conn = sqlcipher.connect(db_path, check_same_thread=False)
+            try:
+                cursor = conn.cursor()
+                cursor.execute(f"PRAGMA key = \"x'{raw_key['hex']}'\"")
+                # The key is only checked on first read
+                cursor.execute("SELECT count(*) FROM sqlite_master")
+                cursor.close()
+            except sqlcipher.DatabaseError:
+                # Database uses non-default KDF settings; keep using the passphrase
+                logger.warning("SQLCipher raw key rejected, falling back to passphrase key derivation")
+                raw_key['hex'] = False
+                conn.close()
+                return ConnectionWrapper(connect_with_passphrase())
+            return ConnectionWrapper(conn)
+
+        engine = create_engine(
+            "sqlite://",  # URL is ignored when using creator
+            creator=connection_creator,
+            echo=False,
+            **pool_args
+        )
+        use_sqlcipher = True
+    except ImportError:
+        # Fall back to regular SQLite (for development/testing)
+        # In production, this should fail to ensure encryption
+        engine = create_engine(
+            f"sqlite:///{db_path}",
+            echo=False,
+            connect_args={'check_same_thread': False},
+            **pool_args
+        )
+        use_sqlcipher = False
+        print("WARNING: SQLCipher not available. Database is NOT encrypted!")
+        print("Install pysqlcipher3 for encryption: pip install pysqlcipher3")
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # Runs after the SQLCipher creator has issued PRAGMA key.
+        # foreign_keys stays off: messages are stored for groups that may not
+        # have been synced into the groups table yet.
+        cursor = dbapi_connection.cursor()
+        try:
+            if use_sqlcipher:
+                # Skip zeroing freed memory on every page operation
+                cursor.execute("PRAGMA cipher_memory_security=OFF")
+            cursor.execute("PRAGMA journal_mode=WAL")  # Readers don't block the writer
+            cursor.execute(f"PRAGMA synchronous={synchronous}")
+            cursor.execute("PRAGMA busy_timeout=5000")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.execute("PRAGMA cache_size=-131072")  # 128 MiB of decrypted pages
+            cursor.execute("PRAGMA mmap_size=268435456")  # 256 MiB; SQLCipher ignores it
+        finally:
+            cursor.close()
+
+    @event.listens_for(engine, "close")
+    def optimize_on_close(dbapi_connection, connection_record):
+        # Refresh planner statistics for tables this connection queried heavily;
+        # usually a no-op, and never worth failing a close over
+        try:
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA optimize")
+            cursor.close()
+        except Exception:
+            pass
+
+    return engine, use_sqlcipher
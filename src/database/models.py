@@ -1,23 +1,136 @@
 """Database models for Privacy Summarizer."""
 
+import hashlib
+import uuid
 from datetime import datetime
+from typing import Optional, Tuple
 from sqlalchemy import (
-    Column,
     Integer,
+    SmallInteger,
     BigInteger,
+    Computed,
     String,
     Text,
     DateTime,
     Boolean,
     ForeignKey,
     Index,
+    text,
     JSON,
     UniqueConstraint,
 )
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
-Base = declarative_base()
+from ..utils.message_utils import anonymize_group_id
+
+# SQL expression for Message.received_at_hour: hours since the Unix epoch.
+# received_at is stored as a naive UTC "YYYY-MM-DD HH:MM:SS.ffffff" string.
+RECEIVED_AT_HOUR_SQL = "CAST(strftime('%s', received_at) AS INTEGER) / 3600"
+
+# Server-side insert timestamp for high-volume tables, in the same naive UTC
+# format SQLAlchemy binds (SQLite's %f is "SS.SSS", padded to microseconds).
+UTC_NOW_SQL = "(strftime('%Y-%m-%d %H:%M:%f000', 'now'))"
+
+
+class CompactUUID(TypeDecorator):
+    """String column that stores canonical UUIDs as 16 raw bytes.
+
+    Signal identifiers are usually lowercase UUIDs but can fall back to phone
+    numbers, so anything that is not a canonical UUID string is stored as-is.
+    SQLite's dynamic typing lets both forms share the column, and the
+    conversion is lossless in both directions.
+    """
+
+    impl = String(255)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, str) and len(value) == 36:
+            try:
+                parsed = uuid.UUID(value)
+            except ValueError:
+                return value
+            if str(parsed) == value:
+                return parsed.bytes
+        return value
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, bytes):
+            return str(uuid.UUID(bytes=value))
+        return value
+
+
+class SmallIntEnum(TypeDecorator):
+    """Fixed set of string values stored as their position in a SmallInteger.
+
+    Callers keep reading and writing the strings; the database stores and
+    compares small integers.
+    """
+
+    impl = SmallInteger
+    cache_ok = True
+
+    def __init__(self, values: Tuple[str, ...]):
+        # Taken as one named argument so SQLAlchemy includes it in the cache key;
+        # types with different values must never share a compiled statement
+        super().__init__()
+        self.values = tuple(values)
+        self._codes = {value: code for code, value in enumerate(values)}
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return self._codes[value]
+        except KeyError:
+            raise ValueError(f"Invalid value {value!r}, expected one of {', '.join(self.values)}")
+
+    def process_literal_param(self, value, dialect):
+        return str(self.process_bind_param(value, dialect))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # Tables created before the switch keep TEXT affinity and return '0', '1', ...
+        return self.values[int(value)]
+
+
+# Stored codes are list positions: only ever append new values
+RUN_STATUSES = SmallIntEnum(("pending", "completed", "failed"))
+DM_ROLES = SmallIntEnum(("user", "assistant"))
+RETENTION_SOURCES = SmallIntEnum(("signal", "command"))
+POWER_MODES = SmallIntEnum(("admins", "everyone"))
+
+
+def message_identity_hash(signal_timestamp: int, sender_uuid: str, group_id: str) -> int:
+    """Hash a message's (timestamp, sender, group) identity to a signed 64-bit int.
+
+    Args:
+        signal_timestamp: Signal's timestamp_ms
+        sender_uuid: Sender's UUID (or phone number fallback)
+        group_id: Signal group ID
+
+    Returns:
+        Value for Message.identity_hash
+    """
+    digest = hashlib.blake2b(
+        f"{signal_timestamp}:{sender_uuid}:{group_id}".encode(), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def _identity_hash_default(context) -> int:
+    params = context.get_current_parameters()
+    return message_identity_hash(params['signal_timestamp'], params['sender_uuid'], params['group_id'])
+
+
+def _group_hash_default(context) -> str:
+    return anonymize_group_id(context.get_current_parameters()['group_id'])
+
+
+class Base(DeclarativeBase):
+    """Declarative base for all Privacy Summarizer models."""
 
 
 class Group(Base):
@@ -25,15 +138,17 @@ class Group(Base):
 
     __tablename__ = "groups"
 
-    id = Column(Integer, primary_key=True)
-    group_id = Column(String(255), unique=True, nullable=False, index=True)
-    name = Column(String(255), nullable=False)
-    description = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    group_id: Mapped[str] = mapped_column(String(255), unique=True, nullable=False, index=True)
+    name: Mapped[str] = mapped_column(String(255), nullable=False)
+    description: Mapped[Optional[str]] = mapped_column(Text)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Display hash ("#A3F2") for lookups by hash; not unique, 4 hex digits can collide
+    group_hash: Mapped[Optional[str]] = mapped_column(String(5), index=True, default=_group_hash_default)
 
     # Relationships
-    messages = relationship("Message", back_populates="group", cascade="all, delete-orphan")
+    messages: Mapped[list["Message"]] = relationship(back_populates="group", cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<Group(id={self.group_id}, name={self.name})>"
@@ -48,22 +163,36 @@ class Message(Base):
 
     __tablename__ = "messages"
 
-    id = Column(Integer, primary_key=True)
-    signal_timestamp = Column(BigInteger, nullable=False)  # Signal's timestamp_ms
-    sender_uuid = Column(String(255), nullable=False)  # For deduplication only, not displayed
-    group_id = Column(String(255), ForeignKey("groups.group_id"), nullable=False, index=True)
-    content = Column(Text, nullable=True)  # Encrypted via SQLCipher
-    received_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    signal_timestamp: Mapped[int] = mapped_column(BigInteger, nullable=False)  # Signal's timestamp_ms
+    sender_uuid: Mapped[str] = mapped_column(CompactUUID, nullable=False)  # For deduplication only, not displayed
+    group_id: Mapped[str] = mapped_column(String(255), ForeignKey("groups.group_id"), nullable=False)  # Indexed via idx_message_group_*
+    content: Mapped[Optional[str]] = mapped_column(Text, nullable=True, deferred=True)  # Encrypted via SQLCipher; load with undefer()
+    received_at: Mapped[datetime] = mapped_column(DateTime, server_default=text(UTC_NOW_SQL), nullable=False)
+    # Integer hour bin derived from received_at (virtual, computed by SQLite on read)
+    # so retention purges range-scan integers instead of comparing ISO strings
+    received_at_hour: Mapped[Optional[int]] = mapped_column(
+        Integer, Computed(RECEIVED_AT_HOUR_SQL, persisted=False)
+    )
+    # 8-byte dedup key over (signal_timestamp, sender_uuid, group_id), filled in on insert
+    identity_hash: Mapped[int] = mapped_column(BigInteger, nullable=False, default=_identity_hash_default)
 
     # Relationships
-    group = relationship("Group", back_populates="messages")
-    reactions = relationship("Reaction", back_populates="message", cascade="all, delete-orphan")
+    group: Mapped["Group"] = relationship(back_populates="messages")
+    # lazy="raise": load explicitly with selectinload() so N+1 access fails loudly
+    reactions: Mapped[list["Reaction"]] = relationship(
+        back_populates="message", cascade="all, delete-orphan", lazy="raise"
+    )
 
     __table_args__ = (
-        UniqueConstraint('signal_timestamp', 'sender_uuid', 'group_id', name='uq_message_identity'),
+        UniqueConstraint('identity_hash', name='uq_message_identity'),
         Index('idx_message_group_timestamp', 'group_id', 'signal_timestamp'),
-        Index('idx_message_received_at', 'received_at'),
+        Index('idx_message_group_received_hour', 'group_id', 'received_at_hour', 'received_at'),
+        # Opt-out deletes every message a sender posted in a group
+        Index('idx_message_group_sender', 'group_id', 'sender_uuid'),
     )
+    # Read the server-stamped received_at back via RETURNING on insert
+    __mapper_args__ = {"eager_defaults": True}
 
     def __repr__(self):
         return f"<Message(id={self.id}, group={self.group_id}, timestamp={self.signal_timestamp})>"
@@ -78,14 +207,14 @@ class Reaction(Base):
 
     __tablename__ = "reactions"
 
-    id = Column(Integer, primary_key=True)
-    message_id = Column(Integer, ForeignKey("messages.id", ondelete="CASCADE"), nullable=False, index=True)
-    emoji = Column(String(50), nullable=False)  # The reaction emoji
-    reactor_uuid = Column(String(255), nullable=False)  # For deduplication only
-    timestamp = Column(BigInteger, nullable=False)  # Signal's timestamp_ms
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    message_id: Mapped[int] = mapped_column(Integer, ForeignKey("messages.id", ondelete="CASCADE"), nullable=False)  # Indexed via uq_reaction_identity
+    emoji: Mapped[str] = mapped_column(String(50), nullable=False)  # The reaction emoji
+    reactor_uuid: Mapped[str] = mapped_column(CompactUUID, nullable=False)  # For deduplication only
+    timestamp: Mapped[int] = mapped_column(BigInteger, nullable=False)  # Signal's timestamp_ms
 
     # Relationships
-    message = relationship("Message", back_populates="reactions")
+    message: Mapped["Message"] = relationship(back_populates="reactions")
 
     __table_args__ = (
         UniqueConstraint('message_id', 'reactor_uuid', name='uq_reaction_identity'),
@@ -100,29 +229,29 @@ class ScheduledSummary(Base):
 
     __tablename__ = "scheduled_summaries"
 
-    id = Column(Integer, primary_key=True)
-    name = Column(String(255), nullable=False)
-    source_group_id = Column(Integer, ForeignKey("groups.id"), nullable=False, index=True)
-    target_group_id = Column(Integer, ForeignKey("groups.id"), nullable=False, index=True)
-    schedule_times = Column(JSON, nullable=False)  # Array of time strings: ["08:00", "20:00"]
-    timezone = Column(String(50), default="UTC", nullable=False)  # IANA timezone (e.g., "America/Chicago")
-    summary_period_hours = Column(Integer, default=24)  # How many hours to look back for summary
-    schedule_type = Column(String(20), default="daily", nullable=False)  # "daily" or "weekly"
-    schedule_day_of_week = Column(Integer)  # 0-6 for weekly schedules (0=Monday, 6=Sunday), NULL for daily
-    retention_hours = Column(Integer, default=48, nullable=False)  # Per-schedule message retention period
-    detail_mode = Column(Boolean, default=True, nullable=False)  # True = detailed (default), False = simple
-    enabled = Column(Boolean, default=True, nullable=False)
-    last_run = Column(DateTime)  # Last execution timestamp
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String(255), nullable=False)
+    source_group_id: Mapped[int] = mapped_column(Integer, ForeignKey("groups.id"), nullable=False, index=True)
+    target_group_id: Mapped[int] = mapped_column(Integer, ForeignKey("groups.id"), nullable=False, index=True)
+    schedule_times: Mapped[list] = mapped_column(JSON, nullable=False)  # Array of time strings: ["08:00", "20:00"]
+    timezone: Mapped[str] = mapped_column(String(50), default="UTC", nullable=False)  # IANA timezone (e.g., "America/Chicago")
+    summary_period_hours: Mapped[Optional[int]] = mapped_column(Integer, default=24)  # How many hours to look back for summary
+    schedule_type: Mapped[str] = mapped_column(String(20), default="daily", nullable=False)  # "daily" or "weekly"
+    schedule_day_of_week: Mapped[Optional[int]] = mapped_column(Integer)  # 0-6 for weekly schedules (0=Monday, 6=Sunday), NULL for daily
+    retention_hours: Mapped[int] = mapped_column(Integer, default=48, nullable=False)  # Per-schedule message retention period
+    detail_mode: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)  # True = detailed (default), False = simple
+    enabled: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
+    last_run: Mapped[Optional[datetime]] = mapped_column(DateTime)  # Last execution timestamp
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     # Relationships
-    source_group = relationship("Group", foreign_keys=[source_group_id])
-    target_group = relationship("Group", foreign_keys=[target_group_id])
-    summary_runs = relationship("SummaryRun", back_populates="schedule", cascade="all, delete-orphan")
+    source_group: Mapped["Group"] = relationship(foreign_keys=[source_group_id])
+    target_group: Mapped["Group"] = relationship(foreign_keys=[target_group_id])
+    summary_runs: Mapped[list["SummaryRun"]] = relationship(back_populates="schedule", cascade="all, delete-orphan")
 
     __table_args__ = (
-        Index("idx_enabled_schedules", "enabled"),
+        Index("idx_enabled_schedules", "enabled", sqlite_where=text("enabled = 1")),
     )
 
     def __repr__(self):
@@ -138,22 +267,26 @@ class SummaryRun(Base):
 
     __tablename__ = "summary_runs"
 
-    id = Column(Integer, primary_key=True)
-    schedule_id = Column(Integer, ForeignKey("scheduled_summaries.id", ondelete="CASCADE"), nullable=False, index=True)
-    started_at = Column(DateTime, nullable=False, default=datetime.utcnow)
-    completed_at = Column(DateTime, nullable=True)
-    message_count = Column(Integer, default=0)  # Number of messages summarized
-    oldest_message_time = Column(DateTime, nullable=True)  # Time window start
-    newest_message_time = Column(DateTime, nullable=True)  # Time window end
-    status = Column(String(20), default="pending", nullable=False)  # pending, completed, failed
-    error_message = Column(Text, nullable=True)  # Error details if failed
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    schedule_id: Mapped[int] = mapped_column(Integer, ForeignKey("scheduled_summaries.id", ondelete="CASCADE"), nullable=False, index=True)
+    started_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    completed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    message_count: Mapped[Optional[int]] = mapped_column(Integer, default=0)  # Number of messages summarized
+    oldest_message_time: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # Time window start
+    newest_message_time: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # Time window end
+    status: Mapped[str] = mapped_column(RUN_STATUSES, default="pending", nullable=False)  # pending, completed, failed
+    error_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # Error details if failed
 
     # Relationships
-    schedule = relationship("ScheduledSummary", back_populates="summary_runs")
+    schedule: Mapped["ScheduledSummary"] = relationship(back_populates="summary_runs")
 
     __table_args__ = (
-        Index('idx_summary_run_schedule_started', 'schedule_id', 'started_at'),
-        Index('idx_summary_run_status', 'status'),
+        # Covering index for "latest run per schedule": SQLite has no INCLUDE,
+        # so status/message_count ride along as trailing keys and the lookup
+        # never touches the table. started_at DESC is a backwards btree scan.
+        Index('idx_summary_run_cover', 'schedule_id', 'started_at', 'status', 'message_count'),
+        # Only pending runs are ever looked up by status (0 = "pending")
+        Index('idx_summary_run_status_pending', 'status', sqlite_where=text('status = 0')),
     )
 
     def __repr__(self):
@@ -169,17 +302,18 @@ class DMConversation(Base):
 
     __tablename__ = "dm_conversations"
 
-    id = Column(Integer, primary_key=True)
-    user_id = Column(String(100), nullable=False, index=True)  # User's Signal UUID or phone number
-    role = Column(String(20), nullable=False)  # "user" or "assistant"
-    content = Column(Text, nullable=False)  # Message content (encrypted via SQLCipher)
-    signal_timestamp = Column(BigInteger, nullable=True)  # Original Signal timestamp (for user messages)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[str] = mapped_column(String(100), nullable=False)  # User's Signal UUID or phone number; indexed via idx_dm_user_created
+    role: Mapped[str] = mapped_column(DM_ROLES, nullable=False)  # "user" or "assistant"
+    content: Mapped[str] = mapped_column(Text, nullable=False, deferred=True)  # Message content (encrypted via SQLCipher); load with undefer()
+    signal_timestamp: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)  # Original Signal timestamp (for user messages)
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=text(UTC_NOW_SQL), nullable=False)
 
     __table_args__ = (
         Index('idx_dm_user_created', 'user_id', 'created_at'),
-        Index('idx_dm_created_at', 'created_at'),
     )
+    # Read the server-stamped created_at back via RETURNING on insert
+    __mapper_args__ = {"eager_defaults": True}
 
     def __repr__(self):
         return f"<DMConversation(id={self.id}, user={self.user_id[:8]}..., role={self.role})>"
@@ -193,11 +327,13 @@ class DMSettings(Base):
 
     __tablename__ = "dm_settings"
 
-    id = Column(Integer, primary_key=True)
-    user_id = Column(String(100), nullable=False, unique=True, index=True)  # User's Signal UUID or phone number
-    retention_hours = Column(Integer, default=48, nullable=False)  # User's retention preference
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    user_id: Mapped[str] = mapped_column(String(100), primary_key=True)  # User's Signal UUID or phone number
+    retention_hours: Mapped[int] = mapped_column(Integer, default=48, nullable=False)  # User's retention preference
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    # Keyed lookup table: clustering rows on the natural key skips the rowid hop
+    __table_args__ = {'sqlite_with_rowid': False}
 
     def __repr__(self):
         return f"<DMSettings(user={self.user_id[:8]}..., retention={self.retention_hours}h)>"
@@ -224,14 +360,15 @@ class GroupSettings(Base):
 
     __tablename__ = "group_settings"
 
-    id = Column(Integer, primary_key=True)
-    group_id = Column(String(255), nullable=False, unique=True, index=True)  # Signal group ID
-    retention_hours = Column(Integer, default=48, nullable=False)  # Retention preference in hours
-    source = Column(String(20), default="signal", nullable=False)  # "signal" or "command"
-    power_mode = Column(String(20), default="admins", nullable=False)  # "admins" or "everyone"
-    purge_on_summary = Column(Boolean, default=True, nullable=False)  # True = purge after !summary
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    group_id: Mapped[str] = mapped_column(String(255), primary_key=True)  # Signal group ID
+    retention_hours: Mapped[int] = mapped_column(Integer, default=48, nullable=False)  # Retention preference in hours
+    source: Mapped[str] = mapped_column(RETENTION_SOURCES, default="signal", nullable=False)  # "signal" or "command"
+    power_mode: Mapped[str] = mapped_column(POWER_MODES, default="admins", nullable=False)  # "admins" or "everyone"
+    purge_on_summary: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)  # True = purge after !summary
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    __table_args__ = {'sqlite_with_rowid': False}
 
     def __repr__(self):
         return f"<GroupSettings(group={self.group_id[:20]}..., retention={self.retention_hours}h, power={self.power_mode})>"
@@ -247,16 +384,14 @@ class UserOptOut(Base):
 
     __tablename__ = "user_opt_outs"
 
-    id = Column(Integer, primary_key=True)
-    group_id = Column(String(255), nullable=False, index=True)
-    sender_uuid = Column(String(255), nullable=False, index=True)
-    opted_out = Column(Boolean, default=True, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    group_id: Mapped[str] = mapped_column(String(255), primary_key=True)
+    sender_uuid: Mapped[str] = mapped_column(CompactUUID, primary_key=True)
+    opted_out: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
-    __table_args__ = (
-        UniqueConstraint('group_id', 'sender_uuid', name='uq_user_opt_out'),
-    )
+    # The clustered (group_id, sender_uuid) key serves every lookup; no secondary indexes
+    __table_args__ = {'sqlite_with_rowid': False}
 
     def __repr__(self):
         return f"<UserOptOut(group={self.group_id[:20]}..., user={self.sender_uuid[:8]}..., opted_out={self.opted_out})>"
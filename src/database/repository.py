@@ -1,13 +1,38 @@
 """Database repository for CRUD operations - Privacy Summarizer."""
 
 import os
-from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any, Tuple
-from sqlalchemy import create_engine, func, text
-from sqlalchemy.orm import sessionmaker, Session, joinedload
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import and_, delete, func, or_, select, text, update
+from sqlalchemy.orm import sessionmaker, Session, joinedload, undefer
 from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from .models import Base, Group, Message, Reaction, ScheduledSummary, SummaryRun, DMConversation, DMSettings, GroupSettings, UserOptOut
+from . import statements
+from .engine import init_engine
+from .models import RECEIVED_AT_HOUR_SQL, Base, CompactUUID, RUN_STATUSES, DM_ROLES, RETENTION_SOURCES, POWER_MODES, message_identity_hash, Group, Message, Reaction, ScheduledSummary, SummaryRun, DMConversation, DMSettings, GroupSettings, UserOptOut
+from ..utils.message_utils import anonymize_group_id
+
+# Rows per multi-row INSERT in store_messages_batch/write_batch
+MESSAGE_INSERT_CHUNK_SIZE = 500
+
+# Messages deleted (and committed) per chunk by the purge methods
+PURGE_CHUNK_SIZE = 1000
+
+# Rows per fetch when walking DM history backwards in get_dm_history_tail
+DM_HISTORY_CHUNK_SIZE = 128
+
+# In-process cache for per-message settings lookups (opt-outs, retention,
+# power mode). Setters invalidate their own entries; the TTL only bounds how
+# long a change made by another process can go unseen.
+SETTINGS_CACHE_TTL = 60.0
+SETTINGS_CACHE_MAX_ENTRIES = 10000
+
+# Bump whenever a migration is added to _run_migrations, so databases whose
+# schema_version is unchanged still run the new checks once.
+MIGRATIONS_REVISION = 5
 
 
 class DatabaseRepository:
@@ -44,58 +69,12 @@ class DatabaseRepository:
 
         self.encryption_key = encryption_key
 
-        # Try to use SQLCipher for encryption if available
-        try:
-            import pysqlcipher3.dbapi2 as sqlcipher
-
-            # Create a wrapper class to handle create_function compatibility
-            # pysqlcipher3 doesn't support the 'deterministic' kwarg that SQLAlchemy uses
-            class ConnectionWrapper:
-                """Wrapper around pysqlcipher3 connection to handle API differences."""
-
-                def __init__(self, conn):
-                    self._conn = conn
-
-                def create_function(self, name, num_params, func, deterministic=False):
-                    # Ignore deterministic parameter - pysqlcipher3 doesn't support it
-                    return self._conn.create_function(name, num_params, func)
-
-                def __getattr__(self, name):
-                    return getattr(self._conn, name)
-
-            # Connection creator that wraps connections
-            key = self.encryption_key
-
-            def connection_creator():
-                conn = sqlcipher.connect(db_path, check_same_thread=False)
-                # Set encryption key immediately using parameterized approach
-                # SQLCipher PRAGMA key requires the key in quotes, so we escape any quotes in the key
-                cursor = conn.cursor()
-                escaped_key = key.replace("'", "''")
-                cursor.execute(f"PRAGMA key = '{escaped_key}'")
-                cursor.close()
-                return ConnectionWrapper(conn)
-
-            self.engine = create_engine(
-                "sqlite://",  # URL is ignored when using creator
-                creator=connection_creator,
-                echo=False
-            )
-
-            self._use_sqlcipher = True
-        except ImportError:
-            # Fall back to regular SQLite (for development/testing)
-            # In production, this should fail to ensure encryption
-            self.engine = create_engine(
-                f"sqlite:///{db_path}",
-                echo=False,
-                connect_args={'check_same_thread': False}
-            )
-            self._use_sqlcipher = False
-            print("WARNING: SQLCipher not available. Database is NOT encrypted!")
-            print("Install pysqlcipher3 for encryption: pip install pysqlcipher3")
-
+        self.engine, self._use_sqlcipher = init_engine(db_path, encryption_key)
         self.Session = sessionmaker(bind=self.engine)
+        # key -> (expires_at, value); see _cached_setting
+        self._settings_cache: Dict[tuple, Tuple[float, Any]] = {}
+        self._settings_generation = 0
+        self._settings_lock = threading.Lock()
         self._create_tables()
         self._run_migrations()
 
@@ -104,16 +83,28 @@ class DatabaseRepository:
         Base.metadata.create_all(self.engine)
 
     def _run_migrations(self):
-        """Run any necessary database migrations."""
+        """Run any necessary database migrations.
+
+        Skipped entirely when the schema and migration code are unchanged
+        since the last run (see _migrations_current).
+        """
         import logging
         logger = logging.getLogger(__name__)
 
         with self.engine.connect() as conn:
+            if self._migrations_current(conn):
+                logger.debug("Schema unchanged since last migration run, skipping migrations")
+                return
+
+            # Read every table's columns once; migrations that change a table refresh its entry
+            schema = self._read_schema(conn)
+            # A failed table rebuild leaves the state unrecorded, so it is retried next start
+            rebuild_failed = False
+
             # Migration: Rename phone_number to user_id in dm_conversations
             try:
                 # Check if old column exists
-                result = conn.execute(text("PRAGMA table_info(dm_conversations)"))
-                columns = [row[1] for row in result.fetchall()]
+                columns = schema.get('dm_conversations', {})
 
                 if 'phone_number' in columns and 'user_id' not in columns:
                     logger.info("Running migration: dm_conversations phone_number -> user_id")
@@ -137,16 +128,15 @@ class DatabaseRepository:
                     conn.execute(text("DROP TABLE dm_conversations"))
                     conn.execute(text("ALTER TABLE dm_conversations_new RENAME TO dm_conversations"))
                     conn.execute(text("CREATE INDEX IF NOT EXISTS idx_dm_user_created ON dm_conversations(user_id, created_at)"))
-                    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_dm_created_at ON dm_conversations(created_at)"))
                     conn.commit()
+                    schema['dm_conversations'] = self._table_columns(conn, 'dm_conversations')
                     logger.info("Migration completed: dm_conversations")
             except Exception as e:
                 logger.debug(f"dm_conversations migration skipped or failed: {e}")
 
             # Migration: Rename phone_number to user_id in dm_settings
             try:
-                result = conn.execute(text("PRAGMA table_info(dm_settings)"))
-                columns = [row[1] for row in result.fetchall()]
+                columns = schema.get('dm_settings', {})
 
                 if 'phone_number' in columns and 'user_id' not in columns:
                     logger.info("Running migration: dm_settings phone_number -> user_id")
@@ -168,14 +158,14 @@ class DatabaseRepository:
                     conn.execute(text("ALTER TABLE dm_settings_new RENAME TO dm_settings"))
                     conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_dm_settings_user_id ON dm_settings(user_id)"))
                     conn.commit()
+                    schema['dm_settings'] = self._table_columns(conn, 'dm_settings')
                     logger.info("Migration completed: dm_settings")
             except Exception as e:
                 logger.debug(f"dm_settings migration skipped or failed: {e}")
 
             # Migration: Create group_settings table if it doesn't exist
             try:
-                result = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='group_settings'"))
-                if not result.fetchone():
+                if 'group_settings' not in schema:
                     logger.info("Creating group_settings table")
                     conn.execute(text("""
                         CREATE TABLE group_settings (
@@ -190,16 +180,14 @@ class DatabaseRepository:
                     """))
                     conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_group_settings_group_id ON group_settings(group_id)"))
                     conn.commit()
+                    schema['group_settings'] = self._table_columns(conn, 'group_settings')
                     logger.info("Created group_settings table")
             except Exception as e:
                 logger.debug(f"group_settings table creation skipped or failed: {e}")
 
             # Migration: Add power_mode column to group_settings if it doesn't exist
             try:
-                result = conn.execute(text("PRAGMA table_info(group_settings)"))
-                columns = [row[1] for row in result.fetchall()]
-
-                if 'power_mode' not in columns:
+                if 'power_mode' not in schema.get('group_settings', {}):
                     logger.info("Adding power_mode column to group_settings")
                     conn.execute(text("ALTER TABLE group_settings ADD COLUMN power_mode VARCHAR(20) DEFAULT 'admins' NOT NULL"))
                     conn.commit()
@@ -209,10 +197,7 @@ class DatabaseRepository:
 
             # Migration: Add detail_mode column to scheduled_summaries if it doesn't exist
             try:
-                result = conn.execute(text("PRAGMA table_info(scheduled_summaries)"))
-                columns = [row[1] for row in result.fetchall()]
-
-                if 'detail_mode' not in columns:
+                if 'detail_mode' not in schema.get('scheduled_summaries', {}):
                     logger.info("Adding detail_mode column to scheduled_summaries")
                     conn.execute(text("ALTER TABLE scheduled_summaries ADD COLUMN detail_mode BOOLEAN DEFAULT 1 NOT NULL"))
                     conn.commit()
@@ -222,10 +207,7 @@ class DatabaseRepository:
 
             # Migration: Add purge_on_summary column to group_settings if it doesn't exist
             try:
-                result = conn.execute(text("PRAGMA table_info(group_settings)"))
-                columns = [row[1] for row in result.fetchall()]
-
-                if 'purge_on_summary' not in columns:
+                if 'purge_on_summary' not in schema.get('group_settings', {}):
                     logger.info("Adding purge_on_summary column to group_settings")
                     conn.execute(text("ALTER TABLE group_settings ADD COLUMN purge_on_summary BOOLEAN DEFAULT 1 NOT NULL"))
                     conn.commit()
@@ -235,8 +217,7 @@ class DatabaseRepository:
 
             # Migration: Create user_opt_outs table if it doesn't exist
             try:
-                result = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='user_opt_outs'"))
-                if not result.fetchone():
+                if 'user_opt_outs' not in schema:
                     logger.info("Creating user_opt_outs table")
                     conn.execute(text("""
                         CREATE TABLE user_opt_outs (
@@ -252,34 +233,440 @@ class DatabaseRepository:
                     conn.execute(text("CREATE INDEX IF NOT EXISTS ix_user_opt_outs_group_id ON user_opt_outs(group_id)"))
                     conn.execute(text("CREATE INDEX IF NOT EXISTS ix_user_opt_outs_sender_uuid ON user_opt_outs(sender_uuid)"))
                     conn.commit()
+                    schema['user_opt_outs'] = self._table_columns(conn, 'user_opt_outs')
                     logger.info("Created user_opt_outs table")
             except Exception as e:
                 logger.debug(f"user_opt_outs table creation skipped or failed: {e}")
 
+            # Migration: Replace single-column time indexes with (group/user, time) composites
+            try:
+                result = conn.execute(text(
+                    "SELECT name FROM sqlite_master WHERE type='index' "
+                    "AND name IN ('idx_message_received_at', 'idx_dm_created_at')"
+                ))
+                if result.fetchall():
+                    logger.info("Replacing idx_message_received_at/idx_dm_created_at with composite indexes")
+                    conn.execute(text("DROP INDEX IF EXISTS idx_message_received_at"))
+                    conn.execute(text("DROP INDEX IF EXISTS idx_dm_created_at"))
+                    conn.commit()
+                    logger.info("Replaced message/DM time indexes")
+            except Exception as e:
+                logger.debug(f"composite time index migration skipped or failed: {e}")
+
+            # Migration: Add received_at_hour generated column and its composite index
+            try:
+                if 'received_at_hour' not in schema.get('messages', {}):
+                    logger.info("Adding received_at_hour column to messages")
+                    conn.execute(text(
+                        "ALTER TABLE messages ADD COLUMN received_at_hour INTEGER "
+                        f"GENERATED ALWAYS AS ({RECEIVED_AT_HOUR_SQL}) VIRTUAL"
+                    ))
+                    conn.execute(text("DROP INDEX IF EXISTS idx_message_group_received"))
+                    conn.execute(text(
+                        "CREATE INDEX IF NOT EXISTS idx_message_group_received_hour "
+                        "ON messages(group_id, received_at_hour, received_at)"
+                    ))
+                    conn.commit()
+                    schema['messages'] = self._table_columns(conn, 'messages')
+                    logger.info("Added received_at_hour column to messages")
+            except Exception as e:
+                logger.debug(f"received_at_hour column migration skipped or failed: {e}")
+
+            # Migration: Add group_hash column to groups and backfill it
+            try:
+                if 'group_hash' not in schema.get('groups', {}):
+                    logger.info("Adding group_hash column to groups")
+                    conn.execute(text("ALTER TABLE groups ADD COLUMN group_hash VARCHAR(5)"))
+                    rows = conn.execute(text("SELECT id, group_id FROM groups")).fetchall()
+                    if rows:
+                        conn.execute(
+                            text("UPDATE groups SET group_hash = :group_hash WHERE id = :id"),
+                            [{'id': row[0], 'group_hash': anonymize_group_id(row[1])} for row in rows]
+                        )
+                    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_groups_group_hash ON groups(group_hash)"))
+                    conn.commit()
+                    schema['groups'] = self._table_columns(conn, 'groups')
+                    logger.info(f"Added group_hash column to groups ({len(rows)} backfilled)")
+            except Exception as e:
+                logger.debug(f"group_hash column migration skipped or failed: {e}")
+
+            # Migration: Drop the unused scheduled_times table
+            try:
+                conn.execute(text("DROP TABLE IF EXISTS scheduled_times"))
+                conn.commit()
+            except Exception as e:
+                logger.debug(f"scheduled_times cleanup skipped or failed: {e}")
+
+            # Migration: Make idx_enabled_schedules partial
+            try:
+                result = conn.execute(text(
+                    "SELECT sql FROM sqlite_master WHERE type='index' AND name='idx_enabled_schedules'"
+                ))
+                row = result.fetchone()
+                if row and 'WHERE' not in (row[0] or '').upper():
+                    logger.info("Rebuilding idx_enabled_schedules as a partial index")
+                    conn.execute(text("DROP INDEX idx_enabled_schedules"))
+                    conn.execute(text("CREATE INDEX idx_enabled_schedules ON scheduled_summaries(enabled) WHERE enabled = 1"))
+                conn.commit()
+            except Exception as e:
+                logger.debug(f"partial index migration skipped or failed: {e}")
+
+            # Migration: Re-encode text UUIDs as 16-byte blobs for CompactUUID columns
+            try:
+                compact = CompactUUID()
+                for table, column in (
+                    ('messages', 'sender_uuid'),
+                    ('reactions', 'reactor_uuid'),
+                    ('user_opt_outs', 'sender_uuid'),
+                ):
+                    result = conn.execute(text(
+                        f"SELECT DISTINCT {column} FROM {table} WHERE typeof({column}) = 'text'"
+                    ))
+                    updates = [
+                        {'old': value, 'new': encoded}
+                        for (value,) in result.fetchall()
+                        if isinstance(encoded := compact.process_bind_param(value, None), bytes)
+                    ]
+                    if updates:
+                        logger.info(f"Compacting {len(updates)} UUIDs in {table}.{column}")
+                        conn.execute(text(
+                            f"UPDATE {table} SET {column} = :new WHERE {column} = :old"
+                        ), updates)
+                conn.commit()
+            except Exception as e:
+                logger.debug(f"UUID compaction migration skipped or failed: {e}")
+
+            # Migration: Rebuild settings/opt-out tables as WITHOUT ROWID on their natural keys
+            for model in (DMSettings, GroupSettings, UserOptOut):
+                table = model.__table__
+                try:
+                    columns = schema.get(table.name, {})
+
+                    if 'id' in columns:
+                        logger.info(f"Rebuilding {table.name} as WITHOUT ROWID")
+                        with self._rebuild_transaction(conn):
+                            result = conn.execute(text(
+                                "SELECT name FROM sqlite_master WHERE type='index' "
+                                "AND tbl_name=:table AND sql IS NOT NULL"
+                            ), {'table': table.name})
+                            for (index_name,) in result.fetchall():
+                                conn.execute(text(f"DROP INDEX {index_name}"))
+                            conn.execute(text(f"ALTER TABLE {table.name} RENAME TO {table.name}_old"))
+                            table.create(conn)
+                            copied = ", ".join(c.name for c in table.columns if c.name in columns)
+                            conn.execute(text(
+                                f"INSERT INTO {table.name} ({copied}) SELECT {copied} FROM {table.name}_old"
+                            ))
+                            conn.execute(text(f"DROP TABLE {table.name}_old"))
+                        schema[table.name] = self._table_columns(conn, table.name)
+                        logger.info(f"Rebuilt {table.name}")
+                except Exception as e:
+                    rebuild_failed = True
+                    logger.warning(f"{table.name} WITHOUT ROWID rebuild failed, will retry on next start: {e}")
+
+            # Migration: Drop opt-out indexes made redundant by the WITHOUT ROWID primary key
+            try:
+                conn.execute(text("DROP INDEX IF EXISTS idx_active_opt_outs"))
+                conn.execute(text("DROP INDEX IF EXISTS ix_user_opt_outs_sender_uuid"))
+                conn.commit()
+            except Exception as e:
+                logger.debug(f"opt-out index cleanup skipped or failed: {e}")
+
+            # Migration: Rebuild messages with identity_hash as the dedup key
+            try:
+                if 'identity_hash' not in schema.get('messages', {}):
+                    logger.info("Rebuilding messages with identity_hash")
+                    with self._rebuild_transaction(conn):
+                        result = conn.execute(text(
+                            "SELECT name FROM sqlite_master WHERE type='index' "
+                            "AND tbl_name='messages' AND sql IS NOT NULL"
+                        ))
+                        for (index_name,) in result.fetchall():
+                            conn.execute(text(f"DROP INDEX {index_name}"))
+                        # Keep reactions' foreign key pointing at "messages", not the renamed copy
+                        conn.execute(text("PRAGMA legacy_alter_table=ON"))
+                        conn.execute(text("ALTER TABLE messages RENAME TO messages_old"))
+                        conn.execute(text("PRAGMA legacy_alter_table=OFF"))
+                        Message.__table__.create(conn)
+
+                        compact = CompactUUID()
+                        result = conn.execute(text(
+                            "SELECT id, signal_timestamp, sender_uuid, group_id, content, received_at FROM messages_old"
+                        ))
+                        rows = [
+                            {
+                                'id': row[0], 'signal_timestamp': row[1], 'sender_uuid': row[2],
+                                'group_id': row[3], 'content': row[4], 'received_at': row[5],
+                                'identity_hash': message_identity_hash(
+                                    row[1], compact.process_result_value(row[2], None), row[3]
+                                )
+                            }
+                            for row in result.fetchall()
+                        ]
+                        if rows:
+                            conn.execute(text(
+                                "INSERT OR IGNORE INTO messages "
+                                "(id, signal_timestamp, sender_uuid, group_id, content, received_at, identity_hash) "
+                                "VALUES (:id, :signal_timestamp, :sender_uuid, :group_id, :content, :received_at, :identity_hash)"
+                            ), rows)
+                        conn.execute(text("DROP TABLE messages_old"))
+                    schema['messages'] = self._table_columns(conn, 'messages')
+                    logger.info("Rebuilt messages")
+            except Exception as e:
+                rebuild_failed = True
+                logger.warning(f"messages identity_hash rebuild failed, will retry on next start: {e}")
+
+            # Migration: Drop single-column indexes that are prefixes of composite ones
+            try:
+                conn.execute(text("DROP INDEX IF EXISTS ix_messages_group_id"))
+                conn.execute(text("DROP INDEX IF EXISTS ix_reactions_message_id"))
+                conn.execute(text("DROP INDEX IF EXISTS ix_dm_conversations_user_id"))
+                conn.commit()
+            except Exception as e:
+                logger.debug(f"redundant index cleanup skipped or failed: {e}")
+
+            try:
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS idx_message_group_sender ON messages(group_id, sender_uuid)"
+                ))
+                conn.commit()
+            except Exception as e:
+                logger.debug(f"messages group/sender index migration skipped or failed: {e}")
+
+            # Migration: Convert enum-like string columns to SmallIntEnum codes
+            for table, column, enum in (
+                ('summary_runs', 'status', RUN_STATUSES),
+                ('dm_conversations', 'role', DM_ROLES),
+                ('group_settings', 'source', RETENTION_SOURCES),
+                ('group_settings', 'power_mode', POWER_MODES),
+            ):
+                try:
+                    cases = " ".join(f"WHEN '{value}' THEN {code}" for code, value in enumerate(enum.values))
+                    names = ", ".join(f"'{value}'" for value in enum.values)
+                    result = conn.execute(text(
+                        f"UPDATE {table} SET {column} = CASE {column} {cases} END WHERE {column} IN ({names})"
+                    ))
+                    if result.rowcount:
+                        logger.info(f"Converted {result.rowcount} {table}.{column} values to integer codes")
+                    conn.commit()
+                except Exception as e:
+                    logger.debug(f"{table}.{column} enum conversion skipped or failed: {e}")
+
+            try:
+                conn.execute(text("DROP INDEX IF EXISTS idx_summary_run_status"))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS idx_summary_run_status_pending ON summary_runs(status) WHERE status = 0"
+                ))
+                conn.commit()
+            except Exception as e:
+                logger.debug(f"summary_runs status index migration skipped or failed: {e}")
+
+            try:
+                conn.execute(text("DROP INDEX IF EXISTS idx_summary_run_schedule_started"))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS idx_summary_run_cover "
+                    "ON summary_runs(schedule_id, started_at, status, message_count)"
+                ))
+                conn.commit()
+            except Exception as e:
+                logger.debug(f"summary_runs covering index migration skipped or failed: {e}")
+
+            # Migration: Rebuild append-heavy tables so SQLite stamps insert times
+            # (column defaults can't be altered in place)
+            for model, column in ((Message, 'received_at'), (DMConversation, 'created_at')):
+                table = model.__table__
+                try:
+                    # Generated (hidden) columns can't be inserted into, so leave them out
+                    defaults = {
+                        name: row[4] for name, row in schema.get(table.name, {}).items() if not row[6]
+                    }
+
+                    # Also replace legacy CURRENT_TIMESTAMP defaults, which drop sub-second precision
+                    if column in defaults and '%f' not in (defaults[column] or ''):
+                        logger.info(f"Rebuilding {table.name} with a server default on {column}")
+                        with self._rebuild_transaction(conn):
+                            result = conn.execute(text(
+                                "SELECT name FROM sqlite_master WHERE type='index' "
+                                "AND tbl_name=:table AND sql IS NOT NULL"
+                            ), {'table': table.name})
+                            for (index_name,) in result.fetchall():
+                                conn.execute(text(f"DROP INDEX {index_name}"))
+                            # Keep reactions' foreign key pointing at "messages", not the renamed copy
+                            conn.execute(text("PRAGMA legacy_alter_table=ON"))
+                            conn.execute(text(f"ALTER TABLE {table.name} RENAME TO {table.name}_old"))
+                            conn.execute(text("PRAGMA legacy_alter_table=OFF"))
+                            table.create(conn)
+                            copied = ", ".join(defaults)
+                            conn.execute(text(
+                                f"INSERT INTO {table.name} ({copied}) SELECT {copied} FROM {table.name}_old"
+                            ))
+                            conn.execute(text(f"DROP TABLE {table.name}_old"))
+                        schema[table.name] = self._table_columns(conn, table.name)
+                        logger.info(f"Rebuilt {table.name}")
+                except Exception as e:
+                    rebuild_failed = True
+                    logger.warning(f"{table.name} {column} default rebuild failed, will retry on next start: {e}")
+
+            # Refresh planner statistics now that indexes may have changed
+            conn.execute(text("PRAGMA optimize"))
+            if not rebuild_failed:
+                self._record_migration_state(conn)
+
+    @staticmethod
+    @contextmanager
+    def _rebuild_transaction(conn) -> Iterator[None]:
+        """Run a table rebuild (rename, create, copy, drop) as one transaction.
+
+        pysqlite only opens a transaction implicitly before DML, so without an
+        explicit BEGIN the DROP INDEX / ALTER TABLE / CREATE TABLE steps would
+        autocommit and a failed copy would strand the rows in the renamed table.
+
+        Args:
+            conn: Open connection with no pending changes
+        """
+        conn.commit()
+        conn.exec_driver_sql("BEGIN")
+        try:
+            yield
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def _read_schema(self, conn) -> Dict[str, Dict[str, Any]]:
+        """Read the columns of every table in the database.
+
+        Args:
+            conn: Open connection
+
+        Returns:
+            Dict mapping table name to _table_columns() for that table
+        """
+        tables = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'")).scalars().all()
+        return {table: self._table_columns(conn, table) for table in tables}
+
+    @staticmethod
+    def _table_columns(conn, table: str) -> Dict[str, Any]:
+        """Read a table's columns, including generated ones.
+
+        Args:
+            conn: Open connection
+            table: Table name
+
+        Returns:
+            Dict mapping column name to its PRAGMA table_xinfo row
+            (cid, name, type, notnull, dflt_value, pk, hidden)
+        """
+        return {row[1]: row for row in conn.execute(text(f"PRAGMA table_xinfo({table})")).fetchall()}
+
+    def _migrations_current(self, conn) -> bool:
+        """Check whether migrations already ran against this exact schema.
+
+        PRAGMA schema_version changes on every DDL statement, so a match with
+        the stored value (and MIGRATIONS_REVISION) means nothing has changed.
+
+        Args:
+            conn: Open connection
+
+        Returns:
+            True if the migration checks can be skipped
+        """
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS _migration_state ("
+            "id INTEGER PRIMARY KEY CHECK (id = 1), "
+            "schema_version INTEGER NOT NULL, "
+            "revision INTEGER NOT NULL, "
+            "applied_at DATETIME NOT NULL)"
+        ))
+        conn.commit()
+        schema_version = conn.execute(text("PRAGMA schema_version")).scalar()
+        stored = conn.execute(text(
+            "SELECT schema_version, revision FROM _migration_state WHERE id = 1"
+        )).first()
+        return stored is not None and tuple(stored) == (schema_version, MIGRATIONS_REVISION)
+
+    def _record_migration_state(self, conn) -> None:
+        """Store the post-migration schema_version so the next startup can skip checks."""
+        conn.execute(text(
+            "INSERT OR REPLACE INTO _migration_state (id, schema_version, revision, applied_at) "
+            "VALUES (1, :schema_version, :revision, :applied_at)"
+        ), {
+            'schema_version': conn.execute(text("PRAGMA schema_version")).scalar(),
+            'revision': MIGRATIONS_REVISION,
+            'applied_at': datetime.utcnow()
+        })
+        conn.commit()
+
     def get_session(self) -> Session:
         """Get a new database session."""
         return self.Session()
 
     # Group operations
     def create_group(self, group_id: str, name: str, description: str = None) -> Group:
-        """Create or update a group."""
-        with self.get_session() as session:
-            group = session.query(Group).filter_by(group_id=group_id).first()
-            if group:
-                group.name = name
-                group.description = description
-                group.updated_at = datetime.utcnow()
-            else:
-                group = Group(group_id=group_id, name=name, description=description)
-                session.add(group)
+        """Create or update a group.
+
+        A single INSERT ... ON CONFLICT DO UPDATE ... RETURNING, so metadata
+        refreshes cost one statement and can't race a concurrent insert.
+        """
+        now = datetime.utcnow()
+        with self.Session(expire_on_commit=False) as session:
+            group = session.scalars(
+                sqlite_insert(Group).values(
+                    group_id=group_id,
+                    name=name,
+                    description=description,
+                    created_at=now,
+                    updated_at=now
+                ).on_conflict_do_update(
+                    index_elements=[Group.group_id],
+                    set_={'name': name, 'description': description, 'updated_at': now}
+                ).returning(Group)
+            ).one()
             session.commit()
-            session.refresh(group)
             return group
 
+    def upsert_groups(self, groups: List[Dict[str, Any]]) -> int:
+        """Create or update many groups in a single transaction.
+
+        One executemany of the same upsert create_group issues, instead of a
+        statement and commit per group.
+
+        Args:
+            groups: List of dicts with keys: group_id, name, description
+
+        Returns:
+            Number of groups written
+        """
+        if not groups:
+            return 0
+
+        now = datetime.utcnow()
+        stmt = sqlite_insert(Group)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Group.group_id],
+            set_={
+                'name': stmt.excluded.name,
+                'description': stmt.excluded.description,
+                'updated_at': stmt.excluded.updated_at
+            }
+        )
+        with self.get_session() as session, session.begin():
+            session.execute(stmt, [
+                {
+                    'group_id': g['group_id'],
+                    'name': g['name'],
+                    'description': g.get('description'),
+                    'created_at': now,
+                    'updated_at': now
+                }
+                for g in groups
+            ])
+        return len(groups)
+
     def get_group_by_id(self, group_id: str) -> Optional[Group]:
         """Get a group by its Signal group ID."""
         with self.get_session() as session:
-            return session.query(Group).filter_by(group_id=group_id).first()
+            return session.execute(statements.group_by_id(group_id)).scalars().first()
 
     def get_all_groups(self) -> List[Group]:
         """Get all groups."""
@@ -319,7 +706,7 @@ class DatabaseRepository:
         Returns:
             The created ScheduledSummary object
         """
-        with self.get_session() as session:
+        with self.Session(expire_on_commit=False) as session:
             scheduled_summary = ScheduledSummary(
                 name=name,
                 source_group_id=source_group_id,
@@ -335,7 +722,6 @@ class DatabaseRepository:
             )
             session.add(scheduled_summary)
             session.commit()
-            session.refresh(scheduled_summary)
             return scheduled_summary
 
     def get_all_scheduled_summaries(self) -> List[ScheduledSummary]:
@@ -361,15 +747,7 @@ class DatabaseRepository:
             List of enabled ScheduledSummary objects
         """
         with self.get_session() as session:
-            return (
-                session.query(ScheduledSummary)
-                .filter(ScheduledSummary.enabled == True)
-                .options(
-                    joinedload(ScheduledSummary.source_group),
-                    joinedload(ScheduledSummary.target_group)
-                )
-                .all()
-            )
+            return session.execute(statements.enabled_schedules()).scalars().all()
 
     def get_scheduled_summary_by_id(self, schedule_id: int) -> Optional[ScheduledSummary]:
         """Get a scheduled summary by ID.
@@ -381,14 +759,13 @@ class DatabaseRepository:
             ScheduledSummary object or None if not found
         """
         with self.get_session() as session:
-            return (
-                session.query(ScheduledSummary)
-                .filter(ScheduledSummary.id == schedule_id)
-                .options(
+            return session.get(
+                ScheduledSummary,
+                schedule_id,
+                options=[
                     joinedload(ScheduledSummary.source_group),
                     joinedload(ScheduledSummary.target_group)
-                )
-                .first()
+                ]
             )
 
     def get_scheduled_summary_by_name(self, name: str) -> Optional[ScheduledSummary]:
@@ -425,10 +802,8 @@ class DatabaseRepository:
         Returns:
             Updated ScheduledSummary object or None if not found
         """
-        with self.get_session() as session:
-            scheduled_summary = session.query(ScheduledSummary).filter(
-                ScheduledSummary.id == schedule_id
-            ).first()
+        with self.Session(expire_on_commit=False) as session:
+            scheduled_summary = session.get(ScheduledSummary, schedule_id)
 
             if not scheduled_summary:
                 return None
@@ -440,7 +815,6 @@ class DatabaseRepository:
 
             scheduled_summary.updated_at = datetime.utcnow()
             session.commit()
-            session.refresh(scheduled_summary)
             return scheduled_summary
 
     def update_scheduled_summary_last_run(
@@ -455,13 +829,13 @@ class DatabaseRepository:
             last_run: Timestamp of the last execution
         """
         with self.get_session() as session:
-            scheduled_summary = session.query(ScheduledSummary).filter(
-                ScheduledSummary.id == schedule_id
-            ).first()
-
-            if scheduled_summary:
-                scheduled_summary.last_run = last_run
-                session.commit()
+            # Single UPDATE; no need to load the row first
+            session.execute(
+                update(ScheduledSummary)
+                .where(ScheduledSummary.id == schedule_id)
+                .values(last_run=last_run)
+            )
+            session.commit()
 
     def delete_scheduled_summary(self, schedule_id: int) -> bool:
         """Delete a scheduled summary.
@@ -473,14 +847,21 @@ class DatabaseRepository:
             True if deleted, False if not found
         """
         with self.get_session() as session:
-            scheduled_summary = session.query(ScheduledSummary).filter(
-                ScheduledSummary.id == schedule_id
-            ).first()
-
-            if not scheduled_summary:
+            deleted = session.execute(
+                delete(ScheduledSummary)
+                .where(ScheduledSummary.id == schedule_id)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not deleted:
                 return False
 
-            session.delete(scheduled_summary)
+            # foreign_keys is off, so ON DELETE CASCADE never fires; one DELETE
+            # instead of loading every run and deleting it row by row
+            session.execute(
+                delete(SummaryRun)
+                .where(SummaryRun.schedule_id == schedule_id)
+                .execution_options(synchronize_session=False)
+            )
             session.commit()
             return True
 
@@ -494,7 +875,8 @@ class DatabaseRepository:
     ) -> Tuple[Message, bool]:
         """Store a message, returning (message, is_new).
 
-        Uses upsert to handle duplicates gracefully.
+        A single INSERT ... ON CONFLICT DO NOTHING RETURNING statement; the
+        existing row is only read back when the insert hit a duplicate.
 
         Args:
             signal_timestamp: Signal's timestamp_ms
@@ -505,66 +887,163 @@ class DatabaseRepository:
         Returns:
             Tuple of (Message object, True if new / False if existing)
         """
-        with self.get_session() as session:
-            # Check if message already exists
-            existing = session.query(Message).filter(
-                Message.signal_timestamp == signal_timestamp,
-                Message.sender_uuid == sender_uuid,
-                Message.group_id == group_id
+        with self.Session(expire_on_commit=False) as session:
+            message = session.scalars(
+                self._insert_message_stmt().values(
+                    signal_timestamp=signal_timestamp,
+                    sender_uuid=sender_uuid,
+                    group_id=group_id,
+                    content=content
+                ).returning(Message).options(undefer(Message.content))
             ).first()
-
-            if existing:
-                return existing, False
-
-            # Create new message
-            message = Message(
-                signal_timestamp=signal_timestamp,
-                sender_uuid=sender_uuid,
-                group_id=group_id,
-                content=content
-            )
-            session.add(message)
             session.commit()
-            session.refresh(message)
-            return message, True
+            if message is not None:
+                return message, True
+
+            message = session.execute(statements.message_by_identity(
+                message_identity_hash(signal_timestamp, sender_uuid, group_id)
+            )).scalars().first()
+            return message, False
 
     def store_messages_batch(self, messages: List[Dict[str, Any]]) -> int:
         """Store multiple messages in batch, returning count of new messages.
 
+        All rows are written in a single transaction, as multi-row INSERTs of
+        up to MESSAGE_INSERT_CHUNK_SIZE rows.
+
         Args:
             messages: List of dicts with keys: signal_timestamp, sender_uuid, group_id, content
 
         Returns:
             Number of new messages stored (excludes duplicates)
         """
-        new_count = 0
-        with self.get_session() as session:
-            for msg_data in messages:
-                # Check for existing
-                existing = session.query(Message).filter(
-                    Message.signal_timestamp == msg_data['signal_timestamp'],
-                    Message.sender_uuid == msg_data['sender_uuid'],
-                    Message.group_id == msg_data['group_id']
-                ).first()
+        return self.write_batch(messages)[0]
+
+    def write_batch(
+        self,
+        messages: List[Dict[str, Any]],
+        reactions: List[Dict[str, Any]] = None
+    ) -> Tuple[int, int]:
+        """Write buffered messages and reactions in a single transaction.
 
-                if not existing:
-                    message = Message(
-                        signal_timestamp=msg_data['signal_timestamp'],
-                        sender_uuid=msg_data['sender_uuid'],
-                        group_id=msg_data['group_id'],
-                        content=msg_data.get('content')
-                    )
-                    session.add(message)
-                    new_count += 1
+        Messages are inserted first so reactions in the same batch can
+        reference them. Duplicate messages are skipped; a reaction from a
+        reactor who already reacted to the message replaces the old emoji
+        (an identical emoji is a no-op, keeping the original timestamp).
 
-            session.commit()
-        return new_count
+        Args:
+            messages: List of dicts with keys: signal_timestamp, sender_uuid, group_id, content
+            reactions: List of dicts with keys: message_id, emoji, reactor_uuid, timestamp
+
+        Returns:
+            Tuple of (new messages stored, reactions written)
+        """
+        reactions = reactions or []
+        if not messages and not reactions:
+            return 0, 0
+
+        with self.get_session() as session, session.begin():
+            # Take the write lock up front: a deferred BEGIN would upgrade
+            # mid-transaction and can fail with SQLITE_BUSY under concurrent readers
+            session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+            new_count = self._insert_new_messages(session, messages)
+
+            if reactions:
+                # Re-ingesting an unchanged reaction leaves its row untouched
+                # rather than rewriting it (and its index pages) in place
+                stmt = sqlite_insert(Reaction)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['message_id', 'reactor_uuid'],
+                    set_={'emoji': stmt.excluded.emoji, 'timestamp': stmt.excluded.timestamp},
+                    where=Reaction.emoji != stmt.excluded.emoji
+                )
+                session.execute(stmt, [
+                    {
+                        'message_id': r['message_id'],
+                        'emoji': r['emoji'],
+                        'reactor_uuid': r['reactor_uuid'],
+                        'timestamp': r['timestamp']
+                    }
+                    for r in reactions
+                ])
+
+        return new_count, len(reactions)
+
+    def _insert_new_messages(self, session: Session, messages: List[Dict[str, Any]]) -> int:
+        """Insert messages, letting uq_message_identity skip duplicates in-engine.
+
+        Args:
+            session: Session with an open transaction
+            messages: List of dicts with keys: signal_timestamp, sender_uuid, group_id, content
+
+        Returns:
+            Number of new messages inserted
+        """
+        if not messages:
+            return 0
+
+        rows = [
+            {
+                'signal_timestamp': msg_data['signal_timestamp'],
+                'sender_uuid': msg_data['sender_uuid'],
+                'group_id': msg_data['group_id'],
+                'content': msg_data.get('content'),
+                # Computed here: column defaults can't see per-row values in a multi-row VALUES
+                'identity_hash': message_identity_hash(
+                    msg_data['signal_timestamp'], msg_data['sender_uuid'], msg_data['group_id']
+                )
+            }
+            for msg_data in messages
+        ]
+        # Multi-row VALUES lists: one statement per chunk instead of one step per row,
+        # kept well under SQLite's bound-parameter limit
+        conn = session.connection()
+        inserted = 0
+        for start in range(0, len(rows), MESSAGE_INSERT_CHUNK_SIZE):
+            chunk = rows[start:start + MESSAGE_INSERT_CHUNK_SIZE]
+            inserted += conn.execute(self._insert_message_stmt().values(chunk)).rowcount
+        return inserted
+
+    @staticmethod
+    def _insert_message_stmt():
+        """INSERT ... ON CONFLICT DO NOTHING for messages, keyed on uq_message_identity.
+
+        Unless the rows supply it, identity_hash is filled in by the column
+        default from each row's (signal_timestamp, sender_uuid, group_id).
+        """
+        return sqlite_insert(Message).on_conflict_do_nothing(
+            index_elements=['identity_hash']
+        )
+
+    @staticmethod
+    def _window_ms(
+        since: Optional[datetime],
+        until: Optional[datetime],
+        since_ms: Optional[int],
+        until_ms: Optional[int]
+    ) -> Tuple[Optional[int], Optional[int]]:
+        """Resolve a message window to signal_timestamp milliseconds.
+
+        Explicit millisecond bounds win. Naive datetime bounds are UTC, as
+        everywhere else in the repository, not the host's local time.
+        """
+        if since_ms is None and since:
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            since_ms = int(since.timestamp() * 1000)
+        if until_ms is None and until:
+            if until.tzinfo is None:
+                until = until.replace(tzinfo=timezone.utc)
+            until_ms = int(until.timestamp() * 1000)
+        return since_ms, until_ms
 
     def get_messages_for_group(
         self,
         group_id: str,
         since: datetime = None,
-        until: datetime = None
+        until: datetime = None,
+        since_ms: Optional[int] = None,
+        until_ms: Optional[int] = None
     ) -> List[Message]:
         """Get messages for a group within optional time window.
 
@@ -572,29 +1051,49 @@ class DatabaseRepository:
             group_id: Signal group ID
             since: Start of time window (inclusive)
             until: End of time window (inclusive)
+            since_ms: Start of window in epoch milliseconds; preferred over since
+            until_ms: End of window in epoch milliseconds; preferred over until
 
         Returns:
             List of Message objects ordered by timestamp
         """
+        since_ms, until_ms = self._window_ms(since, until, since_ms, until_ms)
+
         with self.get_session() as session:
-            query = session.query(Message).filter(Message.group_id == group_id)
+            query = session.query(Message).options(
+                undefer(Message.content)
+            ).filter(Message.group_id == group_id)
 
-            if since:
-                # Convert datetime to milliseconds timestamp
-                since_ms = int(since.timestamp() * 1000)
+            if since_ms is not None:
                 query = query.filter(Message.signal_timestamp >= since_ms)
 
-            if until:
-                until_ms = int(until.timestamp() * 1000)
+            if until_ms is not None:
                 query = query.filter(Message.signal_timestamp <= until_ms)
 
             return query.order_by(Message.signal_timestamp.asc()).all()
 
+    def get_message_id_by_timestamp(self, group_id: str, signal_timestamp: int) -> Optional[int]:
+        """Find a group's message by its Signal timestamp (e.g. a reaction's target).
+
+        Args:
+            group_id: Signal group ID
+            signal_timestamp: Signal's timestamp_ms of the message
+
+        Returns:
+            Message ID, or None if the message isn't stored
+        """
+        with self.get_session() as session:
+            return session.execute(
+                statements.message_id_at(group_id, signal_timestamp)
+            ).scalar_one_or_none()
+
     def get_messages_with_reactions_for_group(
         self,
         group_id: str,
         since: datetime = None,
-        until: datetime = None
+        until: datetime = None,
+        since_ms: Optional[int] = None,
+        until_ms: Optional[int] = None
     ) -> List[Dict[str, Any]]:
         """Get messages for a group with their reaction data.
 
@@ -604,6 +1103,8 @@ class DatabaseRepository:
             group_id: Signal group ID
             since: Start of time window (inclusive)
             until: End of time window (inclusive)
+            since_ms: Start of window in epoch milliseconds; preferred over since
+            until_ms: End of window in epoch milliseconds; preferred over until
 
         Returns:
             List of dicts with:
@@ -611,37 +1112,23 @@ class DatabaseRepository:
             - reaction_count: int (total reactions)
             - emojis: list[str] (individual emojis, e.g., ["👍", "👍", "❤️"])
         """
-        with self.get_session() as session:
-            query = session.query(Message).filter(
-                Message.group_id == group_id
-            ).options(joinedload(Message.reactions))
-
-            if since:
-                since_ms = int(since.timestamp() * 1000)
-                query = query.filter(Message.signal_timestamp >= since_ms)
-
-            if until:
-                until_ms = int(until.timestamp() * 1000)
-                query = query.filter(Message.signal_timestamp <= until_ms)
+        since_ms, until_ms = self._window_ms(since, until, since_ms, until_ms)
 
-            messages = query.order_by(Message.signal_timestamp.asc()).all()
-
-            result = []
-            for msg in messages:
-                if not msg.content:
-                    continue
-
-                # Collect all reaction emojis for this message
-                emojis = [r.emoji for r in msg.reactions]
-
-                result.append({
-                    'content': msg.content,
-                    'sender_uuid': msg.sender_uuid,
-                    'reaction_count': len(emojis),
-                    'emojis': emojis
-                })
+        with self.get_session() as session:
+            rows = session.execute(
+                statements.messages_in_window(group_id, since_ms, until_ms)
+            ).all()
 
-            return result
+        # Build the dicts after the session has returned its connection to the pool
+        return [
+            {
+                'content': content,
+                'sender_uuid': sender_uuid,
+                'reaction_count': reaction_count,
+                'emojis': emojis.split(statements.EMOJI_SEPARATOR) if emojis else []
+            }
+            for content, sender_uuid, reaction_count, emojis in rows
+        ]
 
     def get_message_count_by_group(self) -> Dict[str, int]:
         """Get pending message counts per group.
@@ -650,36 +1137,101 @@ class DatabaseRepository:
             Dict mapping group_id to message count
         """
         with self.get_session() as session:
-            results = session.query(
-                Message.group_id,
-                func.count(Message.id).label('count')
-            ).group_by(Message.group_id).all()
-
-            return {row.group_id: row.count for row in results}
+            return dict(session.execute(
+                select(Message.group_id, func.count()).group_by(Message.group_id)
+            ).all())
 
     def get_pending_stats(self) -> Dict[str, Any]:
         """Get statistics about pending messages (for UI).
 
+        One grouped pass over the covering idx_message_group_received_hour
+        index; totals and the overall oldest/newest are derived per group.
+
         Returns:
             Dict with total_messages, messages_by_group, oldest_message, newest_message
         """
         with self.get_session() as session:
-            total = session.query(func.count(Message.id)).scalar() or 0
+            by_group = session.execute(
+                select(
+                    Message.group_id,
+                    func.count().label('count'),
+                    func.min(Message.received_at).label('oldest'),
+                    func.max(Message.received_at).label('newest')
+                ).group_by(Message.group_id)
+            ).all()
 
-            by_group = session.query(
-                Message.group_id,
-                func.count(Message.id).label('count')
-            ).group_by(Message.group_id).all()
+        return {
+            'total_messages': sum(row.count for row in by_group),
+            'messages_by_group': {row.group_id: row.count for row in by_group},
+            'oldest_message': min((row.oldest for row in by_group), default=None),
+            'newest_message': max((row.newest for row in by_group), default=None)
+        }
 
-            oldest = session.query(func.min(Message.received_at)).scalar()
-            newest = session.query(func.max(Message.received_at)).scalar()
+    def _delete_messages(self, session: Session, *criteria) -> int:
+        """Delete messages matching criteria in chunks, together with their reactions.
 
-            return {
-                'total_messages': total,
-                'messages_by_group': {row.group_id: row.count for row in by_group},
-                'oldest_message': oldest,
-                'newest_message': newest
-            }
+        See _delete_messages_by_group.
+
+        Args:
+            session: Session without an open transaction (committed per chunk)
+            *criteria: WHERE clauses on Message (none deletes every message)
+
+        Returns:
+            Number of messages deleted
+        """
+        return sum(self._delete_messages_by_group(session, *criteria).values())
+
+    def _delete_messages_by_group(self, session: Session, *criteria) -> Dict[str, int]:
+        """Delete messages matching criteria in chunks, counting deletions per group.
+
+        Each chunk of up to PURGE_CHUNK_SIZE messages is deleted with Core
+        DELETE statements and committed on its own, so a large purge holds
+        the write lock briefly and lets the realtime listener write between
+        chunks, and the WAL stays small. The session holds no loaded messages,
+        so the deletes skip synchronize_session's identity-map pass. SQLite
+        only honours ON DELETE CASCADE with PRAGMA foreign_keys enabled, which
+        this database does not use, so reactions are removed explicitly first.
+
+        Args:
+            session: Session without an open transaction (committed per chunk)
+            *criteria: WHERE clauses on Message (none deletes every message)
+
+        Returns:
+            Mapping of group ID to number of messages deleted
+        """
+        deleted: Dict[str, int] = {}
+        while True:
+            rows = session.execute(
+                select(Message.id, Message.group_id).where(*criteria).limit(PURGE_CHUNK_SIZE)
+            ).all()
+            if not rows:
+                break
+
+            ids = [row.id for row in rows]
+            session.execute(
+                delete(Reaction)
+                .where(Reaction.message_id.in_(ids))
+                .execution_options(synchronize_session=False)
+            )
+            session.execute(
+                delete(Message)
+                .where(Message.id.in_(ids))
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+            for row in rows:
+                deleted[row.group_id] = deleted.get(row.group_id, 0) + 1
+
+            if len(rows) < PURGE_CHUNK_SIZE:
+                break
+        return deleted
+
+    @staticmethod
+    def _epoch_hour(dt: datetime) -> int:
+        """Convert a naive UTC datetime to its received_at_hour bin."""
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp()) // 3600
 
     def purge_messages_for_group(self, group_id: str, before: datetime) -> int:
         """Delete messages for a group older than specified time.
@@ -692,13 +1244,44 @@ class DatabaseRepository:
             Number of messages deleted
         """
         with self.get_session() as session:
-            count = session.query(Message).filter(
+            # The hour bin bounds the index range; received_at keeps the cutoff exact
+            count = self._delete_messages(
+                session,
                 Message.group_id == group_id,
+                Message.received_at_hour <= self._epoch_hour(before),
                 Message.received_at < before
-            ).delete(synchronize_session=False)
+            )
             session.commit()
             return count
 
+    def purge_messages_for_groups(self, cutoffs: Dict[str, datetime]) -> Dict[str, int]:
+        """Delete expired messages for several groups in shared chunks.
+
+        All groups' ranges are combined into one OR'd WHERE clause, so a run
+        over many small groups still commits once per chunk rather than once
+        per group.
+
+        Args:
+            cutoffs: Mapping of Signal group ID to its retention cutoff
+                (messages with received_at before the cutoff are deleted)
+
+        Returns:
+            Mapping of group ID to number of messages deleted
+        """
+        if not cutoffs:
+            return {}
+
+        with self.get_session() as session:
+            deleted = self._delete_messages_by_group(session, or_(*(
+                and_(
+                    Message.group_id == group_id,
+                    Message.received_at_hour <= self._epoch_hour(before),
+                    Message.received_at < before
+                )
+                for group_id, before in cutoffs.items()
+            )))
+        return {group_id: deleted.get(group_id, 0) for group_id in cutoffs}
+
     def purge_messages_older_than(self, hours: int) -> int:
         """Delete all messages older than specified hours.
 
@@ -710,9 +1293,11 @@ class DatabaseRepository:
         """
         cutoff = datetime.utcnow() - timedelta(hours=hours)
         with self.get_session() as session:
-            count = session.query(Message).filter(
+            count = self._delete_messages(
+                session,
+                Message.received_at_hour <= self._epoch_hour(cutoff),
                 Message.received_at < cutoff
-            ).delete(synchronize_session=False)
+            )
             session.commit()
             return count
 
@@ -723,7 +1308,7 @@ class DatabaseRepository:
             Number of messages deleted
         """
         with self.get_session() as session:
-            count = session.query(Message).delete(synchronize_session=False)
+            count = self._delete_messages(session)
             session.commit()
             return count
 
@@ -737,9 +1322,10 @@ class DatabaseRepository:
             Number of messages deleted
         """
         with self.get_session() as session:
-            count = session.query(Message).filter(
+            count = self._delete_messages(
+                session,
                 Message.group_id == group_id
-            ).delete(synchronize_session=False)
+            )
             session.commit()
             return count
 
@@ -762,31 +1348,35 @@ class DatabaseRepository:
         Returns:
             Tuple of (Reaction object, True if new / False if existing)
         """
-        with self.get_session() as session:
-            existing = session.query(Reaction).filter(
-                Reaction.message_id == message_id,
-                Reaction.reactor_uuid == reactor_uuid
+        with self.Session(expire_on_commit=False) as session:
+            # The common case (a new reaction) is one statement; the insert is
+            # atomic on uq_reaction_identity, so there is no check-then-insert race
+            reaction = session.scalars(
+                sqlite_insert(Reaction).values(
+                    message_id=message_id,
+                    emoji=emoji,
+                    reactor_uuid=reactor_uuid,
+                    timestamp=timestamp
+                ).on_conflict_do_nothing(
+                    index_elements=['message_id', 'reactor_uuid']
+                ).returning(Reaction)
             ).first()
-
-            if existing:
-                # Update emoji if different
-                if existing.emoji != emoji:
-                    existing.emoji = emoji
-                    existing.timestamp = timestamp
-                    session.commit()
-                    session.refresh(existing)
-                return existing, False
-
-            reaction = Reaction(
-                message_id=message_id,
-                emoji=emoji,
-                reactor_uuid=reactor_uuid,
-                timestamp=timestamp
-            )
-            session.add(reaction)
+            if reaction is not None:
+                session.commit()
+                return reaction, True
+
+            # Existing reaction: only a changed emoji is written
+            identity = and_(Reaction.message_id == message_id, Reaction.reactor_uuid == reactor_uuid)
+            existing = session.scalars(
+                update(Reaction)
+                .where(identity, Reaction.emoji != emoji)
+                .values(emoji=emoji, timestamp=timestamp)
+                .returning(Reaction)
+            ).first()
+            if existing is None:
+                existing = session.scalars(select(Reaction).where(identity)).first()
             session.commit()
-            session.refresh(reaction)
-            return reaction, True
+            return existing, False
 
     def get_reaction_stats_for_group(self, group_id: str) -> Dict[str, Any]:
         """Get reaction statistics for a group's messages.
@@ -798,33 +1388,24 @@ class DatabaseRepository:
             Dict with total_reactions, messages_with_reactions, emoji_counts
         """
         with self.get_session() as session:
-            # Get messages for this group
-            message_ids = session.query(Message.id).filter(
-                Message.group_id == group_id
-            ).subquery()
-
-            total = session.query(func.count(Reaction.id)).filter(
-                Reaction.message_id.in_(message_ids)
-            ).scalar() or 0
-
-            messages_with = session.query(
-                func.count(func.distinct(Reaction.message_id))
-            ).filter(
-                Reaction.message_id.in_(message_ids)
-            ).scalar() or 0
+            # One pass over the group's reactions: per-(message, emoji) counts
+            # are enough to derive all three figures in Python
+            rows = session.execute(
+                select(Reaction.message_id, Reaction.emoji, func.count())
+                .join(Message, Message.id == Reaction.message_id)
+                .where(Message.group_id == group_id)
+                .group_by(Reaction.message_id, Reaction.emoji)
+            ).all()
 
-            emoji_counts = session.query(
-                Reaction.emoji,
-                func.count(Reaction.id).label('count')
-            ).filter(
-                Reaction.message_id.in_(message_ids)
-            ).group_by(Reaction.emoji).all()
+        emoji_counts: Dict[str, int] = {}
+        for _, emoji, count in rows:
+            emoji_counts[emoji] = emoji_counts.get(emoji, 0) + count
 
-            return {
-                'total_reactions': total,
-                'messages_with_reactions': messages_with,
-                'emoji_counts': {row.emoji: row.count for row in emoji_counts}
-            }
+        return {
+            'total_reactions': sum(emoji_counts.values()),
+            'messages_with_reactions': len({message_id for message_id, _, _ in rows}),
+            'emoji_counts': emoji_counts
+        }
 
     # SummaryRun operations
     def create_summary_run(
@@ -841,7 +1422,7 @@ class DatabaseRepository:
         Returns:
             Created SummaryRun object
         """
-        with self.get_session() as session:
+        with self.Session(expire_on_commit=False) as session:
             run = SummaryRun(
                 schedule_id=schedule_id,
                 status=status,
@@ -849,7 +1430,6 @@ class DatabaseRepository:
             )
             session.add(run)
             session.commit()
-            session.refresh(run)
             return run
 
     def update_summary_run(
@@ -866,8 +1446,8 @@ class DatabaseRepository:
         Returns:
             Updated SummaryRun or None if not found
         """
-        with self.get_session() as session:
-            run = session.query(SummaryRun).filter(SummaryRun.id == run_id).first()
+        with self.Session(expire_on_commit=False) as session:
+            run = session.get(SummaryRun, run_id)
 
             if not run:
                 return None
@@ -877,7 +1457,6 @@ class DatabaseRepository:
                     setattr(run, key, value)
 
             session.commit()
-            session.refresh(run)
             return run
 
     def complete_summary_run(
@@ -936,13 +1515,36 @@ class DatabaseRepository:
             limit: Maximum number of runs to return
 
         Returns:
-            List of SummaryRun objects, most recent first
+            List of SummaryRun objects with schedule info, most recent first
         """
         with self.get_session() as session:
-            return session.query(SummaryRun).filter(
+            return session.query(SummaryRun).options(
+                joinedload(SummaryRun.schedule)
+            ).filter(
                 SummaryRun.schedule_id == schedule_id
             ).order_by(SummaryRun.started_at.desc()).limit(limit).all()
 
+    def get_latest_run_status(self, schedule_id: int) -> Optional[Tuple[datetime, str, int]]:
+        """Get the most recent run's start time, status and message count for a schedule.
+
+        Selects only columns held in idx_summary_run_cover, so SQLite answers
+        from the index without reading the summary_runs table.
+
+        Args:
+            schedule_id: Database ID of the scheduled summary
+
+        Returns:
+            Tuple of (started_at, status, message_count), or None if never run
+        """
+        with self.get_session() as session:
+            row = session.execute(
+                select(SummaryRun.started_at, SummaryRun.status, SummaryRun.message_count)
+                .where(SummaryRun.schedule_id == schedule_id)
+                .order_by(SummaryRun.started_at.desc())
+                .limit(1)
+            ).first()
+            return tuple(row) if row else None
+
     def get_recent_summary_runs(self, limit: int = 20) -> List[SummaryRun]:
         """Get recent summary runs across all schedules.
 
@@ -976,16 +1578,21 @@ class DatabaseRepository:
         Returns:
             Created DMConversation object
         """
-        with self.get_session() as session:
-            dm = DMConversation(
-                user_id=user_id,
-                role=role,
-                content=content,
-                signal_timestamp=signal_timestamp
-            )
-            session.add(dm)
+        # A single INSERT ... RETURNING skips the unit-of-work flush; content
+        # is deferred, so it's undeferred to stay readable once the session closes
+        with self.Session(expire_on_commit=False) as session:
+            dm = session.scalars(
+                sqlite_insert(DMConversation)
+                .values(
+                    user_id=user_id,
+                    role=role,
+                    content=content,
+                    signal_timestamp=signal_timestamp
+                )
+                .returning(DMConversation)
+                .options(undefer(DMConversation.content))
+            ).one()
             session.commit()
-            session.refresh(dm)
             return dm
 
     def get_dm_history(self, user_id: str) -> List[DMConversation]:
@@ -1000,10 +1607,97 @@ class DatabaseRepository:
             List of DMConversation objects ordered by created_at
         """
         with self.get_session() as session:
-            return session.query(DMConversation).filter(
+            return session.query(DMConversation).options(
+                undefer(DMConversation.content)
+            ).filter(
                 DMConversation.user_id == user_id
             ).order_by(DMConversation.created_at.asc()).all()
 
+    def get_dm_history_tail(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        max_chars: Optional[int] = None
+    ) -> List[DMConversation]:
+        """Get the most recent DM messages for a user, within a size budget.
+
+        Walks idx_dm_user_created backwards from the newest message and stops
+        once limit messages are collected or their content would exceed
+        max_chars, so older history is never read. The newest message is
+        always included.
+
+        Args:
+            user_id: User's Signal UUID or phone number
+            limit: Maximum number of messages, None for no limit
+            max_chars: Maximum total content length, None for no limit
+
+        Returns:
+            List of DMConversation objects ordered by created_at
+        """
+        with self.get_session() as session:
+            query = session.query(DMConversation).options(
+                undefer(DMConversation.content)
+            ).filter(
+                DMConversation.user_id == user_id
+            ).order_by(DMConversation.created_at.desc(), DMConversation.id.desc())
+            if limit is not None:
+                query = query.limit(limit)
+            return self._newest_within_budget(query.yield_per(DM_HISTORY_CHUNK_SIZE), max_chars)
+
+    def get_dm_chat_messages(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        max_chars: Optional[int] = None
+    ) -> List[Dict[str, str]]:
+        """Get the most recent DM messages as Ollama chat messages.
+
+        Same selection as get_dm_history_tail, but only role and content are
+        read and each row becomes a {"role", "content"} dict directly, with
+        no DMConversation objects in between.
+
+        Args:
+            user_id: User's Signal UUID or phone number
+            limit: Maximum number of messages, None for no limit
+            max_chars: Maximum total content length, None for no limit
+
+        Returns:
+            List of {"role": ..., "content": ...} dicts ordered by created_at
+        """
+        stmt = select(DMConversation.role, DMConversation.content).where(
+            DMConversation.user_id == user_id
+        ).order_by(DMConversation.created_at.desc(), DMConversation.id.desc())
+        if limit is not None:
+            stmt = stmt.limit(limit)
+
+        with self.get_session() as session:
+            rows = session.execute(stmt.execution_options(yield_per=DM_HISTORY_CHUNK_SIZE))
+            tail = self._newest_within_budget(rows, max_chars)
+        return [{"role": row.role, "content": row.content} for row in tail]
+
+    @staticmethod
+    def _newest_within_budget(rows, max_chars: Optional[int]) -> list:
+        """Take newest-first rows until their content would exceed max_chars.
+
+        The first (newest) row is always taken.
+
+        Args:
+            rows: Rows with a content attribute, newest first
+            max_chars: Maximum total content length, None for no limit
+
+        Returns:
+            The rows taken, oldest first
+        """
+        tail = []
+        total_chars = 0
+        for row in rows:
+            total_chars += len(row.content)
+            if tail and max_chars is not None and total_chars > max_chars:
+                break
+            tail.append(row)
+        tail.reverse()
+        return tail
+
     def get_dm_message_count(self, user_id: str) -> int:
         """Get count of DM messages for a user.
 
@@ -1014,9 +1708,9 @@ class DatabaseRepository:
             Number of messages in conversation
         """
         with self.get_session() as session:
-            return session.query(func.count(DMConversation.id)).filter(
-                DMConversation.user_id == user_id
-            ).scalar() or 0
+            return session.execute(
+                select(func.count()).where(DMConversation.user_id == user_id)
+            ).scalar()
 
     def purge_dm_messages(self, user_id: str) -> int:
         """Purge all DM messages for a user.
@@ -1030,9 +1724,11 @@ class DatabaseRepository:
             Number of messages deleted
         """
         with self.get_session() as session:
-            count = session.query(DMConversation).filter(
-                DMConversation.user_id == user_id
-            ).delete(synchronize_session=False)
+            count = session.execute(
+                delete(DMConversation)
+                .where(DMConversation.user_id == user_id)
+                .execution_options(synchronize_session=False)
+            ).rowcount
             session.commit()
             return count
 
@@ -1046,9 +1742,11 @@ class DatabaseRepository:
             Number of messages deleted
         """
         with self.get_session() as session:
-            count = session.query(DMConversation).filter(
-                DMConversation.created_at < before
-            ).delete(synchronize_session=False)
+            count = session.execute(
+                delete(DMConversation)
+                .where(DMConversation.created_at < before)
+                .execution_options(synchronize_session=False)
+            ).rowcount
             session.commit()
             return count
 
@@ -1059,19 +1757,81 @@ class DatabaseRepository:
             Dict with total_messages, unique_users, oldest_message, newest_message
         """
         with self.get_session() as session:
-            total = session.query(func.count(DMConversation.id)).scalar() or 0
-            users = session.query(
-                func.count(func.distinct(DMConversation.user_id))
-            ).scalar() or 0
-            oldest = session.query(func.min(DMConversation.created_at)).scalar()
-            newest = session.query(func.max(DMConversation.created_at)).scalar()
-
-            return {
-                'total_messages': total,
-                'unique_users': users,
-                'oldest_message': oldest,
-                'newest_message': newest
-            }
+            total, users, oldest, newest = session.execute(
+                select(
+                    func.count(),
+                    func.count(func.distinct(DMConversation.user_id)),
+                    func.min(DMConversation.created_at),
+                    func.max(DMConversation.created_at)
+                )
+            ).one()
+
+        return {
+            'total_messages': total,
+            'unique_users': users,
+            'oldest_message': oldest,
+            'newest_message': newest
+        }
+
+    @staticmethod
+    def _upsert(
+        session: Session,
+        model: type,
+        conflict_cols: List[str],
+        values: Dict[str, Any],
+        update_cols: List[str]
+    ) -> None:
+        """Insert a settings row, or update it in place if its key exists.
+
+        One INSERT ... ON CONFLICT DO UPDATE, so there is no read-then-write
+        race. New rows get the model's column defaults for anything not in
+        values; updated_at is always refreshed.
+
+        Args:
+            session: Active session (caller commits)
+            model: Mapped class to write
+            conflict_cols: Primary key column names
+            values: Column values for the row
+            update_cols: Columns overwritten when the row already exists
+        """
+        stmt = sqlite_insert(model).values(**values, updated_at=datetime.utcnow())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict_cols,
+            set_={c: stmt.excluded[c] for c in [*update_cols, 'updated_at']}
+        )
+        session.execute(stmt)
+
+    def _cached_setting(self, key: tuple, load: Callable[[], Any]) -> Any:
+        """Return a cached settings value, loading it on a miss or after expiry.
+
+        A value loaded while a setter ran is not cached, so a concurrent
+        write can't be overwritten by the stale read that raced it.
+
+        Args:
+            key: Cache key, e.g. ('opt_out', group_id, sender_uuid)
+            load: Reads the current value from the database
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        entry = self._settings_cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        generation = self._settings_generation
+        value = load()
+        with self._settings_lock:
+            if generation == self._settings_generation:
+                if len(self._settings_cache) >= SETTINGS_CACHE_MAX_ENTRIES:
+                    self._settings_cache.clear()
+                self._settings_cache[key] = (time.monotonic() + SETTINGS_CACHE_TTL, value)
+        return value
+
+    def _invalidate_setting(self, key: tuple) -> None:
+        """Drop a cached settings value after its row was written."""
+        with self._settings_lock:
+            self._settings_generation += 1
+            self._settings_cache.pop(key, None)
 
     def get_dm_retention_hours(self, user_id: str) -> int:
         """Get user's DM retention preference.
@@ -1082,11 +1842,12 @@ class DatabaseRepository:
         Returns:
             Retention hours (default 48 if not set)
         """
-        with self.get_session() as session:
-            settings = session.query(DMSettings).filter(
-                DMSettings.user_id == user_id
-            ).first()
-            return settings.retention_hours if settings else 48
+        def load() -> int:
+            with self.get_session() as session:
+                hours = session.execute(statements.dm_retention_hours(user_id)).scalar()
+                return hours if hours is not None else 48
+
+        return self._cached_setting(('dm', user_id), load)
 
     def set_dm_retention_hours(self, user_id: str, hours: int) -> None:
         """Set user's DM retention preference.
@@ -1096,21 +1857,12 @@ class DatabaseRepository:
             hours: Retention hours (1-168)
         """
         with self.get_session() as session:
-            settings = session.query(DMSettings).filter(
-                DMSettings.user_id == user_id
-            ).first()
-
-            if settings:
-                settings.retention_hours = hours
-                settings.updated_at = datetime.utcnow()
-            else:
-                settings = DMSettings(
-                    user_id=user_id,
-                    retention_hours=hours
-                )
-                session.add(settings)
-
+            self._upsert(session, DMSettings, ['user_id'], {
+                'user_id': user_id,
+                'retention_hours': hours
+            }, ['retention_hours'])
             session.commit()
+        self._invalidate_setting(('dm', user_id))
 
     def get_all_dm_retention_settings(self) -> Dict[str, int]:
         """Get all user retention settings for the purge job.
@@ -1119,8 +1871,7 @@ class DatabaseRepository:
             Dict mapping user_id -> retention_hours
         """
         with self.get_session() as session:
-            settings = session.query(DMSettings).all()
-            return {s.user_id: s.retention_hours for s in settings}
+            return dict(session.execute(select(DMSettings.user_id, DMSettings.retention_hours)).all())
 
     def get_dm_user_ids(self) -> List[str]:
         """Get all unique user IDs with DM messages.
@@ -1129,10 +1880,7 @@ class DatabaseRepository:
             List of user IDs (UUIDs or phone numbers)
         """
         with self.get_session() as session:
-            results = session.query(
-                func.distinct(DMConversation.user_id)
-            ).all()
-            return [r[0] for r in results]
+            return list(session.execute(statements.dm_user_ids()).scalars())
 
     def purge_dm_messages_for_user(self, user_id: str, before: datetime) -> int:
         """Purge DM messages for a specific user older than cutoff.
@@ -1145,15 +1893,70 @@ class DatabaseRepository:
             Number of messages deleted
         """
         with self.get_session() as session:
-            count = session.query(DMConversation).filter(
-                DMConversation.user_id == user_id,
-                DMConversation.created_at < before
-            ).delete()
+            count = session.execute(
+                delete(DMConversation)
+                .where(DMConversation.user_id == user_id, DMConversation.created_at < before)
+                .execution_options(synchronize_session=False)
+            ).rowcount
             session.commit()
             return count
 
+    def purge_expired_dm_messages_by_retention(self, default_hours: int) -> Dict[str, int]:
+        """Purge expired DM messages for all users in one DELETE.
+
+        Each message's cutoff comes from its user's DMSettings, falling back
+        to default_hours for users without a setting, so the purge job needs
+        neither a per-user loop nor one commit per user.
+
+        Args:
+            default_hours: Retention for users without a custom setting
+
+        Returns:
+            Mapping of user ID to number of messages deleted (only users with deletions)
+        """
+        retention_hours = func.coalesce(
+            select(DMSettings.retention_hours)
+            .where(DMSettings.user_id == DMConversation.user_id)
+            .scalar_subquery(),
+            default_hours
+        )
+        # created_at is stored as 'YYYY-MM-DD HH:MM:SS.ffffff', which compares
+        # correctly against SQLite's datetime() output
+        now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        cutoff = func.datetime(now, func.printf('-%d hours', retention_hours))
+
+        with self.get_session() as session:
+            user_ids = session.execute(
+                delete(DMConversation)
+                .where(DMConversation.created_at < cutoff)
+                .returning(DMConversation.user_id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+            session.commit()
+
+        deleted: Dict[str, int] = {}
+        for user_id in user_ids:
+            deleted[user_id] = deleted.get(user_id, 0) + 1
+        return deleted
+
     # Group Settings operations
 
+    def _group_setting_values(self, group_id: str) -> Tuple[int, str, bool, Optional[str]]:
+        """Get a group's (retention_hours, power_mode, purge_on_summary, source), cached.
+
+        The getters share one cache entry, so checking several settings
+        for the same message costs at most one query. source is None when
+        the group has no settings row.
+        """
+        def load() -> Tuple[int, str, bool, Optional[str]]:
+            with self.get_session() as session:
+                row = session.execute(statements.group_setting_values(group_id)).first()
+                if row:
+                    return tuple(row)
+                return 48, "admins", True, None  # Defaults
+
+        return self._cached_setting(('group', group_id), load)
+
     def get_group_retention_hours(self, group_id: str) -> int:
         """Get group's retention preference.
 
@@ -1163,11 +1966,7 @@ class DatabaseRepository:
         Returns:
             Retention hours (default 48 if not set)
         """
-        with self.get_session() as session:
-            settings = session.query(GroupSettings).filter(
-                GroupSettings.group_id == group_id
-            ).first()
-            return settings.retention_hours if settings else 48
+        return self._group_setting_values(group_id)[0]
 
     def set_group_retention_hours(self, group_id: str, hours: int, source: str = "command") -> None:
         """Set group's retention preference.
@@ -1178,23 +1977,41 @@ class DatabaseRepository:
             source: Source of setting ("signal" or "command")
         """
         with self.get_session() as session:
-            settings = session.query(GroupSettings).filter(
-                GroupSettings.group_id == group_id
-            ).first()
+            self._upsert(session, GroupSettings, ['group_id'], {
+                'group_id': group_id,
+                'retention_hours': hours,
+                'source': source
+            }, ['retention_hours', 'source'])
+            session.commit()
+        self._invalidate_setting(('group', group_id))
 
-            if settings:
-                settings.retention_hours = hours
-                settings.source = source
-                settings.updated_at = datetime.utcnow()
-            else:
-                settings = GroupSettings(
-                    group_id=group_id,
-                    retention_hours=hours,
-                    source=source
-                )
-                session.add(settings)
+    def sync_signal_retention(self, group_id: str, expires_in_seconds: int) -> Optional[int]:
+        """Follow a group's Signal disappearing-messages timer for retention.
 
-            session.commit()
+        Called for every stored group message, so the check is served from
+        the settings cache and only writes when the retention actually changes.
+        Groups whose retention was fixed with !retention are left alone.
+
+        Args:
+            group_id: Signal group ID
+            expires_in_seconds: The message's expiresInSeconds (0 if disappearing messages are off)
+
+        Returns:
+            The new retention hours if they were updated, None otherwise
+        """
+        current, _, _, source = self._group_setting_values(group_id)
+        if source not in (None, "signal"):
+            return None
+
+        if expires_in_seconds > 0:
+            retention_hours = max(1, expires_in_seconds // 3600)
+        else:
+            retention_hours = 48  # Default when no disappearing messages
+
+        if retention_hours == current:
+            return None
+        self.set_group_retention_hours(group_id, retention_hours, source="signal")
+        return retention_hours
 
     def get_group_settings(self, group_id: str) -> Optional[GroupSettings]:
         """Get full group settings record.
@@ -1206,9 +2023,7 @@ class DatabaseRepository:
             GroupSettings object or None if not set
         """
         with self.get_session() as session:
-            settings = session.query(GroupSettings).filter(
-                GroupSettings.group_id == group_id
-            ).first()
+            settings = session.get(GroupSettings, group_id)
             if settings:
                 session.expunge(settings)  # Detach cleanly to avoid DetachedInstanceError
             return settings
@@ -1220,8 +2035,7 @@ class DatabaseRepository:
             Dict mapping group_id -> retention_hours
         """
         with self.get_session() as session:
-            settings = session.query(GroupSettings).all()
-            return {s.group_id: s.retention_hours for s in settings}
+            return dict(session.execute(select(GroupSettings.group_id, GroupSettings.retention_hours)).all())
 
     def get_group_power_mode(self, group_id: str) -> str:
         """Get the power mode for a group (who can run config commands).
@@ -1232,13 +2046,7 @@ class DatabaseRepository:
         Returns:
             Power mode string: "admins" (default) or "everyone"
         """
-        with self.get_session() as session:
-            settings = session.query(GroupSettings).filter(
-                GroupSettings.group_id == group_id
-            ).first()
-            if settings:
-                return settings.power_mode
-            return "admins"  # Default
+        return self._group_setting_values(group_id)[1]
 
     def set_group_power_mode(self, group_id: str, mode: str) -> None:
         """Set the power mode for a group.
@@ -1251,24 +2059,13 @@ class DatabaseRepository:
             raise ValueError(f"Invalid power mode: {mode}. Must be 'admins' or 'everyone'")
 
         with self.get_session() as session:
-            settings = session.query(GroupSettings).filter(
-                GroupSettings.group_id == group_id
-            ).first()
-
-            if settings:
-                settings.power_mode = mode
-                settings.updated_at = datetime.utcnow()
-            else:
-                # Create new settings with default retention
-                settings = GroupSettings(
-                    group_id=group_id,
-                    retention_hours=48,
-                    source="signal",
-                    power_mode=mode
-                )
-                session.add(settings)
-
+            # New rows get the column defaults (48h retention, source "signal")
+            self._upsert(session, GroupSettings, ['group_id'], {
+                'group_id': group_id,
+                'power_mode': mode
+            }, ['power_mode'])
             session.commit()
+        self._invalidate_setting(('group', group_id))
 
     def get_group_purge_on_summary(self, group_id: str) -> bool:
         """Get whether to purge messages after on-demand summary.
@@ -1279,13 +2076,7 @@ class DatabaseRepository:
         Returns:
             True if messages should be purged after !summary (default), False otherwise
         """
-        with self.get_session() as session:
-            settings = session.query(GroupSettings).filter(
-                GroupSettings.group_id == group_id
-            ).first()
-            if settings:
-                return getattr(settings, 'purge_on_summary', True)
-            return True  # Default: purge after summary
+        return self._group_setting_values(group_id)[2]
 
     def set_group_purge_on_summary(self, group_id: str, purge: bool) -> None:
         """Set whether to purge messages after on-demand summary.
@@ -1295,25 +2086,13 @@ class DatabaseRepository:
             purge: True to purge after !summary, False to keep until retention expires
         """
         with self.get_session() as session:
-            settings = session.query(GroupSettings).filter(
-                GroupSettings.group_id == group_id
-            ).first()
-
-            if settings:
-                settings.purge_on_summary = purge
-                settings.updated_at = datetime.utcnow()
-            else:
-                # Create new settings with default retention
-                settings = GroupSettings(
-                    group_id=group_id,
-                    retention_hours=48,
-                    source="signal",
-                    power_mode="admins",
-                    purge_on_summary=purge
-                )
-                session.add(settings)
-
+            # New rows get the column defaults (48h retention, source "signal", admins)
+            self._upsert(session, GroupSettings, ['group_id'], {
+                'group_id': group_id,
+                'purge_on_summary': purge
+            }, ['purge_on_summary'])
             session.commit()
+        self._invalidate_setting(('group', group_id))
 
     # User Opt-Out operations
 
@@ -1327,15 +2106,14 @@ class DatabaseRepository:
         Returns:
             True if user has opted out (messages NOT collected), False otherwise
         """
-        with self.get_session() as session:
-            opt_out = session.query(UserOptOut).filter(
-                UserOptOut.group_id == group_id,
-                UserOptOut.sender_uuid == sender_uuid
-            ).first()
+        def load() -> bool:
+            with self.get_session() as session:
+                # Default: opted in (no active opt-out row = messages collected)
+                return session.execute(
+                    statements.user_opt_out(group_id, sender_uuid)
+                ).first() is not None
 
-            if opt_out:
-                return opt_out.opted_out
-            return False  # Default: opted in (messages collected)
+        return self._cached_setting(('opt_out', group_id, sender_uuid), load)
 
     def set_user_opt_out(self, group_id: str, sender_uuid: str, opted_out: bool) -> None:
         """Set a user's opt-out status for a group.
@@ -1346,23 +2124,13 @@ class DatabaseRepository:
             opted_out: True to opt out (stop collecting), False to opt in
         """
         with self.get_session() as session:
-            existing = session.query(UserOptOut).filter(
-                UserOptOut.group_id == group_id,
-                UserOptOut.sender_uuid == sender_uuid
-            ).first()
-
-            if existing:
-                existing.opted_out = opted_out
-                existing.updated_at = datetime.utcnow()
-            else:
-                opt_out_record = UserOptOut(
-                    group_id=group_id,
-                    sender_uuid=sender_uuid,
-                    opted_out=opted_out
-                )
-                session.add(opt_out_record)
-
+            self._upsert(session, UserOptOut, ['group_id', 'sender_uuid'], {
+                'group_id': group_id,
+                'sender_uuid': sender_uuid,
+                'opted_out': opted_out
+            }, ['opted_out'])
             session.commit()
+        self._invalidate_setting(('opt_out', group_id, sender_uuid))
 
     def delete_user_messages_in_group(self, group_id: str, sender_uuid: str) -> int:
         """Delete all messages from a specific user in a specific group.
@@ -1377,10 +2145,11 @@ class DatabaseRepository:
             Number of messages deleted
         """
         with self.get_session() as session:
-            count = session.query(Message).filter(
+            count = self._delete_messages(
+                session,
                 Message.group_id == group_id,
                 Message.sender_uuid == sender_uuid
-            ).delete(synchronize_session=False)
+            )
             session.commit()
             return count
 
@@ -1396,7 +2165,7 @@ class DatabaseRepository:
             List of ScheduledSummary objects for this source group
         """
         with self.get_session() as session:
-            group = session.query(Group).filter_by(group_id=group_id).first()
+            group = session.execute(statements.group_by_id(group_id)).scalars().first()
             if not group:
                 return []
             return (
@@ -1418,24 +2187,23 @@ class DatabaseRepository:
         Returns:
             Tuple of (Group or None, error_message or None)
         """
-        from src.utils.message_utils import anonymize_group_id
-
         with self.get_session() as session:
-            groups = session.query(Group).all()
-
             # Check if identifier is a hash (starts with #)
             if identifier.startswith('#'):
-                identifier_upper = identifier.upper()
-                for g in groups:
-                    if anonymize_group_id(g.group_id) == identifier_upper:
-                        return (g, None)
+                group = session.scalars(
+                    select(Group).where(Group.group_hash == identifier.upper()).limit(1)
+                ).first()
+                if group:
+                    return (group, None)
                 return (None, f"No group found with hash {identifier}")
 
-            # Find by name
-            matches = [g for g in groups if g.name == identifier]
+            # Find by name; two rows are enough to detect ambiguity
+            matches = session.scalars(
+                select(Group).where(Group.name == identifier).limit(2)
+            ).all()
             if len(matches) == 0:
                 return (None, f"No group found named '{identifier}'")
             if len(matches) > 1:
-                hashes = [anonymize_group_id(g.group_id) for g in matches]
+                hashes = [g.group_hash for g in session.scalars(select(Group).where(Group.name == identifier))]
                 return (None, f"Multiple groups named '{identifier}'. Use hash: {', '.join(hashes)}")
             return (matches[0], None)
@@ -0,0 +1,149 @@
+"""Cached statements for hot repository queries - Privacy Summarizer.
+
+Each builder returns a lambda_stmt: SQLAlchemy compiles the statement once
+per call site and shape, then reuses the cached SQL with fresh bound values
+(taken from the lambdas' closure variables) on every later call.
+"""
+
+from typing import Optional
+
+from sqlalchemy import func, lambda_stmt, select
+from sqlalchemy.orm import joinedload, undefer
+from sqlalchemy.sql.lambdas import StatementLambdaElement
+
+from .models import DMConversation, DMSettings, Group, GroupSettings, Message, Reaction, ScheduledSummary, UserOptOut
+
+
+def group_by_id(group_id: str) -> StatementLambdaElement:
+    """Select a group by its Signal group ID."""
+    return lambda_stmt(lambda: select(Group).where(Group.group_id == group_id))
+
+
+def message_by_identity(identity_hash: int) -> StatementLambdaElement:
+    """Select a message (content loaded) by its identity hash."""
+    return lambda_stmt(
+        lambda: select(Message)
+        .where(Message.identity_hash == identity_hash)
+        .options(undefer(Message.content))
+    )
+
+
+def message_id_at(group_id: str, signal_timestamp: int) -> StatementLambdaElement:
+    """Select the ID of a group's message sent at a Signal timestamp.
+
+    An idx_message_group_timestamp seek; the earliest-stored row wins if
+    several senders share the timestamp.
+    """
+    return lambda_stmt(
+        lambda: select(Message.id)
+        .where(Message.group_id == group_id, Message.signal_timestamp == signal_timestamp)
+        .order_by(Message.id.asc())
+        .limit(1)
+    )
+
+
+def enabled_schedules() -> StatementLambdaElement:
+    """Select enabled scheduled summaries with their source/target groups."""
+    return lambda_stmt(
+        lambda: select(ScheduledSummary)
+        .where(ScheduledSummary.enabled == True)
+        .options(
+            joinedload(ScheduledSummary.source_group),
+            joinedload(ScheduledSummary.target_group)
+        )
+    )
+
+
+# Separator for GROUP_CONCAT'd emojis (ASCII unit separator, never in an emoji)
+EMOJI_SEPARATOR = "\x1f"
+
+
+def messages_in_window(
+    group_id: str,
+    since_ms: Optional[int] = None,
+    until_ms: Optional[int] = None
+) -> StatementLambdaElement:
+    """Select a group's non-empty messages with aggregated reactions, in a signal_timestamp window.
+
+    Yields one row per message: (content, sender_uuid, reaction_count, emojis),
+    where emojis is the reactions' emoji joined by EMOJI_SEPARATOR (None if
+    there are none). Reactions are aggregated in SQL, so no ORM objects are built.
+
+    Args:
+        group_id: Signal group ID
+        since_ms: Start of window in milliseconds (inclusive), None for unbounded
+        until_ms: End of window in milliseconds (inclusive), None for unbounded
+    """
+    stmt = lambda_stmt(
+        lambda: select(
+            Message.content,
+            Message.sender_uuid,
+            func.count(Reaction.id),
+            func.group_concat(Reaction.emoji, EMOJI_SEPARATOR)
+        )
+        .outerjoin(Reaction, Reaction.message_id == Message.id)
+        .where(Message.group_id == group_id, Message.content.isnot(None), Message.content != '')
+        # Grouping and ordering by (signal_timestamp, id) follows idx_message_group_timestamp
+        # (id is its implicit trailing key), so SQLite needs no temp b-tree for either
+        .group_by(Message.signal_timestamp, Message.id)
+        .order_by(Message.signal_timestamp.asc(), Message.id.asc())
+    )
+    if since_ms is not None:
+        stmt += lambda s: s.where(Message.signal_timestamp >= since_ms)
+    if until_ms is not None:
+        stmt += lambda s: s.where(Message.signal_timestamp <= until_ms)
+    return stmt
+
+
+def user_opt_out(group_id: str, sender_uuid: str) -> StatementLambdaElement:
+    """Select the active opt-out row for a user in a group, if any.
+
+    A single seek on the table's clustered (group_id, sender_uuid) primary key.
+    """
+    return lambda_stmt(
+        lambda: select(UserOptOut.group_id).where(
+            UserOptOut.group_id == group_id,
+            UserOptOut.sender_uuid == sender_uuid,
+            UserOptOut.opted_out == True
+        )
+    )
+
+
+def group_setting_values(group_id: str) -> StatementLambdaElement:
+    """Select a group's (retention_hours, power_mode, purge_on_summary, source), if set."""
+    return lambda_stmt(
+        lambda: select(
+            GroupSettings.retention_hours,
+            GroupSettings.power_mode,
+            GroupSettings.purge_on_summary,
+            GroupSettings.source
+        ).where(GroupSettings.group_id == group_id)
+    )
+
+
+def dm_retention_hours(user_id: str) -> StatementLambdaElement:
+    """Select a user's DM retention hours, if set."""
+    return lambda_stmt(
+        lambda: select(DMSettings.retention_hours).where(DMSettings.user_id == user_id)
+    )
+
+
+def dm_user_ids() -> StatementLambdaElement:
+    """Select the distinct user IDs in dm_conversations, in order.
+
+    A recursive CTE seeks idx_dm_user_created once per user (each step
+    finds the next user_id above the last), so the cost grows with the
+    number of users rather than the number of DM messages.
+    """
+    def build():
+        users = select(func.min(DMConversation.user_id).label('user_id')).cte('dm_users', recursive=True)
+        users = users.union_all(
+            select(
+                select(func.min(DMConversation.user_id))
+                .where(DMConversation.user_id > users.c.user_id)
+                .scalar_subquery()
+            ).where(users.c.user_id.isnot(None))
+        )
+        return select(users.c.user_id).where(users.c.user_id.isnot(None))
+
+    return lambda_stmt(build)
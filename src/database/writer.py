@@ -0,0 +1,144 @@
+"""Buffered message/reaction writer - Privacy Summarizer.
+
+Incoming Signal messages arrive one at a time. Committing each one costs an
+fsync, so the writer collects rows and hands them to the repository in a
+single transaction once the buffer fills or the flush window elapses.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from .repository import DatabaseRepository
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriter:
+    """Buffers message and reaction writes and flushes them in batches.
+
+    Buffered rows are not visible to readers until flushed, so callers must
+    flush before anything that reads messages back (e.g. running !summary).
+    """
+
+    def __init__(
+        self,
+        db_repo: DatabaseRepository,
+        batch_size: int = 200,
+        flush_interval: float = 0.1
+    ):
+        """Initialize the writer.
+
+        Args:
+            db_repo: Database repository to write through
+            batch_size: Flush once this many rows are buffered
+            flush_interval: Flush once the oldest buffered row is this many seconds old
+        """
+        self.db_repo = db_repo
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._messages: List[Dict[str, Any]] = []
+        self._reactions: List[Dict[str, Any]] = []
+        self._first_buffered_at = None
+        self._lock = threading.Lock()
+        # Running total of new (non-duplicate) messages written by all flushes
+        self.messages_stored = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    @property
+    def pending(self) -> int:
+        """Number of rows waiting to be flushed."""
+        return len(self._messages) + len(self._reactions)
+
+    def add_message(
+        self,
+        signal_timestamp: int,
+        sender_uuid: str,
+        group_id: str,
+        content: str = None
+    ) -> None:
+        """Buffer a message for storage.
+
+        Args:
+            signal_timestamp: Signal's timestamp_ms
+            sender_uuid: Sender's UUID (for deduplication only)
+            group_id: Signal group ID
+            content: Message text content
+        """
+        self._add(self._messages, {
+            'signal_timestamp': signal_timestamp,
+            'sender_uuid': sender_uuid,
+            'group_id': group_id,
+            'content': content
+        })
+
+    def add_reaction(
+        self,
+        message_id: int,
+        emoji: str,
+        reactor_uuid: str,
+        timestamp: int
+    ) -> None:
+        """Buffer a reaction for storage.
+
+        Args:
+            message_id: Database ID of the message
+            emoji: Reaction emoji
+            reactor_uuid: UUID of reactor (for deduplication)
+            timestamp: Signal's timestamp_ms
+        """
+        self._add(self._reactions, {
+            'message_id': message_id,
+            'emoji': emoji,
+            'reactor_uuid': reactor_uuid,
+            'timestamp': timestamp
+        })
+
+    def _add(self, buffer: List[Dict[str, Any]], row: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._first_buffered_at is None:
+                self._first_buffered_at = time.monotonic()
+            buffer.append(row)
+            due = (
+                self.pending >= self.batch_size
+                or time.monotonic() - self._first_buffered_at >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self) -> Tuple[int, int]:
+        """Write all buffered rows in one transaction.
+
+        If the write fails, the rows stay buffered and the error is re-raised.
+
+        Returns:
+            Tuple of (new messages stored, reactions written)
+        """
+        with self._lock:
+            messages, self._messages = self._messages, []
+            reactions, self._reactions = self._reactions, []
+            first_buffered_at, self._first_buffered_at = self._first_buffered_at, None
+
+        if not messages and not reactions:
+            return 0, 0
+
+        try:
+            result = self.db_repo.write_batch(messages, reactions)
+        except Exception:
+            # Put the rows back ahead of anything buffered meanwhile, so the
+            # next flush retries them in their original order
+            with self._lock:
+                self._messages[:0] = messages
+                self._reactions[:0] = reactions
+                self._first_buffered_at = first_buffered_at
+            raise
+        with self._lock:
+            self.messages_stored += result[0]
+        logger.debug(f"Flushed {result[0]} new messages and {result[1]} reactions")
+        return result
@@ -1,13 +1,15 @@
 """DM Handler for conversational AI chat via Signal."""
 
+import io
 import logging
 import os
+import re
 from typing import Optional
 
 from ..ai.ollama_client import OllamaClient
 from ..ai.summarizer import ChatSummarizer
 from ..database.repository import DatabaseRepository
-from ..utils.message_utils import split_long_message
+from ..utils.message_utils import SIGNAL_MAX_MESSAGE_LENGTH, split_long_message
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +24,9 @@ class DMHandler:
     - Commands: !help, !status, !summary, !!!purge
     """
 
+    # Fixed attribute set: no per-instance __dict__ on the per-DM hot path
+    __slots__ = ("ollama", "signal", "db", "enabled", "retention_hours", "_exact_commands")
+
     COMMANDS = {
         "!help": "Show available commands",
         "!status": "Show bot and AI status",
@@ -32,10 +37,38 @@ class DMHandler:
         "!!!purge": "Delete all conversation history"
     }
 
-    SUMMARIZE_TRIGGERS = [
+    # Lowercase, like the text they are matched against; tuples because the
+    # compiled patterns below are built from them once, at import
+    SUMMARIZE_TRIGGERS = (
         "summarize", "summary", "tldr", "tl;dr",
         "sum up", "brief", "condense", "shorten"
-    ]
+    )
+
+    # Phrases asking to summarize the stored conversation history
+    CONVERSATION_PHRASES = (
+        "summarize the conversation", "summarize our conversation",
+        "summarize this conversation", "summary of conversation",
+        "summarize my conversation", "summarize chat", "summarize our chat",
+        "tldr conversation", "tldr chat"
+    )
+
+    # Each list compiled into one case-insensitive alternation, so intent
+    # detection scans a message once per list, without a lowercased copy
+    _CONVERSATION_RE = re.compile("|".join(map(re.escape, CONVERSATION_PHRASES)), re.IGNORECASE)
+    _TRIGGER_RE = re.compile("|".join(map(re.escape, SUMMARIZE_TRIGGERS)), re.IGNORECASE)
+    # Anything shorter can't contain a conversation phrase and is below the
+    # summarize_text length gates, so it is chat without scanning
+    _MIN_PHRASE_LEN = min(map(len, CONVERSATION_PHRASES))
+
+    # Commands are matched against this many lowercased leading characters.
+    # Every command name is shorter, so text pasted after a command (such as
+    # !summarize) is never lowercased.
+    _COMMAND_MATCH_LEN = 16
+
+    # Request wording stripped from the front of text to summarize
+    _PREFIX_RE = re.compile(
+        r"^\s*(?:(?:this:?|the following:?|please|can you|could you)\s*)+", re.IGNORECASE
+    )
 
     SYSTEM_PROMPT = """You are a helpful assistant communicating via Signal messenger.
 Keep responses concise and conversational.
@@ -48,6 +81,59 @@ IMPORTANT RULES:
 
 PRIVACY: When summarizing text, do not repeat names or direct quotes. Use general terms instead."""
 
+    HELP_TEXT = """📖 DM Commands
+
+📋 !help - Show this help
+📊 !status - Show bot status
+📝 !summary - Summarize and clear history
+📝 !summarize [text] - Summarize provided text (not stored)
+🔍 !ask [question] - Ask about conversation history
+⏰ !retention - View your retention period
+⏰ !retention [hours] - Set retention (1-168h)
+🗑️ !!!purge - Delete all conversation history
+
+💬 Chat normally or paste text to summarize!
+📖 Docs: https://next.maidan.cloud/apps/collectives/p/SCXCe4p3RDexBZC/Privacy-Summarizer-Docs-4"""
+
+    DISABLED_MESSAGE = (
+        "Message received! DM conversations are paused right now, "
+        "but I've saved your message. I'll be able to respond when "
+        "the service is back online.\n\n"
+        "Commands still work: !help, !status, !summary, !!!purge"
+    )
+
+    OLLAMA_OFFLINE_MESSAGE = (
+        "Message received! The AI service is temporarily offline, "
+        "but I've saved your message. I'll be able to respond when "
+        "it's back up.\n\n"
+        "Commands still work: !help, !status, !summary, !!!purge"
+    )
+
+    PRIVACY_REQUIREMENTS = """PRIVACY REQUIREMENTS:
+- DO NOT include any names, usernames, or identifying information
+- DO NOT include direct quotes
+- Use general terms like "someone", "a person", "participants"
+- Focus on key points and themes only
+"""
+
+    # Prompt templates are split around the user's content, so each request
+    # only concatenates head + content + tail
+    CONVERSATION_SUMMARY_PROMPT_HEAD = (
+        "Summarize this conversation concisely.\n\n" + PRIVACY_REQUIREMENTS + "\nConversation:\n"
+    )
+    CONVERSATION_SUMMARY_PROMPT_TAIL = "\nSummary:"
+
+    TEXT_SUMMARY_PROMPT_HEAD = (
+        "Summarize the following text concisely.\n\n" + PRIVACY_REQUIREMENTS + "\nText:\n"
+    )
+    TEXT_SUMMARY_PROMPT_TAIL = "\n\nSummary:"
+
+    SUMMARIZE_COMMAND_PROMPT_HEAD = "Summarize the following text concisely.\n\n<text>\n"
+    SUMMARIZE_COMMAND_PROMPT_TAIL = (
+        "\n</text>\n\n"
+        "Provide a clear, concise summary. Remember: no names, no quotes, use general terms."
+    )
+
     def __init__(
         self,
         ollama: OllamaClient,
@@ -81,6 +167,14 @@ PRIVACY: When summarizing text, do not repeat names or direct quotes. Use genera
         else:
             self.retention_hours = int(os.getenv("DM_RETENTION_HOURS", "48"))
 
+        # Commands without arguments, dispatched with a single dict lookup
+        self._exact_commands = {
+            "!help": self._send_help,
+            "!status": self._send_status,
+            "!summary": self._handle_summary_command,
+            "!!!purge": self._handle_purge_command,
+        }
+
     def _send_reaction(self, emoji: str, user_id: str, timestamp: int) -> None:
         """Send a reaction to a user's message.
 
@@ -109,61 +203,12 @@ PRIVACY: When summarizing text, do not repeat names or direct quotes. Use genera
             return
 
         text = message.strip()
-        lower = text.lower()
 
         logger.info(f"Processing DM from {user_id[:8]}...")
 
         # Check for commands FIRST (don't store commands, consistent with group chats)
-        if lower == "!help":
-            self._send_reaction("👀", user_id, timestamp)
-            self._send_help(user_id)
-            self._send_reaction("✅", user_id, timestamp)
-            return
-        if lower == "!status":
-            self._send_reaction("👀", user_id, timestamp)
-            self._send_status(user_id)
-            self._send_reaction("✅", user_id, timestamp)
-            return
-        if lower == "!summary":
-            self._send_reaction("👀", user_id, timestamp)
-            try:
-                self._handle_summary_command(user_id)
-                self._send_reaction("✅", user_id, timestamp)
-            except Exception:
-                self._send_reaction("❌", user_id, timestamp)
-                raise
-            return
-        if lower == "!!!purge":
-            self._send_reaction("👀", user_id, timestamp)
-            self._handle_purge_command(user_id)
-            self._send_reaction("✅", user_id, timestamp)
-            return
-        if lower.startswith("!retention"):
-            self._send_reaction("👀", user_id, timestamp)
-            self._handle_retention_command(user_id, text)
-            self._send_reaction("✅", user_id, timestamp)
-            return
-        if lower.startswith("!summarize"):
-            self._send_reaction("👀", user_id, timestamp)
-            try:
-                self._handle_summarize_command(user_id, text)
-                self._send_reaction("✅", user_id, timestamp)
-            except Exception:
-                self._send_reaction("❌", user_id, timestamp)
-                raise
-            return
-        if lower == "!ask" or lower.startswith("!ask "):
-            self._send_reaction("👀", user_id, timestamp)
-            try:
-                self._handle_ask_command(user_id, text)
-                self._send_reaction("✅", user_id, timestamp)
-            except Exception:
-                self._send_reaction("❌", user_id, timestamp)
-                raise
-            return
-        # Unknown command starting with !
-        if lower.startswith("!"):
-            self._send_reaction("❓", user_id, timestamp)
+        if text.startswith("!"):
+            self._handle_command(user_id, text, timestamp)
             return
 
         # Store non-command user messages
@@ -196,9 +241,13 @@ PRIVACY: When summarizing text, do not repeat names or direct quotes. Use genera
             else:
                 response = self._handle_chat(user_id, text)
 
-            # Store and send response
-            self.db.store_dm_message(user_id, "assistant", response)
+            # Reply first so the user isn't kept waiting on the commit;
+            # the reply is stored before the next message is handled
             self._send_message(user_id, response)
+            try:
+                self.db.store_dm_message(user_id, "assistant", response)
+            except Exception as e:
+                logger.error(f"Failed to store DM response: {e}")
 
         except Exception as e:
             logger.error(f"Error processing DM: {e}", exc_info=True)
@@ -207,6 +256,39 @@ PRIVACY: When summarizing text, do not repeat names or direct quotes. Use genera
                 "Sorry, I encountered an error processing your message. Please try again."
             )
 
+    def _handle_command(self, user_id: str, text: str, timestamp: int = None) -> None:
+        """Run a "!" command, reacting 👀 while it runs and ✅/❌ when done.
+
+        Args:
+            user_id: Sender's Signal UUID or phone number
+            text: Stripped message text
+            timestamp: Signal's timestamp_ms (optional)
+        """
+        # Exact matches still only succeed on the whole message: a longer
+        # message's head is longer than any command name
+        lower = text[:self._COMMAND_MATCH_LEN].lower()
+        command = self._exact_commands.get(lower)
+        if command is not None:
+            args = (user_id,)
+        elif lower.startswith("!retention"):
+            command, args = self._handle_retention_command, (user_id, text)
+        elif lower.startswith("!summarize"):
+            command, args = self._handle_summarize_command, (user_id, text)
+        elif lower == "!ask" or lower.startswith("!ask "):
+            command, args = self._handle_ask_command, (user_id, text)
+        else:
+            # Unknown command
+            self._send_reaction("❓", user_id, timestamp)
+            return
+
+        self._send_reaction("👀", user_id, timestamp)
+        try:
+            command(*args)
+        except Exception:
+            self._send_reaction("❌", user_id, timestamp)
+            raise
+        self._send_reaction("✅", user_id, timestamp)
+
     def _detect_intent(self, message: str) -> str:
         """Auto-detect if user wants summarization or chat.
 
@@ -216,27 +298,20 @@ PRIVACY: When summarizing text, do not repeat names or direct quotes. Use genera
         Returns:
             "summarize_conversation", "summarize_text", or "chat"
         """
-        lower = message.lower()
+        if len(message) < self._MIN_PHRASE_LEN:
+            return "chat"
 
         # Check if user wants to summarize their conversation history
-        conversation_phrases = [
-            "summarize the conversation", "summarize our conversation",
-            "summarize this conversation", "summary of conversation",
-            "summarize my conversation", "summarize chat", "summarize our chat",
-            "tldr conversation", "tldr chat"
-        ]
-        for phrase in conversation_phrases:
-            if phrase in lower:
-                return "summarize_conversation"
+        if self._CONVERSATION_RE.search(message):
+            return "summarize_conversation"
 
         # Long text with line breaks likely wants text summarization
         if len(message) > 1000 and "\n" in message:
             return "summarize_text"
 
         # Explicit summarization trigger with substantial content
-        for trigger in self.SUMMARIZE_TRIGGERS:
-            if trigger in lower and len(message) > 100:
-                return "summarize_text"
+        if len(message) > 100 and self._TRIGGER_RE.search(message):
+            return "summarize_text"
 
         # Default to chat
         return "chat"
@@ -251,14 +326,12 @@ PRIVACY: When summarizing text, do not repeat names or direct quotes. Use genera
         Returns:
             AI response text
         """
-        # Get all history (Ollama handles truncation via max_input_tokens)
-        history = self.db.get_dm_history(user_id)
-
-        # Build messages for Ollama chat
+        # Only the newest history that fits the model's input budget
+        # (~4 characters per token) is read, already shaped as chat messages
         messages = [{"role": "system", "content": self.SYSTEM_PROMPT}]
-
-        for msg in history:
-            messages.append({"role": msg.role, "content": msg.content})
+        messages.extend(self.db.get_dm_chat_messages(
+            user_id, max_chars=self.ollama.max_input_tokens * 4
+        ))
 
         # Generate response
         return self.ollama.chat(messages, temperature=0.7)
@@ -272,32 +345,15 @@ PRIVACY: When summarizing text, do not repeat names or direct quotes. Use genera
         Returns:
             Summary text
         """
-        # Try to extract the text to summarize
-        # Remove common request phrases
-        content = text
-        for trigger in self.SUMMARIZE_TRIGGERS:
-            content = content.lower().replace(trigger, "").replace(trigger.upper(), "")
-
-        # Remove common prefixes
-        for prefix in ["this:", "this", "the following:", "the following", "please", "can you", "could you"]:
-            if content.lower().strip().startswith(prefix):
-                content = content[len(prefix):].strip()
+        # Try to extract the text to summarize: remove the request phrases,
+        # then any request wording left at the start
+        content = self._TRIGGER_RE.sub("", text)
+        content = self._PREFIX_RE.sub("", content)
 
         # If there's substantial content to summarize
         if len(content.strip()) > 50:
             # Use privacy-focused prompt
-            prompt = f"""Summarize the following text concisely.
-
-PRIVACY REQUIREMENTS:
-- DO NOT include any names, usernames, or identifying information
-- DO NOT include direct quotes
-- Use general terms like "someone", "a person", "participants"
-- Focus on key points and themes only
-
-Text:
-{content.strip()}
-
-Summary:"""
+            prompt = self.TEXT_SUMMARY_PROMPT_HEAD + content.strip() + self.TEXT_SUMMARY_PROMPT_TAIL
             return self.ollama.generate(prompt=prompt, temperature=0.3)
         else:
             # Not enough content - treat as chat
@@ -324,36 +380,28 @@ Summary:"""
 
         history = self.db.get_dm_history(user_id)
 
-        # Filter out command messages for summary
-        content_messages = [
-            msg for msg in history
-            if not msg.content.startswith("!")
-        ]
-
-        if len(content_messages) < 2:
+        # Write the privacy-focused prompt straight into one buffer, skipping
+        # command messages and counting the rest in the same pass
+        buf = io.StringIO()
+        buf.write(self.CONVERSATION_SUMMARY_PROMPT_HEAD)
+        message_count = 0
+        for msg in history:
+            if msg.content.startswith("!"):
+                continue
+            message_count += 1
+            buf.write(msg.role)
+            buf.write(": ")
+            buf.write(msg.content)
+            buf.write("\n")
+
+        if message_count < 2:
             self._send_message(user_id, "No conversation to summarize.")
             return
 
-        # Build text for summarization
-        text = "\n".join([
-            f"{msg.role}: {msg.content}"
-            for msg in content_messages
-        ])
+        buf.write(self.CONVERSATION_SUMMARY_PROMPT_TAIL)
+        prompt = buf.getvalue()
 
         try:
-            # Use privacy-focused prompt
-            prompt = f"""Summarize this conversation concisely.
-
-PRIVACY REQUIREMENTS:
-- DO NOT include any names, usernames, or identifying information
-- DO NOT include direct quotes
-- Use general terms like "someone", "a person", "participants"
-- Focus on key points and themes only
-
-Conversation:
-{text}
-
-Summary:"""
             summary = self.ollama.generate(prompt=prompt, temperature=0.3)
 
             # Purge conversation
@@ -362,7 +410,7 @@ Summary:"""
             self._send_message(
                 user_id,
                 f"📊 Conversation Summary\n\n"
-                f"💬 Messages: {len(content_messages)}\n\n"
+                f"💬 Messages: {message_count}\n\n"
                 f"📝 Summary:\n{summary}\n\n"
                 f"✅ {count} messages cleared."
             )
@@ -389,7 +437,8 @@ Summary:"""
             user_id: User's Signal UUID or phone number
             text: Full command text (e.g., "!retention" or "!retention 24")
         """
-        parts = text.strip().split()
+        # Only the command and its first argument matter
+        parts = text.split(None, 2)
 
         if len(parts) == 1:
             # Just "!retention" - show current setting
@@ -402,12 +451,10 @@ Summary:"""
             )
             return
 
-        # Parse hours argument
-        try:
-            hours = int(parts[1])
-            if not 1 <= hours <= 168:
-                raise ValueError("Out of range")
-        except (ValueError, IndexError):
+        # Validate the hours argument up front rather than catching int()'s errors
+        arg = parts[1]
+        hours = int(arg) if arg.isascii() and arg.isdigit() else 0
+        if not 1 <= hours <= 168:
             self._send_message(
                 user_id,
                 "Invalid retention period. Must be between 1 and 168 hours (7 days)."
@@ -444,19 +491,14 @@ Summary:"""
             # Use privacy-focused prompt with chat API
             messages = [
                 {"role": "system", "content": ChatSummarizer.PRIVACY_SYSTEM_PROMPT},
-                {"role": "user", "content": f"""Summarize the following text concisely.
-
-<text>
-{text_to_summarize}
-</text>
-
-Provide a clear, concise summary. Remember: no names, no quotes, use general terms."""}
+                {"role": "user", "content": (
+                    self.SUMMARIZE_COMMAND_PROMPT_HEAD + text_to_summarize + self.SUMMARIZE_COMMAND_PROMPT_TAIL
+                )}
             ]
             summary = self.ollama.chat(messages=messages, temperature=0.3, max_tokens=300)
 
             response = f"📝 Summary:\n\n{summary.strip()}"
-            for chunk in split_long_message(response):
-                self._send_message(user_id, chunk)
+            self._send_message(user_id, response)
         except Exception as e:
             logger.error(f"Error in !summarize: {e}")
             self._send_message(user_id, "⚠️ Failed to generate summary.")
@@ -511,8 +553,7 @@ Provide a clear, concise summary. Remember: no names, no quotes, use general ter
 
             # Format response with emojis
             response = f"❓ {question}\n\n💬 {answer}"
-            for chunk in split_long_message(response):
-                self._send_message(user_id, chunk)
+            self._send_message(user_id, response)
         except Exception as e:
             logger.error(f"Error in !ask: {e}")
             self._send_message(user_id, "⚠️ Failed to answer question. Please try again.")
@@ -523,21 +564,7 @@ Provide a clear, concise summary. Remember: no names, no quotes, use general ter
         Args:
             user_id: User's Signal UUID or phone number
         """
-        help_text = """📖 DM Commands
-
-📋 !help - Show this help
-📊 !status - Show bot status
-📝 !summary - Summarize and clear history
-📝 !summarize [text] - Summarize provided text (not stored)
-🔍 !ask [question] - Ask about conversation history
-⏰ !retention - View your retention period
-⏰ !retention [hours] - Set retention (1-168h)
-🗑️ !!!purge - Delete all conversation history
-
-💬 Chat normally or paste text to summarize!
-📖 Docs: https://next.maidan.cloud/apps/collectives/p/SCXCe4p3RDexBZC/Privacy-Summarizer-Docs-4"""
-
-        self._send_message(user_id, help_text)
+        self._send_message(user_id, self.HELP_TEXT)
 
     def _send_status(self, user_id: str) -> None:
         """Send status message with current state.
@@ -546,8 +573,9 @@ Provide a clear, concise summary. Remember: no names, no quotes, use general ter
             user_id: User's Signal UUID or phone number
         """
         # Check Ollama status
-        service_status = "Online" if self.ollama.is_available() else "Offline"
-        status_emoji = "✅" if self.ollama.is_available() else "❌"
+        available = self.ollama.is_available()
+        service_status = "Online" if available else "Offline"
+        status_emoji = "✅" if available else "❌"
 
         # Get message count for this user
         message_count = self.db.get_dm_message_count(user_id)
@@ -571,13 +599,7 @@ Use !retention [hours] to change (1-168)."""
         Args:
             user_id: User's Signal UUID or phone number
         """
-        self._send_message(
-            user_id,
-            "Message received! DM conversations are paused right now, "
-            "but I've saved your message. I'll be able to respond when "
-            "the service is back online.\n\n"
-            "Commands still work: !help, !status, !summary, !!!purge"
-        )
+        self._send_message(user_id, self.DISABLED_MESSAGE)
 
     def _send_ollama_offline(self, user_id: str) -> None:
         """Send message when Ollama is offline.
@@ -585,13 +607,7 @@ Use !retention [hours] to change (1-168)."""
         Args:
             user_id: User's Signal UUID or phone number
         """
-        self._send_message(
-            user_id,
-            "Message received! The AI service is temporarily offline, "
-            "but I've saved your message. I'll be able to respond when "
-            "it's back up.\n\n"
-            "Commands still work: !help, !status, !summary, !!!purge"
-        )
+        self._send_message(user_id, self.OLLAMA_OFFLINE_MESSAGE)
 
     def _send_message(self, user_id: str, message: str) -> None:
         """Send a message to a user, splitting if necessary.
@@ -600,8 +616,11 @@ Use !retention [hours] to change (1-168)."""
             user_id: Recipient's Signal UUID or phone number
             message: Message text
         """
-        # Split long messages for Signal's limit
-        parts = split_long_message(message)
+        # Most replies fit in one message; only longer ones go through the splitter
+        if len(message) <= SIGNAL_MAX_MESSAGE_LENGTH:
+            parts = (message,)
+        else:
+            parts = split_long_message(message)
 
         for part in parts:
             try:
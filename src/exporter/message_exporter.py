@@ -12,7 +12,8 @@ from typing import List, Dict, Any, Optional, Tuple
 from ..signal.cli_wrapper import SignalCLI, SignalCLIException
 from ..utils.timezone import now_in_timezone
 from ..database.repository import DatabaseRepository
-from ..database.models import Message
+from ..database.models import Message, message_identity_hash
+from ..database.writer import MessageWriter
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +29,10 @@ class MessageCollector:
     for one group would lose messages for other groups.
     """
 
+    # Identity hashes of recently stored envelopes are remembered across
+    # receive calls, in two generations of up to this many keys each
+    RECENT_KEYS_MAX = 50_000
+
     def __init__(
         self,
         signal_cli: SignalCLI,
@@ -44,6 +49,10 @@ class MessageCollector:
         self.signal_cli = signal_cli
         self.db_repo = db_repo
         self.dm_handler = dm_handler
+        self._recent_keys = set()
+        self._previous_keys = set()
+        # Groups first seen in messages, awaiting a sync for their real metadata
+        self._unknown_groups = set()
 
     def sync_groups(self) -> int:
         """Sync group metadata only (no members/users stored).
@@ -54,22 +63,16 @@ class MessageCollector:
         logger.info("Syncing group metadata from Signal...")
         groups = self.signal_cli.list_groups()
 
-        group_count = 0
-
-        for group in groups:
-            group_id = group.get("id")
-            name = group.get("name", "Unknown Group")
-            description = group.get("description", "")
-
-            if group_id:
-                # Sync only group metadata (no member storage)
-                self.db_repo.create_group(
-                    group_id=group_id,
-                    name=name,
-                    description=description
-                )
-                group_count += 1
-                logger.debug(f"Synced group: {name} ({group_id})")
+        # Sync only group metadata (no member storage), in one transaction
+        group_count = self.db_repo.upsert_groups([
+            {
+                "group_id": group["id"],
+                "name": group.get("name", "Unknown Group"),
+                "description": group.get("description", "")
+            }
+            for group in groups
+            if group.get("id")
+        ])
 
         logger.info(f"Synced {group_count} groups")
         return group_count
@@ -106,7 +109,6 @@ class MessageCollector:
 
         total_received = 0
         total_stored = 0
-        seen_message_keys = set()
 
         for attempt in range(1, max_attempts + 1):
             logger.info(f"Collection attempt {attempt}/{max_attempts}...")
@@ -115,20 +117,7 @@ class MessageCollector:
                 envelopes = self.signal_cli.receive_messages(timeout=timeout)
                 logger.debug(f"Attempt {attempt}: received {len(envelopes)} envelopes")
 
-                attempt_received = 0
-                attempt_stored = 0
-
-                for envelope_wrapper in envelopes:
-                    try:
-                        result = self._process_envelope(envelope_wrapper, seen_message_keys)
-                        if result:
-                            attempt_received += 1
-                            if result.get('is_new'):
-                                attempt_stored += 1
-
-                    except Exception as e:
-                        logger.error(f"Error processing envelope: {e}")
-                        continue
+                attempt_received, attempt_stored = self._store_envelopes(envelopes)
 
                 total_received += attempt_received
                 total_stored += attempt_stored
@@ -165,21 +154,7 @@ class MessageCollector:
             envelopes = self.signal_cli.receive_messages(timeout=timeout)
             logger.info(f"Received {len(envelopes)} envelopes")
 
-            total_received = 0
-            total_stored = 0
-            seen_keys = set()
-
-            for envelope_wrapper in envelopes:
-                try:
-                    result = self._process_envelope(envelope_wrapper, seen_keys)
-                    if result:
-                        total_received += 1
-                        if result.get('is_new'):
-                            total_stored += 1
-
-                except Exception as e:
-                    logger.error(f"Error processing envelope: {e}")
-                    continue
+            total_received, total_stored = self._store_envelopes(envelopes)
 
             logger.info(f"Collected {total_received} messages, {total_stored} new stored")
             return total_received, total_stored
@@ -188,16 +163,93 @@ class MessageCollector:
             logger.error(f"Error receiving messages: {e}")
             return 0, 0
 
+    def _store_envelopes(self, envelopes: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """Process one receive batch, writing its messages in batched transactions.
+
+        Envelopes from earlier batches are deduplicated through the remembered
+        keys, which only ever hold batches that were written successfully.
+
+        Args:
+            envelopes: Raw envelopes from signal-cli
+
+        Returns:
+            Tuple of (messages received, new messages/reactions stored)
+        """
+        received = 0
+        stored = 0
+        # Keys of envelopes stored or buffered by this batch
+        seen_keys = set()
+        # Groups confirmed to exist, so each is looked up once per batch
+        known_groups = set()
+
+        # Large batches are still split into transactions of writer.batch_size rows.
+        # A failed mid-batch flush keeps its rows buffered for the final one
+        writer = MessageWriter(self.db_repo, flush_interval=float('inf'))
+        for envelope_wrapper in envelopes:
+            try:
+                result = self._process_envelope(envelope_wrapper, seen_keys, writer, known_groups)
+                if result:
+                    received += 1
+                    if result.get('is_new'):
+                        stored += 1
+
+            except Exception as e:
+                logger.error(f"Error processing envelope: {e}")
+                continue
+
+        try:
+            writer.flush()
+        except Exception as e:
+            # Nothing is remembered, so replays of the unwritten envelopes are stored later
+            logger.error(f"Error writing {writer.pending} buffered messages: {e}")
+            return received, stored + writer.messages_stored
+
+        # One sync fills in metadata for every group first seen in this batch
+        if self._unknown_groups:
+            try:
+                self.sync_groups()
+                self._unknown_groups.clear()
+            except SignalCLIException as e:
+                logger.warning(f"Could not sync {len(self._unknown_groups)} new groups: {e}")
+
+        # Every key in seen_keys is now written: envelopes are only marked
+        # seen once stored or buffered, and the buffer has been flushed
+        self._remember_keys(seen_keys)
+        return received, stored + writer.messages_stored
+
+    def _remember_keys(self, keys: set) -> None:
+        """Remember processed envelope keys for later receive calls.
+
+        When the current generation outgrows RECENT_KEYS_MAX it becomes the
+        previous one and the oldest generation is dropped, bounding memory
+        while keeping at least RECENT_KEYS_MAX of the latest keys.
+
+        Args:
+            keys: Envelope keys processed by the batch just written
+        """
+        self._recent_keys |= keys
+        if len(self._recent_keys) > self.RECENT_KEYS_MAX:
+            self._previous_keys, self._recent_keys = self._recent_keys, set()
+
+    def _is_known_key(self, key: int, seen_keys: set) -> bool:
+        """Check whether an envelope was already processed this call or recently."""
+        return key in seen_keys or key in self._recent_keys or key in self._previous_keys
+
     def _process_envelope(
         self,
         envelope_wrapper: Dict[str, Any],
-        seen_keys: set
+        seen_keys: set,
+        writer: Optional[MessageWriter] = None,
+        known_groups: Optional[set] = None
     ) -> Optional[Dict[str, Any]]:
         """Process a single envelope and store message/reaction if applicable.
 
         Args:
             envelope_wrapper: Raw envelope from signal-cli
             seen_keys: Set of already-seen message keys for deduplication
+            writer: Optional writer to buffer messages in instead of storing them one by one
+            known_groups: Optional set of group IDs already found in the database;
+                groups found here are added to it
 
         Returns:
             Dict with 'is_new' key if message was processed, None if skipped
@@ -246,23 +298,24 @@ class MessageCollector:
         if not group_id:
             return None
 
-        # Ensure group exists in database
-        group = self.db_repo.get_group_by_id(group_id)
-        if not group:
-            self.sync_groups()
-            group = self.db_repo.get_group_by_id(group_id)
+        # Ensure group exists in database. A new group gets a placeholder row
+        # now; its metadata comes from a single sync at the end of the batch
+        if known_groups is None or group_id not in known_groups:
+            if not self.db_repo.get_group_by_id(group_id):
+                logger.info(f"New group {group_id[:20]}..., syncing metadata after this batch")
+                self.db_repo.create_group(group_id=group_id, name="Unknown Group", description="")
+                self._unknown_groups.add(group_id)
 
-        if not group:
-            logger.warning(f"Could not find group: {group_id}")
-            return None
+            if known_groups is not None:
+                known_groups.add(group_id)
 
         # Check for reaction
         reaction = data_message.get("reaction")
         if reaction:
-            return self._process_reaction(reaction, sender_id, timestamp_ms, group_id, seen_keys)
+            return self._process_reaction(reaction, sender_id, timestamp_ms, group_id, seen_keys, writer)
 
         # Process regular message
-        return self._process_message(data_message, sender_id, timestamp_ms, group_id, seen_keys)
+        return self._process_message(data_message, sender_id, timestamp_ms, group_id, seen_keys, writer)
 
     def _process_message(
         self,
@@ -270,7 +323,8 @@ class MessageCollector:
         sender_id: str,
         timestamp_ms: int,
         group_id: str,
-        seen_keys: set
+        seen_keys: set,
+        writer: Optional[MessageWriter] = None
     ) -> Optional[Dict[str, Any]]:
         """Process and store a message.
 
@@ -280,21 +334,21 @@ class MessageCollector:
             timestamp_ms: Message timestamp in milliseconds
             group_id: Signal group ID
             seen_keys: Set of seen message keys for deduplication
+            writer: Optional writer to buffer the message in; it is then
+                counted by writer.messages_stored once flushed
 
         Returns:
-            Dict with 'is_new' key, or None if skipped
+            Dict with 'is_new' key (absent if buffered), or None if skipped
         """
-        # Create unique message key for deduplication
-        message_key = (timestamp_ms, sender_id, group_id)
+        # Dedup on the same 64-bit identity hash the database uses: a small
+        # int is cheaper to hash and store than a tuple of long strings
+        message_key = message_identity_hash(timestamp_ms, sender_id, group_id)
 
-        # Skip if we've seen this message before in this session
-        if message_key in seen_keys:
-            logger.debug(f"Skipping duplicate message: {message_key}")
+        # Skip if we've seen this message before in this session or a recent one
+        if self._is_known_key(message_key, seen_keys):
+            logger.debug(f"Skipping duplicate message at {timestamp_ms} in group {group_id}")
             return None
 
-        # Mark as seen
-        seen_keys.add(message_key)
-
         # Extract message content
         message_text = data_message.get("message", "")
 
@@ -302,17 +356,20 @@ class MessageCollector:
         expires_in_seconds = data_message.get("expiresInSeconds", 0)
 
         # Only auto-update retention if group is set to follow Signal's setting
-        settings = self.db_repo.get_group_settings(group_id)
-        if settings is None or settings.source == "signal":
-            if expires_in_seconds > 0:
-                retention_hours = max(1, expires_in_seconds // 3600)
-            else:
-                retention_hours = 48  # Default when no disappearing messages
-
-            current = self.db_repo.get_group_retention_hours(group_id)
-            if retention_hours != current:
-                self.db_repo.set_group_retention_hours(group_id, retention_hours, source="signal")
-                logger.info(f"Auto-set retention for {group_id[:20]}... to {retention_hours}h from Signal")
+        retention_hours = self.db_repo.sync_signal_retention(group_id, expires_in_seconds)
+        if retention_hours is not None:
+            logger.info(f"Auto-set retention for {group_id[:20]}... to {retention_hours}h from Signal")
+
+        if writer is not None:
+            writer.add_message(
+                signal_timestamp=timestamp_ms,
+                sender_uuid=sender_id,
+                group_id=group_id,
+                content=message_text
+            )
+            # Marked seen only once buffered (or stored, below), so a failure retries it
+            seen_keys.add(message_key)
+            return {'buffered': True}
 
         # Store message in database
         message, is_new = self.db_repo.store_message(
@@ -321,11 +378,12 @@ class MessageCollector:
             group_id=group_id,
             content=message_text
         )
+        seen_keys.add(message_key)
 
         if is_new:
             logger.debug(f"Stored new message in group {group_id} at {timestamp_ms}")
         else:
-            logger.debug(f"Message already exists: {message_key}")
+            logger.debug(f"Message already exists at {timestamp_ms} in group {group_id}")
 
         return {'is_new': is_new, 'message_id': message.id}
 
@@ -335,7 +393,8 @@ class MessageCollector:
         reactor_id: str,
         timestamp_ms: int,
         group_id: str,
-        seen_keys: set
+        seen_keys: set,
+        writer: Optional[MessageWriter] = None
     ) -> Optional[Dict[str, Any]]:
         """Process and store a reaction.
 
@@ -345,6 +404,8 @@ class MessageCollector:
             timestamp_ms: Reaction timestamp in milliseconds
             group_id: Signal group ID
             seen_keys: Set of seen reaction keys for deduplication
+            writer: Optional writer holding buffered messages, flushed first
+                so a target from the same batch can be found
 
         Returns:
             Dict with 'is_new' key, or None if skipped
@@ -356,37 +417,36 @@ class MessageCollector:
         if not emoji or not target_timestamp:
             return None
 
-        # Create unique reaction key for deduplication
-        reaction_key = ('reaction', timestamp_ms, reactor_id, group_id)
+        # Create unique reaction key for deduplication. It shares the message
+        # key space: a sender's envelope timestamps are unique, so a reaction
+        # and a message never have the same (timestamp, sender, group)
+        reaction_key = message_identity_hash(timestamp_ms, reactor_id, group_id)
 
-        if reaction_key in seen_keys:
+        if self._is_known_key(reaction_key, seen_keys):
             return None
 
-        seen_keys.add(reaction_key)
+        if writer is not None and writer.pending:
+            writer.flush()
 
-        # Find the target message in our database
-        # We need to find by timestamp and group
-        messages = self.db_repo.get_messages_for_group(group_id)
-        target_message = None
-        for msg in messages:
-            if msg.signal_timestamp == target_timestamp:
-                target_message = msg
-                break
+        # Find the target message in our database by group and timestamp
+        target_message_id = self.db_repo.get_message_id_by_timestamp(group_id, target_timestamp)
 
-        if not target_message:
+        if target_message_id is None:
             logger.debug(f"Reaction target message not found: {target_timestamp}")
             return None
 
         # Store the reaction
         _, is_new = self.db_repo.store_reaction(
-            message_id=target_message.id,
+            message_id=target_message_id,
             emoji=emoji,
             reactor_uuid=reactor_id,
             timestamp=timestamp_ms
         )
+        # Marked seen only once stored, so a reaction whose target is missing is retried
+        seen_keys.add(reaction_key)
 
         if is_new:
-            logger.debug(f"Stored reaction {emoji} on message {target_message.id}")
+            logger.debug(f"Stored reaction {emoji} on message {target_message_id}")
 
         return {'is_new': is_new}
 
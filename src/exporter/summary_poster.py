@@ -5,7 +5,7 @@ Updated to use database-backed message storage instead of transient processing.
 
 import logging
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, List, Optional
 
 from ..ai.summarizer import ChatSummarizer
@@ -83,16 +83,19 @@ class SummaryPoster:
                 f"(source: {schedule.source_group.name}, target: {schedule.target_group.name})"
             )
 
-            # Calculate time window
+            # Calculate time window (naive UTC datetimes for the run record,
+            # epoch milliseconds for the signal_timestamp query)
             end_time = datetime.utcnow()
             start_time = end_time - timedelta(hours=schedule.summary_period_hours)
             period_description = f"Last {schedule.summary_period_hours} hours"
+            until_ms = int(end_time.replace(tzinfo=timezone.utc).timestamp() * 1000)
+            since_ms = until_ms - schedule.summary_period_hours * 3600 * 1000
 
             # Get messages from database with reaction data for AI context
             messages_with_reactions = self.db_repo.get_messages_with_reactions_for_group(
                 group_id=schedule.source_group.group_id,
-                since=start_time,
-                until=end_time
+                since_ms=since_ms,
+                until_ms=until_ms
             )
 
             logger.info(f"Found {len(messages_with_reactions)} messages in database for time window")
@@ -136,49 +136,43 @@ class ExportScheduler:
         total_purged = 0
 
         try:
-            # Track which groups have been processed
-            processed_groups = set()
+            # Resolve every group's cutoff first, then delete all groups together
+            # (SQLite has a single writer, so shared chunked commits beat N concurrent ones)
+            now = datetime.utcnow()
+            cutoffs = {}
+            retention_by_group = {}
 
-            # 1. First, purge groups with explicit GroupSettings
+            # 1. First, groups with explicit GroupSettings
             group_retention = self.db_repo.get_all_group_retention_settings()
             for group_id, retention_hours in group_retention.items():
-                cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
-                purged = self.db_repo.purge_messages_for_group(group_id, before=cutoff)
-                if purged > 0:
-                    logger.debug(f"Purged {purged} messages for group (retention: {retention_hours}h)")
-                total_purged += purged
-                processed_groups.add(group_id)
+                cutoffs[group_id] = now - timedelta(hours=retention_hours)
+                retention_by_group[group_id] = f"retention: {retention_hours}h"
 
-            # 2. Purge groups with schedules (if not already processed)
+            # 2. Groups with schedules (if not already covered)
             schedules = self.db_repo.get_enabled_scheduled_summaries()
             for schedule in schedules:
                 group_id = schedule.source_group.group_id
-                if group_id in processed_groups:
+                if group_id in cutoffs:
                     continue
 
                 retention_hours = getattr(schedule, 'retention_hours', self.default_message_retention_hours)
-                cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
-
-                purged = self.db_repo.purge_messages_for_group(
-                    group_id=group_id,
-                    before=cutoff
+                cutoffs[group_id] = now - timedelta(hours=retention_hours)
+                retention_by_group[group_id] = (
+                    f"'{schedule.source_group.name}', schedule retention: {retention_hours}h"
                 )
 
-                if purged > 0:
-                    logger.debug(
-                        f"Purged {purged} messages for '{schedule.source_group.name}' "
-                        f"(schedule retention: {retention_hours}h)"
-                    )
-
-                total_purged += purged
-                processed_groups.add(group_id)
-
-            # 3. Purge remaining groups with global default
+            # 3. Remaining groups with global default
             all_stats = self.db_repo.get_pending_stats()
             for group_id in all_stats.get('messages_by_group', {}).keys():
-                if group_id not in processed_groups:
-                    cutoff = datetime.utcnow() - timedelta(hours=self.default_message_retention_hours)
-                    purged = self.db_repo.purge_messages_for_group(group_id, before=cutoff)
+                if group_id not in cutoffs:
+                    cutoffs[group_id] = now - timedelta(hours=self.default_message_retention_hours)
+                    retention_by_group[group_id] = f"default retention: {self.default_message_retention_hours}h"
+
+            if cutoffs:
+                purged_by_group = self.db_repo.purge_messages_for_groups(cutoffs)
+                for group_id, purged in purged_by_group.items():
+                    if purged > 0:
+                        logger.debug(f"Purged {purged} messages for group ({retention_by_group[group_id]})")
                     total_purged += purged
 
             # 4. Purge expired DM messages (respecting per-user retention settings)
@@ -193,10 +187,9 @@ class ExportScheduler:
     def _purge_dm_messages_with_user_settings(self) -> int:
         """Purge DM messages respecting per-user retention settings.
 
-        For each user with DM messages:
-        - Check if they have a custom retention setting
-        - If yes, use their setting
-        - If no, use the global dm_retention_hours default
+        Users with a custom retention setting use it; everyone else uses
+        the global dm_retention_hours default. All users are purged in one
+        DELETE.
 
         Returns:
             Total number of messages purged
@@ -204,21 +197,10 @@ class ExportScheduler:
         total_purged = 0
 
         try:
-            # Get all unique user IDs with DM messages
-            user_ids = self.db_repo.get_dm_user_ids()
-
-            # Get all custom retention settings
-            custom_settings = self.db_repo.get_all_dm_retention_settings()
-
-            for user_id in user_ids:
-                # Get retention hours (custom or default)
-                retention_hours = custom_settings.get(user_id, self.dm_retention_hours)
-                cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
-
-                purged = self.db_repo.purge_dm_messages_for_user(user_id, before=cutoff)
-                if purged > 0:
-                    logger.info(f"Purged {purged} DM messages for {user_id[:8]}... (retention: {retention_hours}h)")
-                    total_purged += purged
+            purged_by_user = self.db_repo.purge_expired_dm_messages_by_retention(self.dm_retention_hours)
+            for user_id, purged in purged_by_user.items():
+                logger.info(f"Purged {purged} DM messages for {user_id[:8]}...")
+                total_purged += purged
 
         except Exception as e:
             logger.error(f"Error purging DM messages: {e}", exc_info=True)
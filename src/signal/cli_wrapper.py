@@ -143,7 +143,10 @@ class SignalCLI:
             output = self._run_command([
                 "receive",
                 "--timeout", str(timeout),
-                "--trust-new-identities", "always"  # Auto-accept message requests (for bot accounts)
+                "--trust-new-identities", "always",  # Auto-accept message requests (for bot accounts)
+                # Only message text is stored; don't download attachments or stories
+                "--ignore-attachments",
+                "--ignore-stories"
             ], json_output=True)
 
             if not output or output.strip() == "":
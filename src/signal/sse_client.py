@@ -54,6 +54,10 @@ class SignalSSEClient:
         self._thread: Optional[threading.Thread] = None
         self._request_id = 0
         self._rpc_lock = threading.Lock()
+        # Keep-alive session for RPC calls: the parts of a split message (and
+        # the reactions around it) reuse one connection instead of each
+        # opening its own. The SSE stream keeps a separate connection.
+        self._rpc_session = requests.Session()
 
     # =========================================================================
     # JSON-RPC methods (for sending messages, reactions, etc.)
@@ -83,7 +87,7 @@ class SignalSSEClient:
         if params:
             payload["params"] = params
 
-        response = requests.post(self.base_url, json=payload, timeout=30)
+        response = self._rpc_session.post(self.base_url, json=payload, timeout=30)
         response.raise_for_status()
         result = response.json()
 
@@ -281,4 +285,6 @@ class SignalSSEClient:
         self._running = False
         if self._thread:
             self._thread.join(timeout=5)
+        # Release the pooled keep-alive RPC connection
+        self._rpc_session.close()
         logger.info("SSE streaming stopped")
@@ -123,6 +123,18 @@ class TestReceiveMessages:
         assert len(result) == 2
         assert result[0]["envelope"]["timestamp"] == 1234567890
 
+    @patch('subprocess.run')
+    def test_skips_attachments_and_stories(self, mock_run):
+        """Receive doesn't download attachments or stories."""
+        mock_run.return_value = MagicMock(stdout="", returncode=0)
+
+        cli = SignalCLI("+15551234567")
+        cli.receive_messages()
+
+        cmd = mock_run.call_args.args[0]
+        assert "--ignore-attachments" in cmd
+        assert "--ignore-stories" in cmd
+
     @patch('subprocess.run')
     def test_empty_output(self, mock_run):
         """Returns empty list for empty output."""
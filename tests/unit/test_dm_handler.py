@@ -73,6 +73,16 @@ class TestIntentDetection:
         assert handler._detect_intent("summarize the conversation") == "summarize_conversation"
         assert handler._detect_intent("summarize our conversation") == "summarize_conversation"
         assert handler._detect_intent("summarize chat") == "summarize_conversation"
+        # The shortest phrase still matches on its own
+        assert handler._detect_intent("TLDR chat") == "summarize_conversation"
+
+    def test_detect_conversation_phrase_takes_priority(self):
+        """A conversation phrase anywhere in a message wins over the text rules."""
+        handler = DMHandler(MagicMock(), MagicMock(), MagicMock())
+
+        message = "Line\n" * 300 + "Then TLDR Chat please"
+
+        assert handler._detect_intent(message) == "summarize_conversation"
 
     def test_detect_summarize_long_text(self):
         """Long text with newlines triggers text summarization."""
@@ -183,6 +193,11 @@ class TestCommands:
         mock_ollama.generate.assert_called()  # Now uses generate with privacy prompt
         mock_db.purge_dm_messages.assert_called_with("+1234567890")
 
+        prompt = mock_ollama.generate.call_args.kwargs["prompt"]
+        assert prompt.endswith(
+            "Conversation:\nuser: Hello there\nassistant: Hi! How can I help?\n\nSummary:"
+        )
+
     def test_summary_command_empty_conversation(self):
         """!summary with no content sends appropriate message."""
         mock_ollama = MagicMock()
@@ -200,6 +215,45 @@ class TestCommands:
         call_args = mock_signal.send_message.call_args
         assert "No conversation" in call_args[1]['message']
 
+    def test_unknown_command_reacts_without_storing(self):
+        """An unrecognised ! command gets a ❓ reaction and is not stored or answered."""
+        mock_ollama = MagicMock()
+        mock_signal = MagicMock()
+        mock_db = MagicMock()
+
+        handler = DMHandler(mock_ollama, mock_signal, mock_db)
+        handler.handle_dm("+1234567890", "!summaryx", timestamp=1000)
+
+        mock_signal.send_reaction.assert_called_once_with("❓", "+1234567890", 1000, recipient="+1234567890")
+        mock_signal.send_message.assert_not_called()
+        mock_db.store_dm_message.assert_not_called()
+
+    def test_commands_match_case_insensitively(self):
+        """Command names match in any case; a longer message is not an exact command."""
+        mock_signal = MagicMock()
+        handler = DMHandler(MagicMock(), mock_signal, MagicMock())
+
+        handler.handle_dm("+1234567890", "!HELP")
+        assert "!status" in mock_signal.send_message.call_args.kwargs["message"]
+
+        mock_signal.reset_mock()
+        handler.handle_dm("+1234567890", "!help me with something long", timestamp=1000)
+        mock_signal.send_message.assert_not_called()
+        mock_signal.send_reaction.assert_called_once_with("❓", "+1234567890", 1000, recipient="+1234567890")
+
+    def test_failed_command_reacts_with_error(self):
+        """A command that raises gets a ❌ reaction."""
+        mock_signal = MagicMock()
+        mock_db = MagicMock()
+        mock_db.purge_dm_messages.side_effect = RuntimeError("db down")
+
+        handler = DMHandler(MagicMock(), mock_signal, mock_db)
+        with pytest.raises(RuntimeError):
+            handler.handle_dm("+1234567890", "!!!purge", timestamp=1000)
+
+        emojis = [c.args[0] for c in mock_signal.send_reaction.call_args_list]
+        assert emojis == ["👀", "❌"]
+
 
 class TestRetentionCommand:
     """Tests for !retention command."""
@@ -400,18 +454,11 @@ class TestChat:
         mock_signal = MagicMock()
         mock_db = MagicMock()
 
-        # Create mock history
-        mock_msg1 = MagicMock()
-        mock_msg1.role = "user"
-        mock_msg1.content = "Hi there"
-        mock_msg2 = MagicMock()
-        mock_msg2.role = "assistant"
-        mock_msg2.content = "Hello! How can I help?"
-        mock_msg3 = MagicMock()
-        mock_msg3.role = "user"
-        mock_msg3.content = "How are you?"
-
-        mock_db.get_dm_history.return_value = [mock_msg1, mock_msg2, mock_msg3]
+        mock_db.get_dm_chat_messages.return_value = [
+            {"role": "user", "content": "Hi there"},
+            {"role": "assistant", "content": "Hello! How can I help?"},
+            {"role": "user", "content": "How are you?"},
+        ]
 
         handler = DMHandler(mock_ollama, mock_signal, mock_db)
         handler.handle_dm("+1234567890", "How are you?")
@@ -423,7 +470,21 @@ class TestChat:
 
         # Should have system prompt + history
         assert messages[0]['role'] == 'system'
-        assert len(messages) >= 4  # system + 3 history messages
+        assert messages[1:] == mock_db.get_dm_chat_messages.return_value
+
+    def test_chat_history_bounded_by_input_budget(self):
+        """Chat reads only as much history as fits max_input_tokens."""
+        mock_ollama = MagicMock()
+        mock_ollama.is_available.return_value = True
+        mock_ollama.max_input_tokens = 1000
+        mock_ollama.chat.return_value = "Sure."
+        mock_db = MagicMock()
+        mock_db.get_dm_chat_messages.return_value = []
+
+        handler = DMHandler(mock_ollama, MagicMock(), mock_db)
+        handler.handle_dm("+1234567890", "Tell me more")
+
+        mock_db.get_dm_chat_messages.assert_called_once_with("+1234567890", max_chars=4000)
 
     def test_chat_stores_response(self):
         """Chat stores assistant response."""
@@ -448,6 +509,29 @@ class TestChat:
         assert calls[1][0][1] == "assistant"
         assert calls[1][0][2] == "The capital is Paris."
 
+    def test_chat_replies_before_storing_response(self):
+        """The reply is sent before it is stored, and a failed store doesn't add an error reply."""
+        mock_ollama = MagicMock()
+        mock_ollama.is_available.return_value = True
+        mock_ollama.chat.return_value = "The capital is Paris."
+        mock_signal = MagicMock()
+        mock_db = MagicMock()
+        mock_db.get_dm_chat_messages.return_value = []
+        events = []
+        mock_signal.send_message.side_effect = lambda **kw: events.append("send")
+
+        def store(user_id, role, *args):
+            if role == "assistant":
+                events.append("store")
+                raise RuntimeError("database is locked")
+        mock_db.store_dm_message.side_effect = store
+
+        handler = DMHandler(mock_ollama, mock_signal, mock_db)
+        handler.handle_dm("+1234567890", "What's the capital of France?")
+
+        assert events == ["send", "store"]
+        assert mock_signal.send_message.call_args.kwargs["message"] == "The capital is Paris."
+
 
 class TestSummarization:
     """Tests for summarization requests."""
@@ -468,6 +552,17 @@ class TestSummarization:
 
         mock_ollama.generate.assert_called()  # Now uses generate with privacy prompt
 
+    def test_summarize_request_strips_request_wording(self):
+        """Request wording is removed and the content keeps its original case."""
+        mock_ollama = MagicMock()
+        handler = DMHandler(mock_ollama, MagicMock(), MagicMock())
+        content = "The Quarterly Report covers Revenue, Hiring and the new Office plans."
+
+        handler._handle_summarize_request(f"Please SUMMARIZE this:\n\n{content}")
+
+        prompt = mock_ollama.generate.call_args.kwargs["prompt"]
+        assert f"Text:\n{content}\n" in prompt
+
 
 class TestSetEnabled:
     """Tests for set_enabled method."""
@@ -34,12 +34,17 @@ class TestSyncGroups:
             {"id": "group-2", "name": "Group Two", "description": ""},
         ]
         mock_repo = MagicMock(spec=DatabaseRepository)
+        mock_repo.upsert_groups.side_effect = len
 
         collector = MessageCollector(mock_cli, mock_repo)
         count = collector.sync_groups()
 
         assert count == 2
-        assert mock_repo.create_group.call_count == 2
+        mock_repo.upsert_groups.assert_called_once_with([
+            {"group_id": "group-1", "name": "Group One", "description": "First group"},
+            {"group_id": "group-2", "name": "Group Two", "description": ""},
+        ])
+        mock_repo.create_group.assert_not_called()
 
     def test_skips_groups_without_id(self):
         """Skips groups without group ID."""
@@ -49,6 +54,7 @@ class TestSyncGroups:
             {"name": "No ID Group"},  # Missing id
         ]
         mock_repo = MagicMock(spec=DatabaseRepository)
+        mock_repo.upsert_groups.side_effect = len
 
         collector = MessageCollector(mock_cli, mock_repo)
         count = collector.sync_groups()
@@ -76,13 +82,15 @@ class TestReceiveAndStoreMessages:
         ]
         mock_repo = MagicMock(spec=DatabaseRepository)
         mock_repo.get_group_by_id.return_value = MagicMock(group_id="group-abc")
-        mock_repo.store_message.return_value = (MagicMock(id=1), True)
+        mock_repo.write_batch.return_value = (1, 0)
 
         collector = MessageCollector(mock_cli, mock_repo)
         total, stored = collector.receive_and_store_messages(timeout=5, max_attempts=1)
 
-        assert stored >= 1
-        mock_repo.store_message.assert_called()
+        assert stored == 1
+        mock_repo.store_message.assert_not_called()
+        messages, reactions = mock_repo.write_batch.call_args.args
+        assert [m['content'] for m in messages] == ["Hello"]
 
     def test_deduplicates_messages(self):
         """Deduplicates messages across attempts."""
@@ -102,7 +110,7 @@ class TestReceiveAndStoreMessages:
         ]
         mock_repo = MagicMock(spec=DatabaseRepository)
         mock_repo.get_group_by_id.return_value = MagicMock(group_id="group-abc")
-        mock_repo.store_message.return_value = (MagicMock(id=1), False)  # Not new
+        mock_repo.write_batch.return_value = (0, 0)  # Not new
 
         collector = MessageCollector(mock_cli, mock_repo)
         total, stored = collector.receive_and_store_messages(timeout=5, max_attempts=2)
@@ -131,6 +139,156 @@ class TestReceiveAndStoreMessages:
         total, stored = collector.receive_and_store_messages(timeout=5, max_attempts=1)
 
         mock_repo.store_message.assert_not_called()
+        mock_repo.write_batch.assert_not_called()
+
+    def test_reaction_finds_target_from_same_batch(self):
+        """Buffered messages are flushed before a reaction looks up its target."""
+        mock_cli = MagicMock(spec=SignalCLI)
+        mock_cli.receive_messages.return_value = [
+            {
+                "envelope": {
+                    "timestamp": 1000,
+                    "sourceUuid": "uuid-sender",
+                    "dataMessage": {"message": "Hello", "groupInfo": {"groupId": "group-abc"}}
+                }
+            },
+            {
+                "envelope": {
+                    "timestamp": 2000,
+                    "sourceUuid": "uuid-reactor",
+                    "dataMessage": {
+                        "groupInfo": {"groupId": "group-abc"},
+                        "reaction": {"emoji": "👍", "targetSentTimestamp": 1000}
+                    }
+                }
+            }
+        ]
+        mock_repo = MagicMock(spec=DatabaseRepository)
+        mock_repo.get_group_by_id.return_value = MagicMock(group_id="group-abc")
+        mock_repo.write_batch.return_value = (1, 0)
+        mock_repo.get_message_id_by_timestamp.side_effect = lambda group_id, ts: (
+            1 if mock_repo.write_batch.called else None
+        )
+        mock_repo.store_reaction.return_value = (MagicMock(), True)
+
+        collector = MessageCollector(mock_cli, mock_repo)
+        total, stored = collector.receive_and_store_messages(timeout=5, max_attempts=1)
+
+        assert (total, stored) == (2, 2)
+        mock_repo.write_batch.assert_called_once()
+        mock_repo.store_reaction.assert_called_once()
+
+    def test_looks_up_each_group_once_per_batch(self):
+        """A group is checked in the database once, however many messages it has."""
+        mock_cli = MagicMock(spec=SignalCLI)
+        mock_cli.receive_messages.return_value = [
+            {
+                "envelope": {
+                    "timestamp": ts,
+                    "sourceUuid": "uuid-sender",
+                    "dataMessage": {"message": "Hello", "groupInfo": {"groupId": "group-abc"}}
+                }
+            }
+            for ts in (1000, 2000, 3000)
+        ]
+        mock_repo = MagicMock(spec=DatabaseRepository)
+        mock_repo.get_group_by_id.return_value = MagicMock(group_id="group-abc")
+        mock_repo.write_batch.return_value = (3, 0)
+
+        collector = MessageCollector(mock_cli, mock_repo)
+        total, stored = collector.receive_and_store_messages(timeout=5, max_attempts=1)
+
+        assert (total, stored) == (3, 3)
+        mock_repo.get_group_by_id.assert_called_once_with("group-abc")
+
+    def test_new_group_synced_once_after_batch(self):
+        """Messages from an unknown group are kept and trigger one sync at the end."""
+        mock_cli = MagicMock(spec=SignalCLI)
+        mock_cli.receive_messages.return_value = [
+            {
+                "envelope": {
+                    "timestamp": ts,
+                    "sourceUuid": "uuid-sender",
+                    "dataMessage": {"message": "Hello", "groupInfo": {"groupId": "group-new"}}
+                }
+            }
+            for ts in (1000, 2000)
+        ]
+        mock_cli.list_groups.return_value = [{"id": "group-new", "name": "New Group"}]
+        mock_repo = MagicMock(spec=DatabaseRepository)
+        mock_repo.get_group_by_id.return_value = None
+        mock_repo.write_batch.return_value = (2, 0)
+
+        collector = MessageCollector(mock_cli, mock_repo)
+        total, stored = collector.receive_and_store_messages(timeout=5, max_attempts=1)
+
+        assert (total, stored) == (2, 2)
+        mock_repo.create_group.assert_called_once_with(
+            group_id="group-new", name="Unknown Group", description=""
+        )
+        mock_cli.list_groups.assert_called_once()
+        mock_repo.upsert_groups.assert_called_once()
+
+    def test_skips_envelopes_stored_by_earlier_call(self):
+        """An envelope replayed in a later receive call is skipped before any DB write."""
+        mock_cli = MagicMock(spec=SignalCLI)
+        mock_cli.receive_messages.return_value = [
+            {
+                "envelope": {
+                    "timestamp": 1000,
+                    "sourceUuid": "uuid-sender",
+                    "dataMessage": {"message": "Hello", "groupInfo": {"groupId": "group-abc"}}
+                }
+            }
+        ]
+        mock_repo = MagicMock(spec=DatabaseRepository)
+        mock_repo.get_group_by_id.return_value = MagicMock(group_id="group-abc")
+        mock_repo.write_batch.return_value = (1, 0)
+
+        collector = MessageCollector(mock_cli, mock_repo)
+        collector.receive_and_store_messages(timeout=5, max_attempts=1)
+        total, stored = collector.receive_and_store_messages(timeout=5, max_attempts=1)
+
+        assert (total, stored) == (0, 0)
+        mock_repo.write_batch.assert_called_once()
+
+    def test_failed_write_not_remembered(self):
+        """Envelopes from a batch whose write failed are stored when replayed."""
+        mock_cli = MagicMock(spec=SignalCLI)
+        mock_cli.receive_messages.return_value = [
+            {
+                "envelope": {
+                    "timestamp": 1000,
+                    "sourceUuid": "uuid-sender",
+                    "dataMessage": {"message": "Hello", "groupInfo": {"groupId": "group-abc"}}
+                }
+            }
+        ]
+        mock_repo = MagicMock(spec=DatabaseRepository)
+        mock_repo.get_group_by_id.return_value = MagicMock(group_id="group-abc")
+        mock_repo.write_batch.side_effect = [RuntimeError("database is locked"), (1, 0)]
+
+        collector = MessageCollector(mock_cli, mock_repo)
+        first = collector.receive_and_store_messages(timeout=5, max_attempts=1)
+        second = collector.receive_and_store_messages(timeout=5, max_attempts=1)
+
+        assert first == (1, 0)
+        assert second == (1, 1)
+        assert mock_repo.write_batch.call_count == 2
+
+    def test_recent_keys_rotate_when_full(self):
+        """Remembered keys are kept in two bounded generations."""
+        collector = MessageCollector(MagicMock(spec=SignalCLI), MagicMock(spec=DatabaseRepository))
+        collector.RECENT_KEYS_MAX = 2
+
+        collector._remember_keys({1, 2})
+        collector._remember_keys({3})  # Current generation overflows and is rotated
+        collector._remember_keys({4})
+        collector._remember_keys({5, 6})  # Oldest generation is dropped
+
+        assert not collector._is_known_key(1, set())
+        assert collector._is_known_key(4, set())
+        assert collector._is_known_key(6, set())
 
     def test_handles_cli_error(self):
         """Handles SignalCLI errors gracefully."""
@@ -225,10 +383,7 @@ class TestProcessReaction:
         mock_repo = MagicMock(spec=DatabaseRepository)
 
         # Setup message to react to
-        mock_message = MagicMock()
-        mock_message.id = 42
-        mock_message.signal_timestamp = 1234567890000
-        mock_repo.get_messages_for_group.return_value = [mock_message]
+        mock_repo.get_message_id_by_timestamp.return_value = 42
         mock_repo.store_reaction.return_value = (MagicMock(), True)
 
         collector = MessageCollector(mock_cli, mock_repo)
@@ -249,13 +404,14 @@ class TestProcessReaction:
 
         assert result is not None
         assert result["is_new"] is True
-        mock_repo.store_reaction.assert_called_once()
+        mock_repo.get_message_id_by_timestamp.assert_called_once_with("group-abc", 1234567890000)
+        assert mock_repo.store_reaction.call_args.kwargs["message_id"] == 42
 
     def test_skips_reaction_without_target(self):
         """Skips reaction if target message not found."""
         mock_cli = MagicMock(spec=SignalCLI)
         mock_repo = MagicMock(spec=DatabaseRepository)
-        mock_repo.get_messages_for_group.return_value = []  # No messages
+        mock_repo.get_message_id_by_timestamp.return_value = None  # Not stored
 
         collector = MessageCollector(mock_cli, mock_repo)
 
@@ -298,13 +454,12 @@ class TestAutoRetentionFromSignal:
     """Tests for auto-retention from Signal's expiresInSeconds."""
 
     def test_auto_retention_from_signal_expiry(self):
-        """Sets retention from expiresInSeconds when > 0."""
+        """Passes expiresInSeconds on to the repository."""
         mock_cli = MagicMock(spec=SignalCLI)
         mock_repo = MagicMock(spec=DatabaseRepository)
         mock_repo.get_group_by_id.return_value = MagicMock(group_id="group-abc")
         mock_repo.store_message.return_value = (MagicMock(id=1), True)
-        mock_repo.get_group_settings.return_value = None  # No settings = use Signal
-        mock_repo.get_group_retention_hours.return_value = 48  # Current default
+        mock_repo.sync_signal_retention.return_value = 168
 
         collector = MessageCollector(mock_cli, mock_repo)
 
@@ -323,62 +478,22 @@ class TestAutoRetentionFromSignal:
             seen_keys=set()
         )
 
-        # Should set retention to 168 hours (1 week)
-        mock_repo.set_group_retention_hours.assert_called_once_with(
-            "group-abc", 168, source="signal"
-        )
+        mock_repo.sync_signal_retention.assert_called_once_with("group-abc", 604800)
+        mock_repo.store_message.assert_called_once()
 
     def test_auto_retention_default_no_expiry(self):
-        """Sets 48h default when expiresInSeconds is 0."""
-        mock_cli = MagicMock(spec=SignalCLI)
-        mock_repo = MagicMock(spec=DatabaseRepository)
-        mock_repo.get_group_by_id.return_value = MagicMock(group_id="group-abc")
-        mock_repo.store_message.return_value = (MagicMock(id=1), True)
-        mock_repo.get_group_settings.return_value = None  # No settings
-        mock_repo.get_group_retention_hours.return_value = 168  # Different from default
-
-        collector = MessageCollector(mock_cli, mock_repo)
-
-        # No disappearing messages
-        data_message = {
-            "message": "Test message",
-            "groupInfo": {"groupId": "group-abc"},
-            "expiresInSeconds": 0
-        }
-
-        collector._process_message(
-            data_message=data_message,
-            sender_id="uuid-sender",
-            timestamp_ms=1234567890000,
-            group_id="group-abc",
-            seen_keys=set()
-        )
-
-        # Should set retention to 48h default
-        mock_repo.set_group_retention_hours.assert_called_once_with(
-            "group-abc", 48, source="signal"
-        )
-
-    def test_auto_retention_skipped_source_command(self):
-        """Preserves user-set retention when source is 'command'."""
+        """Treats a missing expiresInSeconds as disappearing messages off."""
         mock_cli = MagicMock(spec=SignalCLI)
         mock_repo = MagicMock(spec=DatabaseRepository)
         mock_repo.get_group_by_id.return_value = MagicMock(group_id="group-abc")
         mock_repo.store_message.return_value = (MagicMock(id=1), True)
-
-        # User explicitly set retention via !retention command
-        mock_settings = MagicMock()
-        mock_settings.source = "command"
-        mock_settings.retention_hours = 72
-        mock_repo.get_group_settings.return_value = mock_settings
+        mock_repo.sync_signal_retention.return_value = None
 
         collector = MessageCollector(mock_cli, mock_repo)
 
-        # Signal has 1 week expiry, but user overrode with !retention
         data_message = {
             "message": "Test message",
-            "groupInfo": {"groupId": "group-abc"},
-            "expiresInSeconds": 604800  # 1 week
+            "groupInfo": {"groupId": "group-abc"}
         }
 
         collector._process_message(
@@ -389,5 +504,4 @@ class TestAutoRetentionFromSignal:
             seen_keys=set()
         )
 
-        # Should NOT update retention - user's choice is preserved
-        mock_repo.set_group_retention_hours.assert_not_called()
+        mock_repo.sync_signal_retention.assert_called_once_with("group-abc", 0)
@@ -4,7 +4,7 @@ import pytest
 from unittest.mock import patch, MagicMock
 import requests
 
-from src.ai.ollama_client import OllamaClient, OllamaException
+from src.ai.ollama_client import AVAILABILITY_CACHE_TTL, OllamaClient, OllamaException
 
 
 class TestOllamaClientInit:
@@ -109,6 +109,22 @@ class TestIsAvailable:
 
         assert client.is_available() is False
 
+    @patch('requests.get')
+    def test_result_reused_within_ttl(self, mock_get):
+        """Repeat checks within the TTL reuse the last probe."""
+        mock_get.return_value.status_code = 200
+        client = OllamaClient()
+
+        with patch('src.ai.ollama_client.time.monotonic', return_value=100.0):
+            assert client.is_available() is True
+            assert client.is_available() is True
+        assert mock_get.call_count == 1
+
+        mock_get.return_value.status_code = 500
+        with patch('src.ai.ollama_client.time.monotonic', return_value=100.0 + AVAILABILITY_CACHE_TTL):
+            assert client.is_available() is False
+        assert mock_get.call_count == 2
+
 
 class TestListModels:
     """Tests for list_models method."""
@@ -56,6 +56,36 @@ class TestGroupOperations:
         assert group.name == "Updated Name"
         assert group.description == "New Desc"
 
+    def test_create_group_upsert_keeps_row(self, repo):
+        """Updating a group keeps its row ID and creation time."""
+        original = repo.create_group("group-abc-123", "Original Name")
+        updated = repo.create_group("group-abc-123", "Updated Name")
+
+        assert updated.id == original.id
+        assert updated.created_at == original.created_at
+        assert updated.updated_at >= original.updated_at
+        assert len(repo.get_all_groups()) == 1
+
+    def test_upsert_groups(self, repo):
+        """Creates new groups and updates existing ones in one call."""
+        from src.utils.message_utils import anonymize_group_id
+        original = repo.create_group("group-1", "Original Name")
+
+        count = repo.upsert_groups([
+            {"group_id": "group-1", "name": "Renamed", "description": "Desc"},
+            {"group_id": "group-2", "name": "New Group", "description": ""},
+        ])
+
+        assert count == 2
+        updated = repo.get_group_by_id("group-1")
+        assert updated.id == original.id
+        assert updated.name == "Renamed"
+        assert updated.description == "Desc"
+        new_group = repo.get_group_by_id("group-2")
+        assert new_group.name == "New Group"
+        assert new_group.group_hash == anonymize_group_id("group-2")
+        assert repo.upsert_groups([]) == 0
+
     def test_get_group_by_id(self, repo):
         """Retrieves group by Signal group ID."""
         repo.create_group("group-xyz", "My Group")
@@ -77,6 +107,29 @@ class TestGroupOperations:
         groups = repo.get_all_groups()
         assert len(groups) == 2
 
+    def test_find_group_by_name_or_hash(self, repo):
+        """Finds groups by display hash or unique name, reporting ambiguity."""
+        from src.utils.message_utils import anonymize_group_id
+        repo.create_group("group-1", "Book Club")
+        repo.create_group("group-2", "Dupe")
+        repo.create_group("group-3", "Dupe")
+
+        group, error = repo.find_group_by_name_or_hash(anonymize_group_id("group-1").lower())
+        assert error is None
+        assert group.group_id == "group-1"
+
+        group, error = repo.find_group_by_name_or_hash("Book Club")
+        assert group.group_id == "group-1"
+
+        group, error = repo.find_group_by_name_or_hash("Dupe")
+        assert group is None
+        assert anonymize_group_id("group-2") in error
+        assert anonymize_group_id("group-3") in error
+
+        group, error = repo.find_group_by_name_or_hash("Missing")
+        assert group is None
+        assert "No group found" in error
+
 
 class TestMessageOperations:
     """Tests for message CRUD operations."""
@@ -118,6 +171,19 @@ class TestMessageOperations:
         assert is_new is False
         assert msg.content == "Original"
 
+    def test_sender_ids_round_trip(self, repo):
+        """UUID and non-UUID sender IDs come back exactly as stored."""
+        repo.store_message(1000, "6f1c2e4a-1b2c-4d5e-8f90-123456789abc", "g1", "From UUID")
+        repo.store_message(2000, "+15551234567", "g1", "From number")
+        repo.store_message(3000, "6F1C2E4A-1B2C-4D5E-8F90-123456789ABC", "g1", "Upper UUID")
+
+        senders = [m.sender_uuid for m in repo.get_messages_for_group("g1")]
+        assert senders == [
+            "6f1c2e4a-1b2c-4d5e-8f90-123456789abc",
+            "+15551234567",
+            "6F1C2E4A-1B2C-4D5E-8F90-123456789ABC",
+        ]
+
     def test_store_messages_batch(self, repo):
         """Stores multiple messages, returns new count."""
         messages = [
@@ -133,6 +199,111 @@ class TestMessageOperations:
         count2 = repo.store_messages_batch(messages)
         assert count2 == 0
 
+    def test_store_messages_batch_dedupes_within_batch(self, repo):
+        """Drops repeated rows inside a single batch."""
+        messages = [
+            {"signal_timestamp": 1000, "sender_uuid": "u1", "group_id": "g1", "content": "Msg 1"},
+            {"signal_timestamp": 1000, "sender_uuid": "u1", "group_id": "g1", "content": "Msg 1"},
+            {"signal_timestamp": 1000, "sender_uuid": "u2", "group_id": "g1", "content": "Other"},
+        ]
+
+        assert repo.store_messages_batch(messages) == 2
+        assert len(repo.get_messages_for_group("g1")) == 2
+
+    def test_store_messages_batch_spans_chunks(self, repo):
+        """Counts new rows across multi-row INSERT chunks."""
+        from src.database.repository import MESSAGE_INSERT_CHUNK_SIZE
+        repo.store_message(0, "u1", "g1", "Existing")
+        messages = [
+            {"signal_timestamp": ts, "sender_uuid": "u1", "group_id": "g1", "content": f"Msg {ts}"}
+            for ts in range(2 * MESSAGE_INSERT_CHUNK_SIZE + 10)
+        ]
+
+        assert repo.store_messages_batch(messages) == 2 * MESSAGE_INSERT_CHUNK_SIZE + 9
+        assert repo.get_message_count_by_group()["g1"] == 2 * MESSAGE_INSERT_CHUNK_SIZE + 10
+
+    def test_write_batch_messages_and_reactions(self, repo):
+        """Writes messages and reactions together, replacing a reactor's emoji."""
+        msg, _ = repo.store_message(1000, "u1", "g1", "Target")
+
+        new_messages, reactions = repo.write_batch(
+            [{"signal_timestamp": 2000, "sender_uuid": "u2", "group_id": "g1", "content": "Msg 2"}],
+            [
+                {"message_id": msg.id, "emoji": "👍", "reactor_uuid": "r1", "timestamp": 3000},
+                {"message_id": msg.id, "emoji": "❤️", "reactor_uuid": "r1", "timestamp": 4000},
+            ]
+        )
+
+        assert new_messages == 1
+        assert reactions == 2
+        result = repo.get_messages_with_reactions_for_group("g1")
+        assert result[0]['emojis'] == ["❤️"]
+
+    def test_write_batch_unchanged_reaction_not_rewritten(self, repo):
+        """Re-ingesting the same emoji leaves the existing reaction as it was."""
+        from src.database.models import Reaction
+
+        msg, _ = repo.store_message(1000, "u1", "g1", "Target")
+        repo.write_batch([], [{"message_id": msg.id, "emoji": "👍", "reactor_uuid": "r1", "timestamp": 3000}])
+        repo.write_batch([], [{"message_id": msg.id, "emoji": "👍", "reactor_uuid": "r1", "timestamp": 9000}])
+
+        with repo.get_session() as session:
+            reaction = session.query(Reaction).filter_by(message_id=msg.id).one()
+            assert reaction.timestamp == 3000
+
+    def test_write_batch_takes_write_lock_up_front(self, tmp_path):
+        """Batches run in a BEGIN IMMEDIATE transaction."""
+        repo = DatabaseRepository(str(tmp_path / "batch.db"), encryption_key="test_key_16_chars")
+        statements = []
+        with repo.engine.connect() as conn:
+            conn.connection.dbapi_connection.set_trace_callback(statements.append)
+
+        repo.write_batch([{"signal_timestamp": 1000, "sender_uuid": "u1", "group_id": "g1", "content": "Hi"}])
+
+        assert statements[0] == "BEGIN IMMEDIATE"
+        assert statements[-1] == "COMMIT"
+
+    def test_get_messages_with_reactions_aggregates(self, repo):
+        """Aggregates each message's reactions and skips empty messages."""
+        liked, _ = repo.store_message(1000, "u1", "g1", "Liked")
+        repo.store_message(2000, "u2", "g1", "Plain")
+        repo.store_message(3000, "u2", "g1", "")
+        repo.store_reaction(liked.id, "👍", "r1", 4000)
+        repo.store_reaction(liked.id, "❤️", "r2", 5000)
+
+        result = repo.get_messages_with_reactions_for_group("g1")
+
+        assert [m['content'] for m in result] == ["Liked", "Plain"]
+        assert result[0]['reaction_count'] == 2
+        assert sorted(result[0]['emojis']) == sorted(["👍", "❤️"])
+        assert result[1]['reaction_count'] == 0
+        assert result[1]['emojis'] == []
+        assert result[1]['sender_uuid'] == "u2"
+
+    def test_sender_delete_uses_group_sender_index(self, repo):
+        """Opt-out deletes find a sender's messages through idx_message_group_sender."""
+        from sqlalchemy import select
+        from src.database.models import Message
+        stmt = select(Message.id, Message.group_id).where(
+            Message.group_id == "g1", Message.sender_uuid == "u1"
+        ).compile(repo.engine)
+        params = tuple(stmt.params[name] for name in stmt.positiontup)
+        with repo.engine.connect() as conn:
+            plan = [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {stmt}", params)]
+
+        assert any("idx_message_group_sender" in step for step in plan)
+
+    def test_window_queries_read_in_index_order(self, repo):
+        """Message window queries walk idx_message_group_timestamp without sorting."""
+        from src.database import statements
+        stmt = statements.messages_in_window("g1", 1000, 2000).compile(repo.engine)
+        params = tuple(stmt.params[name] for name in stmt.positiontup)
+        with repo.engine.connect() as conn:
+            plan = [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {stmt}", params)]
+
+        assert any("idx_message_group_timestamp" in step for step in plan)
+        assert not any("TEMP B-TREE" in step for step in plan)
+
     def test_get_messages_for_group(self, repo):
         """Retrieves messages for a specific group."""
         repo.store_message(1000, "u1", "group-a", "Message A1")
@@ -152,13 +323,56 @@ class TestMessageOperations:
         repo.store_message(base_ts + 120000, "u1", "g1", "New message")   # +2 min
 
         # Filter for middle range (30s to 90s after base)
-        since = datetime.fromtimestamp((base_ts + 30000) / 1000)
-        until = datetime.fromtimestamp((base_ts + 90000) / 1000)
+        since = datetime.utcfromtimestamp((base_ts + 30000) / 1000)
+        until = datetime.utcfromtimestamp((base_ts + 90000) / 1000)
 
         messages = repo.get_messages_for_group("g1", since=since, until=until)
         assert len(messages) == 1
         assert messages[0].content == "Middle message"
 
+    def test_get_messages_with_ms_window(self, repo):
+        """Accepts the window directly as epoch milliseconds."""
+        base_ts = 1734100000000
+        repo.store_message(base_ts, "u1", "g1", "Old message")
+        repo.store_message(base_ts + 60000, "u1", "g1", "Middle message")
+        repo.store_message(base_ts + 120000, "u1", "g1", "New message")
+
+        messages = repo.get_messages_for_group("g1", since_ms=base_ts + 30000, until_ms=base_ts + 90000)
+        assert [m.content for m in messages] == ["Middle message"]
+
+        rows = repo.get_messages_with_reactions_for_group("g1", since_ms=base_ts + 60000)
+        assert [r["content"] for r in rows] == ["Middle message", "New message"]
+
+    def test_naive_datetime_window_is_utc(self, repo, monkeypatch):
+        """Naive datetime bounds match the ms window on a non-UTC host."""
+        import time
+        monkeypatch.setenv("TZ", "America/New_York")
+        time.tzset()
+        try:
+            now = datetime.utcnow()
+            now_ms = int(time.time() * 1000)
+            repo.store_message(now_ms - 600000, "u1", "g1", "Ten minutes ago")
+
+            by_datetime = repo.get_messages_for_group("g1", since=now - timedelta(hours=1))
+            by_ms = repo.get_messages_for_group("g1", since_ms=now_ms - 3600000)
+            assert [m.content for m in by_datetime] == [m.content for m in by_ms] == ["Ten minutes ago"]
+        finally:
+            monkeypatch.undo()
+            time.tzset()
+
+    def test_messages_with_reactions_rebinds_cached_statement(self, repo):
+        """Repeated window fetches use each call's own group and bounds."""
+        base_ts = 1734100000000
+        repo.store_message(base_ts, "u1", "g1", "G1 old")
+        repo.store_message(base_ts + 60000, "u1", "g1", "G1 new")
+        repo.store_message(base_ts, "u1", "g2", "G2 old")
+
+        since = datetime.utcfromtimestamp((base_ts + 30000) / 1000)
+
+        assert [m['content'] for m in repo.get_messages_with_reactions_for_group("g1", since=since)] == ["G1 new"]
+        assert [m['content'] for m in repo.get_messages_with_reactions_for_group("g2", since=since)] == []
+        assert [m['content'] for m in repo.get_messages_with_reactions_for_group("g2")] == ["G2 old"]
+
     def test_purge_messages_for_group(self, repo):
         """Deletes messages older than cutoff for specific group."""
         # Store messages with different received_at times
@@ -180,6 +394,55 @@ class TestMessageOperations:
         remaining = repo.get_messages_for_group("group-a")
         assert len(remaining) == 1
 
+    def test_purge_messages_for_groups(self, repo):
+        """Applies each group's own cutoff in one call."""
+        from src.database.models import Message
+        for ts, group_id in ((1000, "group-a"), (2000, "group-b"), (3000, "group-c")):
+            repo.store_message(ts, "u1", group_id, "Old")
+        with repo.get_session() as session:
+            session.query(Message).update({Message.received_at: datetime.utcnow() - timedelta(hours=30)})
+            session.commit()
+
+        now = datetime.utcnow()
+        purged = repo.purge_messages_for_groups({
+            "group-a": now - timedelta(hours=24),
+            "group-b": now - timedelta(hours=48),
+        })
+
+        assert purged == {"group-a": 1, "group-b": 0}
+        assert repo.get_messages_for_group("group-a") == []
+        assert len(repo.get_messages_for_group("group-b")) == 1
+        assert len(repo.get_messages_for_group("group-c")) == 1
+
+    def test_purge_deletes_in_chunks(self, repo):
+        """Deletes across several committed chunks, counting each group."""
+        from src.database import repository as repository_module
+        for ts in range(5):
+            msg, _ = repo.store_message(ts, "u1", "group-a", f"A{ts}")
+            repo.store_reaction(msg.id, "👍", "r1", 9000)
+        repo.store_message(100, "u1", "group-b", "B")
+
+        cutoff = datetime.utcnow() + timedelta(hours=1)
+        with patch.object(repository_module, 'PURGE_CHUNK_SIZE', 2):
+            purged = repo.purge_messages_for_groups({"group-a": cutoff, "group-b": cutoff})
+
+        assert purged == {"group-a": 5, "group-b": 1}
+        assert repo.get_message_count_by_group() == {}
+        with repo.get_session() as session:
+            from src.database.models import Reaction
+            assert session.query(Reaction).count() == 0
+
+    def test_purge_removes_reactions(self, repo):
+        """Purging messages also deletes their reactions."""
+        msg, _ = repo.store_message(1000, "u1", "group-a", "Msg")
+        repo.store_reaction(msg.id, "👍", "r1", 2000)
+
+        repo.purge_all_messages_for_group("group-a")
+
+        with repo.get_session() as session:
+            from src.database.models import Reaction
+            assert session.query(Reaction).count() == 0
+
     def test_purge_all_messages_for_group(self, repo):
         """Deletes all messages for a group."""
         repo.store_message(1000, "u1", "group-a", "Msg 1")
@@ -215,6 +478,14 @@ class TestReactionOperations:
         assert is_new is True
         assert reaction.emoji == "👍"
 
+    def test_get_message_id_by_timestamp(self, repo):
+        """Finds a reaction target by group and Signal timestamp."""
+        msg, _ = repo.store_message(1000, "u1", "g1", "Target")
+        repo.store_message(1000, "u2", "g2", "Other group")
+
+        assert repo.get_message_id_by_timestamp("g1", 1000) == msg.id
+        assert repo.get_message_id_by_timestamp("g1", 2000) is None
+
     def test_store_reaction_duplicate_updates(self, repo):
         """Updates existing reaction from same user."""
         msg, _ = repo.store_message(1000, "u1", "g1", "Target")
@@ -224,6 +495,42 @@ class TestReactionOperations:
 
         assert is_new is False
         assert reaction.emoji == "❤️"
+        assert reaction.timestamp == 3000
+
+    def test_store_reaction_same_emoji_unchanged(self, repo):
+        """Repeating the same reaction returns the stored row untouched."""
+        msg, _ = repo.store_message(1000, "u1", "g1", "Target")
+
+        first, _ = repo.store_reaction(msg.id, "👍", "reactor-1", 2000)
+        reaction, is_new = repo.store_reaction(msg.id, "👍", "reactor-1", 3000)
+
+        assert is_new is False
+        assert reaction.id == first.id
+        assert reaction.timestamp == 2000
+
+    def test_get_reaction_stats_for_group(self, repo):
+        """Counts reactions, reacted messages and emojis for one group."""
+        first, _ = repo.store_message(1000, "u1", "g1", "First")
+        second, _ = repo.store_message(2000, "u1", "g1", "Second")
+        other, _ = repo.store_message(3000, "u1", "g2", "Other group")
+        repo.store_reaction(first.id, "👍", "r1", 4000)
+        repo.store_reaction(first.id, "👍", "r2", 4001)
+        repo.store_reaction(first.id, "❤️", "r3", 4002)
+        repo.store_reaction(second.id, "👍", "r1", 4003)
+        repo.store_reaction(other.id, "😂", "r1", 4004)
+
+        stats = repo.get_reaction_stats_for_group("g1")
+
+        assert stats == {
+            'total_reactions': 4,
+            'messages_with_reactions': 2,
+            'emoji_counts': {"👍": 3, "❤️": 1}
+        }
+        assert repo.get_reaction_stats_for_group("empty") == {
+            'total_reactions': 0,
+            'messages_with_reactions': 0,
+            'emoji_counts': {}
+        }
 
 
 class TestScheduledSummaryOperations:
@@ -314,6 +621,50 @@ class TestScheduledSummaryOperations:
         # Should be gone
         assert repo.get_scheduled_summary_by_name("To Delete") is None
 
+    def test_delete_scheduled_summary_removes_runs(self, repo):
+        """Deleting a schedule clears its run history."""
+        from src.database.models import SummaryRun
+        source = repo.get_group_by_id("source-group")
+        target = repo.get_group_by_id("target-group")
+
+        schedule = repo.create_scheduled_summary(
+            name="With Runs",
+            source_group_id=source.id,
+            target_group_id=target.id,
+            schedule_times=["09:00", "18:00"]
+        )
+        for _ in range(3):
+            repo.create_summary_run(schedule.id)
+
+        assert repo.delete_scheduled_summary(schedule.id) is True
+        assert repo.delete_scheduled_summary(schedule.id) is False
+        with repo.get_session() as session:
+            assert session.query(SummaryRun).count() == 0
+
+    def test_update_scheduled_summary_last_run(self, repo):
+        """Stamps last_run, ignoring unknown schedule IDs."""
+        source = repo.get_group_by_id("source-group")
+        target = repo.get_group_by_id("target-group")
+        schedule = repo.create_scheduled_summary(
+            name="Daily", source_group_id=source.id, target_group_id=target.id,
+            schedule_times=["09:00"]
+        )
+        last_run = datetime(2024, 12, 13, 9, 0)
+
+        repo.update_scheduled_summary_last_run(schedule.id, last_run)
+        repo.update_scheduled_summary_last_run(schedule.id + 100, last_run)
+
+        assert repo.get_scheduled_summary_by_id(schedule.id).last_run == last_run
+
+    def test_enabled_schedules_use_partial_index(self, repo):
+        """The scheduler's enabled-schedules query searches idx_enabled_schedules."""
+        from src.database import statements
+        stmt = statements.enabled_schedules().compile(repo.engine)
+        with repo.engine.connect() as conn:
+            plan = [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {stmt}")]
+
+        assert "SEARCH scheduled_summaries USING INDEX idx_enabled_schedules (enabled=?)" in plan
+
 
 class TestSummaryRunOperations:
     """Tests for summary run lifecycle operations."""
@@ -382,6 +733,57 @@ class TestSummaryRunOperations:
         runs = repo.get_summary_runs_for_schedule(schedule.id, limit=3)
 
         assert len(runs) == 3
+        # Schedule is loaded with the runs, so it is usable after the session closes
+        assert all(run.schedule.name == schedule.name for run in runs)
+
+    def test_get_latest_run_status(self, repo_with_schedule):
+        """Returns the newest run's status from the covering index."""
+        from sqlalchemy import text
+        repo, schedule = repo_with_schedule
+        assert repo.get_latest_run_status(schedule.id) is None
+
+        repo.fail_summary_run(repo.create_summary_run(schedule.id).id, "boom")
+        latest = repo.create_summary_run(schedule.id)
+        now = datetime.utcnow()
+        repo.complete_summary_run(latest.id, 7, now - timedelta(hours=1), now)
+
+        started_at, status, message_count = repo.get_latest_run_status(schedule.id)
+        assert status == "completed"
+        assert message_count == 7
+
+        with repo.engine.connect() as conn:
+            plan = " ".join(row[3] for row in conn.execute(text(
+                "EXPLAIN QUERY PLAN SELECT started_at, status, message_count FROM summary_runs "
+                "WHERE schedule_id = 1 ORDER BY started_at DESC LIMIT 1"
+            )))
+        assert "COVERING INDEX idx_summary_run_cover" in plan
+
+
+class TestSmallIntEnum:
+    """Tests for the SmallIntEnum column type."""
+
+    def test_round_trip_and_validation(self):
+        """Maps values to codes and rejects unknown values."""
+        from src.database.models import SmallIntEnum
+        enum = SmallIntEnum(("pending", "completed", "failed"))
+
+        assert enum.process_bind_param("failed", None) == 2
+        assert enum.process_result_value(2, None) == "failed"
+        assert enum.process_result_value("1", None) == "completed"
+        with pytest.raises(ValueError, match="pending, completed, failed"):
+            enum.process_bind_param("running", None)
+
+    def test_values_part_of_cache_key(self):
+        """Types with different values never share a cached statement."""
+        from sqlalchemy import literal, select
+        from src.database.models import DM_ROLES, RUN_STATUSES, SmallIntEnum
+
+        assert RUN_STATUSES._static_cache_key != DM_ROLES._static_cache_key
+        assert (
+            select(literal("completed", RUN_STATUSES))._generate_cache_key()
+            != select(literal("assistant", DM_ROLES))._generate_cache_key()
+        )
+        assert SmallIntEnum(("user", "assistant"))._static_cache_key == DM_ROLES._static_cache_key
 
 
 class TestPendingStats:
@@ -409,6 +811,8 @@ class TestPendingStats:
         assert stats["total_messages"] == 3
         assert stats["messages_by_group"]["group-a"] == 2
         assert stats["messages_by_group"]["group-b"] == 1
+        assert isinstance(stats["oldest_message"], datetime)
+        assert stats["oldest_message"] <= stats["newest_message"]
 
 
 class TestDMRetentionSettings:
@@ -478,6 +882,8 @@ class TestDMMessageOperations:
         assert msg.user_id == "+1234567890"
         assert msg.role == "user"
         assert msg.content == "Hello!"
+        assert msg.id is not None
+        assert msg.created_at is not None
 
     def test_get_dm_history(self, repo):
         """Gets DM history in order."""
@@ -492,6 +898,34 @@ class TestDMMessageOperations:
         assert history[1].content == "Response"
         assert history[2].content == "Second"
 
+    def test_get_dm_history_tail(self, repo):
+        """Returns the newest messages that fit the limit or size budget, oldest first."""
+        for i in range(5):
+            repo.store_dm_message("+1234567890", "user", f"Message {i}")  # 9 chars each
+
+        assert [m.content for m in repo.get_dm_history_tail("+1234567890", limit=2)] == [
+            "Message 3", "Message 4"
+        ]
+        assert [m.content for m in repo.get_dm_history_tail("+1234567890", max_chars=20)] == [
+            "Message 3", "Message 4"
+        ]
+        # The newest message is returned even if it alone exceeds the budget
+        assert [m.content for m in repo.get_dm_history_tail("+1234567890", max_chars=1)] == ["Message 4"]
+        assert len(repo.get_dm_history_tail("+1234567890")) == 5
+
+    def test_get_dm_chat_messages(self, repo):
+        """Returns the newest history within budget as chat message dicts."""
+        repo.store_dm_message("+1234567890", "user", "Old question")
+        repo.store_dm_message("+1234567890", "user", "Question")
+        repo.store_dm_message("+1234567890", "assistant", "Answer")
+        repo.store_dm_message("+1111111111", "user", "Other user")
+
+        assert repo.get_dm_chat_messages("+1234567890", max_chars=14) == [
+            {"role": "user", "content": "Question"},
+            {"role": "assistant", "content": "Answer"},
+        ]
+        assert len(repo.get_dm_chat_messages("+1234567890", limit=1)) == 1
+
     def test_get_dm_history_per_user(self, repo):
         """Each user has separate history."""
         repo.store_dm_message("+1111111111", "user", "User 1 msg")
@@ -514,6 +948,25 @@ class TestDMMessageOperations:
         count = repo.get_dm_message_count("+1234567890")
         assert count == 3
 
+    def test_get_dm_stats(self, repo):
+        """Reports totals, distinct users and the time range in one query."""
+        assert repo.get_dm_stats() == {
+            'total_messages': 0,
+            'unique_users': 0,
+            'oldest_message': None,
+            'newest_message': None
+        }
+
+        first = repo.store_dm_message("+1111111111", "user", "One")
+        repo.store_dm_message("+1111111111", "assistant", "Two")
+        last = repo.store_dm_message("+2222222222", "user", "Three")
+
+        stats = repo.get_dm_stats()
+        assert stats['total_messages'] == 3
+        assert stats['unique_users'] == 2
+        assert stats['oldest_message'] == first.created_at
+        assert stats['newest_message'] == last.created_at
+
     def test_purge_dm_messages(self, repo):
         """Purges all messages for a user."""
         repo.store_dm_message("+1234567890", "user", "One")
@@ -536,6 +989,16 @@ class TestDMMessageOperations:
         assert "+1111111111" in user_ids
         assert "+2222222222" in user_ids
 
+    def test_get_dm_user_ids_seeks_index_per_user(self, repo):
+        """Distinct DM users are found by index seeks, not a table scan."""
+        from src.database import statements
+        stmt = statements.dm_user_ids().compile(repo.engine)
+        with repo.engine.connect() as conn:
+            plan = [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {stmt}")]
+
+        assert "SEARCH dm_conversations USING COVERING INDEX idx_dm_user_created (user_id>?)" in plan
+        assert not any(step.startswith("SCAN dm_conversations") for step in plan)
+
     def test_purge_dm_messages_for_user(self, repo):
         """Purges DM messages older than cutoff for specific user."""
         # Store messages
@@ -558,6 +1021,30 @@ class TestDMMessageOperations:
         assert len(remaining) == 1
         assert remaining[0].content == "New message"
 
+    def test_purge_expired_dm_messages_by_retention(self, repo):
+        """Purges every user's expired messages, using custom retention where set."""
+        from src.database.models import DMConversation
+
+        repo.set_dm_retention_hours("+1111111111", 12)
+        aged = [
+            repo.store_dm_message("+1111111111", "user", "24h old, custom 12h").id,
+            repo.store_dm_message("+2222222222", "user", "24h old, default 48h").id,
+            repo.store_dm_message("+2222222222", "user", "100h old, default 48h").id,
+        ]
+        repo.store_dm_message("+1111111111", "user", "New")
+
+        with repo.get_session() as session:
+            for msg_id, hours in zip(aged, (24, 24, 100)):
+                msg = session.get(DMConversation, msg_id)
+                msg.created_at = datetime.utcnow() - timedelta(hours=hours)
+            session.commit()
+
+        deleted = repo.purge_expired_dm_messages_by_retention(48)
+
+        assert deleted == {"+1111111111": 1, "+2222222222": 1}
+        assert [m.content for m in repo.get_dm_history("+1111111111")] == ["New"]
+        assert [m.content for m in repo.get_dm_history("+2222222222")] == ["24h old, default 48h"]
+
 
 class TestGroupSettingsOperations:
     """Tests for group retention settings operations."""
@@ -571,6 +1058,18 @@ class TestGroupSettingsOperations:
         hours = repo.get_group_retention_hours("group-abc-123")
         assert hours == 48
 
+    def test_settings_lookups_rebind_cached_statement(self, repo):
+        """Each group and user lookup binds its own key into the cached statement."""
+        repo.set_group_retention_hours("group-1", 24, source="command")
+        repo.set_group_retention_hours("group-2", 96, source="command")
+        repo.set_dm_retention_hours("+1111111111", 12)
+
+        assert repo.get_group_retention_hours("group-1") == 24
+        assert repo.get_group_retention_hours("group-2") == 96
+        assert repo.get_group_retention_hours("group-3") == 48
+        assert repo.get_dm_retention_hours("+1111111111") == 12
+        assert repo.get_dm_retention_hours("+2222222222") == 48
+
     def test_set_group_retention_hours_new(self, repo):
         """Creates new setting for group."""
         repo.set_group_retention_hours("group-abc-123", 72, source="signal")
@@ -621,6 +1120,43 @@ class TestGroupSettingsOperations:
         settings = repo.get_all_group_retention_settings()
         assert settings == {}
 
+    def test_sync_signal_retention_from_expiry(self, repo):
+        """Follows Signal's disappearing-messages timer when no setting exists."""
+        # 1 week = 604800 seconds = 168 hours
+        assert repo.sync_signal_retention("group-abc", 604800) == 168
+
+        settings = repo.get_group_settings("group-abc")
+        assert settings.retention_hours == 168
+        assert settings.source == "signal"
+
+    def test_sync_signal_retention_unchanged_skips_write(self, repo):
+        """Doesn't write when the retention already matches."""
+        # No disappearing messages and no setting: the 48h default already applies
+        assert repo.sync_signal_retention("group-abc", 0) is None
+        assert repo.get_group_settings("group-abc") is None
+
+        repo.set_group_retention_hours("group-abc", 168, source="signal")
+        with patch.object(repo, 'set_group_retention_hours') as mock_set:
+            assert repo.sync_signal_retention("group-abc", 604800) is None
+        mock_set.assert_not_called()
+
+    def test_sync_signal_retention_default_no_expiry(self, repo):
+        """Falls back to 48h when disappearing messages are turned off."""
+        repo.set_group_retention_hours("group-abc", 168, source="signal")
+
+        assert repo.sync_signal_retention("group-abc", 0) == 48
+        assert repo.get_group_retention_hours("group-abc") == 48
+
+    def test_sync_signal_retention_skipped_source_command(self, repo):
+        """Preserves retention fixed with !retention."""
+        repo.set_group_retention_hours("group-abc", 72, source="command")
+
+        assert repo.sync_signal_retention("group-abc", 604800) is None
+
+        settings = repo.get_group_settings("group-abc")
+        assert settings.retention_hours == 72
+        assert settings.source == "command"
+
 
 class TestGroupPowerModeOperations:
     """Tests for group power mode (admin permissions) operations."""
@@ -693,6 +1229,29 @@ class TestUserOptOut:
         result = repo.is_user_opted_out("group-abc", "user-123")
         assert result is False
 
+    def test_opt_out_cached_until_set(self, repo):
+        """Repeat checks are served from cache; setting the opt-out invalidates it."""
+        assert repo.is_user_opted_out("group-abc", "user-123") is False
+
+        with patch.object(repo, 'get_session', side_effect=AssertionError("cache miss")):
+            assert repo.is_user_opted_out("group-abc", "user-123") is False
+
+        repo.set_user_opt_out("group-abc", "user-123", opted_out=True)
+        assert repo.is_user_opted_out("group-abc", "user-123") is True
+
+    def test_group_settings_share_cache_entry(self, repo):
+        """Retention, power mode and purge flag are read with one query and invalidated together."""
+        repo.set_group_retention_hours("group-abc", 72, source="command")
+        assert repo.get_group_retention_hours("group-abc") == 72
+
+        with patch.object(repo, 'get_session', side_effect=AssertionError("cache miss")):
+            assert repo.get_group_power_mode("group-abc") == "admins"
+            assert repo.get_group_purge_on_summary("group-abc") is True
+
+        repo.set_group_power_mode("group-abc", "everyone")
+        assert repo.get_group_power_mode("group-abc") == "everyone"
+        assert repo.get_group_retention_hours("group-abc") == 72
+
     def test_is_user_opted_out_after_opt_out(self, repo):
         """Returns True after user opts out."""
         repo.set_user_opt_out("group-abc", "user-123", opted_out=True)
@@ -760,3 +1319,529 @@ class TestUserOptOut:
         # Check group-B still has the message
         messages = repo.get_messages_for_group("group-B")
         assert len(messages) == 1
+
+
+class TestMigrations:
+    """Tests for schema migrations on existing databases."""
+
+    def _index_names(self, repo):
+        from sqlalchemy import text
+        with repo.engine.connect() as conn:
+            result = conn.execute(text("SELECT name FROM sqlite_master WHERE type='index'"))
+            return {row[0] for row in result.fetchall()}
+
+    def test_migrations_skipped_when_schema_unchanged(self, tmp_path):
+        """Skips the migration checks until schema_version or the revision changes."""
+        from sqlalchemy import text
+        from src.database import repository as repository_module
+        db_path = str(tmp_path / "state.db")
+        DatabaseRepository(db_path, encryption_key="test_key_16_chars").engine.dispose()
+
+        with patch.object(DatabaseRepository, '_record_migration_state') as record:
+            DatabaseRepository(db_path, encryption_key="test_key_16_chars").engine.dispose()
+        record.assert_not_called()
+
+        with patch.object(repository_module, 'MIGRATIONS_REVISION', repository_module.MIGRATIONS_REVISION + 1):
+            repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            revision = conn.execute(text("SELECT revision FROM _migration_state")).scalar()
+        assert revision == repository_module.MIGRATIONS_REVISION + 1
+
+    def test_time_indexes_replaced_with_composites(self, tmp_path):
+        """Drops legacy single-column time indexes and adds the composite."""
+        from sqlalchemy import text
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text("CREATE INDEX idx_message_received_at ON messages(received_at)"))
+            conn.execute(text("CREATE INDEX idx_dm_created_at ON dm_conversations(created_at)"))
+            conn.commit()
+        repo.engine.dispose()
+
+        migrated = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        indexes = self._index_names(migrated)
+
+        assert "idx_message_group_received_hour" in indexes
+        assert "idx_message_received_at" not in indexes
+        assert "idx_dm_created_at" not in indexes
+
+    def test_enabled_schedules_index_made_partial(self, tmp_path):
+        """Rebuilds a full idx_enabled_schedules as a partial index."""
+        from sqlalchemy import text
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text("DROP INDEX idx_enabled_schedules"))
+            conn.execute(text("CREATE INDEX idx_enabled_schedules ON scheduled_summaries(enabled)"))
+            conn.commit()
+        repo.engine.dispose()
+
+        migrated = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with migrated.engine.connect() as conn:
+            sql = conn.execute(text(
+                "SELECT sql FROM sqlite_master WHERE name='idx_enabled_schedules'"
+            )).scalar()
+
+        assert "WHERE enabled = 1" in sql
+
+    def test_received_at_hour_column_added(self, tmp_path):
+        """Adds the received_at_hour generated column to a legacy messages table."""
+        from sqlalchemy import text
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text("DROP TABLE messages"))
+            conn.execute(text("""
+                CREATE TABLE messages (
+                    id INTEGER PRIMARY KEY,
+                    signal_timestamp BIGINT NOT NULL,
+                    sender_uuid VARCHAR(255) NOT NULL,
+                    group_id VARCHAR(255) NOT NULL,
+                    content TEXT,
+                    received_at DATETIME NOT NULL,
+                    CONSTRAINT uq_message_identity UNIQUE (signal_timestamp, sender_uuid, group_id)
+                )
+            """))
+            conn.execute(text("CREATE INDEX idx_message_group_received ON messages(group_id, received_at)"))
+            conn.execute(text(
+                "INSERT INTO messages (signal_timestamp, sender_uuid, group_id, content, received_at) "
+                "VALUES (1000, 'u1', 'g1', 'Old', '2024-12-13 10:30:00.000000')"
+            ))
+            conn.commit()
+        repo.engine.dispose()
+
+        migrated = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with migrated.engine.connect() as conn:
+            hour = conn.execute(text("SELECT received_at_hour FROM messages")).scalar()
+
+        assert hour == 1734085800 // 3600
+        assert "idx_message_group_received_hour" in self._index_names(migrated)
+        assert "idx_message_group_received" not in self._index_names(migrated)
+        assert migrated.purge_messages_for_group("g1", datetime(2024, 12, 13, 10, 31)) == 1
+
+    def test_group_hash_column_backfilled(self, tmp_path):
+        """Adds and backfills groups.group_hash on a legacy groups table."""
+        from sqlalchemy import text
+        from src.utils.message_utils import anonymize_group_id
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text("DROP TABLE groups"))
+            conn.execute(text("""
+                CREATE TABLE groups (
+                    id INTEGER PRIMARY KEY,
+                    group_id VARCHAR(255) NOT NULL UNIQUE,
+                    name VARCHAR(255) NOT NULL,
+                    description TEXT,
+                    created_at DATETIME,
+                    updated_at DATETIME
+                )
+            """))
+            conn.execute(text("INSERT INTO groups (group_id, name) VALUES ('legacy-group', 'Legacy')"))
+            conn.commit()
+        repo.engine.dispose()
+
+        migrated = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        group, error = migrated.find_group_by_name_or_hash(anonymize_group_id("legacy-group"))
+
+        assert error is None
+        assert group.name == "Legacy"
+        assert "ix_groups_group_hash" in self._index_names(migrated)
+
+    def test_text_uuids_compacted(self, tmp_path):
+        """Re-encodes stored text UUIDs so lookups by UUID still match."""
+        from sqlalchemy import text
+        from src.database.models import message_identity_hash
+        sender = "6f1c2e4a-1b2c-4d5e-8f90-123456789abc"
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text(
+                "INSERT INTO messages (signal_timestamp, sender_uuid, group_id, content, received_at, identity_hash) "
+                "VALUES (1000, :sender, 'g1', 'Hi', '2024-12-13 10:30:00.000000', :hash)"
+            ), {'sender': sender, 'hash': message_identity_hash(1000, sender, 'g1')})
+            conn.execute(text(
+                "INSERT INTO user_opt_outs (group_id, sender_uuid, opted_out, created_at, updated_at) "
+                "VALUES ('g1', :sender, 1, '2024-12-13 10:30:00', '2024-12-13 10:30:00')"
+            ), {'sender': sender})
+            # Legacy databases predate migration-state tracking
+            conn.execute(text("DROP TABLE _migration_state"))
+            conn.commit()
+        repo.engine.dispose()
+
+        migrated = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with migrated.engine.connect() as conn:
+            stored_type = conn.execute(text("SELECT typeof(sender_uuid) FROM messages")).scalar()
+
+        assert stored_type == "blob"
+        assert migrated.is_user_opted_out("g1", sender) is True
+        msg, is_new = migrated.store_message(1000, sender, "g1", "Hi")
+        assert is_new is False
+        assert msg.sender_uuid == sender
+
+    def test_settings_tables_rebuilt_without_rowid(self, tmp_path):
+        """Rebuilds legacy id-keyed settings tables, keeping their rows."""
+        from sqlalchemy import text
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text("DROP TABLE group_settings"))
+            conn.execute(text("""
+                CREATE TABLE group_settings (
+                    id INTEGER PRIMARY KEY,
+                    group_id VARCHAR(255) NOT NULL UNIQUE,
+                    retention_hours INTEGER DEFAULT 48 NOT NULL,
+                    source VARCHAR(20) DEFAULT 'signal' NOT NULL,
+                    power_mode VARCHAR(20) DEFAULT 'admins' NOT NULL,
+                    purge_on_summary BOOLEAN DEFAULT 1 NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
+                )
+            """))
+            conn.execute(text("CREATE UNIQUE INDEX ix_group_settings_group_id ON group_settings(group_id)"))
+            conn.execute(text(
+                "INSERT INTO group_settings (group_id, retention_hours, source) VALUES ('g1', 12, 'command')"
+            ))
+            conn.commit()
+        repo.engine.dispose()
+
+        migrated = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with migrated.engine.connect() as conn:
+            sql = conn.execute(text(
+                "SELECT sql FROM sqlite_master WHERE type='table' AND name='group_settings'"
+            )).scalar()
+
+        assert "WITHOUT ROWID" in sql
+        assert migrated.get_group_retention_hours("g1") == 12
+        migrated.set_group_retention_hours("g1", 24, source="command")
+        assert migrated.get_group_retention_hours("g1") == 24
+
+    def test_failed_opt_out_rebuild_keeps_original_table(self, tmp_path):
+        """A WITHOUT ROWID rebuild whose copy fails leaves the opt-outs in place."""
+        from sqlalchemy import text
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text("DROP TABLE user_opt_outs"))
+            conn.execute(text("""
+                CREATE TABLE user_opt_outs (
+                    id INTEGER PRIMARY KEY,
+                    group_id VARCHAR(255) NOT NULL,
+                    sender_uuid VARCHAR(255) NOT NULL,
+                    opted_out BOOLEAN DEFAULT 1 NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
+                )
+            """))
+            # Duplicate natural keys make the copy into the new primary key fail
+            conn.execute(text(
+                "INSERT INTO user_opt_outs (group_id, sender_uuid) VALUES ('g1', 'u1'), ('g1', 'u1')"
+            ))
+            conn.commit()
+        repo.engine.dispose()
+
+        migrated = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with migrated.engine.connect() as conn:
+            tables = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'")).scalars())
+            rows = conn.execute(text("SELECT group_id FROM user_opt_outs")).scalars().all()
+            schema_version = conn.execute(text("SELECT schema_version FROM _migration_state")).scalar()
+            current_version = conn.execute(text("PRAGMA schema_version")).scalar()
+
+        assert "user_opt_outs_old" not in tables
+        assert rows == ["g1", "g1"]
+        # The stale state from the first start is kept, so the rebuild is retried
+        assert schema_version != current_version
+
+    def test_messages_rebuilt_with_identity_hash(self, tmp_path):
+        """Rebuilds a legacy messages table, hashing identities and keeping reactions linked."""
+        from sqlalchemy import text
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text("DROP TABLE messages"))
+            conn.execute(text("""
+                CREATE TABLE messages (
+                    id INTEGER PRIMARY KEY,
+                    signal_timestamp BIGINT NOT NULL,
+                    sender_uuid VARCHAR(255) NOT NULL,
+                    group_id VARCHAR(255) NOT NULL,
+                    content TEXT,
+                    received_at DATETIME NOT NULL,
+                    CONSTRAINT uq_message_identity UNIQUE (signal_timestamp, sender_uuid, group_id)
+                )
+            """))
+            conn.execute(text(
+                "INSERT INTO messages (id, signal_timestamp, sender_uuid, group_id, content, received_at) "
+                "VALUES (7, 1000, 'u1', 'g1', 'Hi', '2024-12-13 10:30:00.000000')"
+            ))
+            conn.execute(text(
+                "INSERT INTO reactions (message_id, emoji, reactor_uuid, timestamp) VALUES (7, '👍', 'r1', 2000)"
+            ))
+            conn.commit()
+        repo.engine.dispose()
+
+        migrated = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+
+        msg, is_new = migrated.store_message(1000, "u1", "g1", "Hi again")
+        assert is_new is False
+        assert msg.id == 7
+        assert msg.content == "Hi"
+        assert migrated.get_messages_with_reactions_for_group("g1")[0]['emojis'] == ["👍"]
+        with migrated.engine.connect() as conn:
+            reactions_sql = conn.execute(text(
+                "SELECT sql FROM sqlite_master WHERE type='table' AND name='reactions'"
+            )).scalar()
+        assert "messages_old" not in reactions_sql
+
+    def test_failed_messages_rebuild_keeps_original_table(self, tmp_path):
+        """A copy that fails mid-rebuild rolls back completely and is retried next start."""
+        from sqlalchemy import text
+        from src.database import repository as repository_module
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text("DROP TABLE messages"))
+            conn.execute(text("""
+                CREATE TABLE messages (
+                    id INTEGER PRIMARY KEY,
+                    signal_timestamp BIGINT NOT NULL,
+                    sender_uuid VARCHAR(255) NOT NULL,
+                    group_id VARCHAR(255) NOT NULL,
+                    content TEXT,
+                    received_at DATETIME DEFAULT (STRFTIME('%Y-%m-%d %H:%M:%f', 'now')) NOT NULL,
+                    CONSTRAINT uq_message_identity UNIQUE (signal_timestamp, sender_uuid, group_id)
+                )
+            """))
+            conn.execute(text(
+                "INSERT INTO messages (id, signal_timestamp, sender_uuid, group_id, content, received_at) "
+                "VALUES (7, 1000, 'u1', 'g1', 'Hi', '2024-12-13 10:30:00.000000')"
+            ))
+            conn.commit()
+        repo.engine.dispose()
+
+        with patch.object(repository_module, 'message_identity_hash', side_effect=RuntimeError("copy failed")):
+            failed = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with failed.engine.connect() as conn:
+            tables = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'")).scalars())
+            contents = conn.execute(text("SELECT content FROM messages")).scalars().all()
+            columns = {row[1] for row in conn.execute(text("PRAGMA table_info(messages)"))}
+        failed.engine.dispose()
+
+        assert "messages_old" not in tables
+        assert contents == ["Hi"]
+        assert "identity_hash" not in columns
+
+        retried = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        msg, is_new = retried.store_message(1000, "u1", "g1", "Hi again")
+        assert is_new is False
+        assert msg.id == 7
+
+    def test_redundant_prefix_indexes_dropped(self, tmp_path):
+        """Drops single-column indexes already covered by composite ones."""
+        from sqlalchemy import text
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text("CREATE INDEX ix_messages_group_id ON messages(group_id)"))
+            conn.execute(text("CREATE INDEX ix_reactions_message_id ON reactions(message_id)"))
+            conn.execute(text("CREATE INDEX ix_dm_conversations_user_id ON dm_conversations(user_id)"))
+            conn.execute(text("DROP INDEX idx_message_group_sender"))
+            conn.commit()
+        repo.engine.dispose()
+
+        indexes = self._index_names(DatabaseRepository(db_path, encryption_key="test_key_16_chars"))
+
+        assert "ix_messages_group_id" not in indexes
+        assert "ix_reactions_message_id" not in indexes
+        assert "ix_dm_conversations_user_id" not in indexes
+        assert "idx_message_group_sender" in indexes
+
+    def test_redundant_opt_out_indexes_dropped(self, tmp_path):
+        """Drops opt-out indexes that duplicate the WITHOUT ROWID primary key."""
+        from sqlalchemy import text
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text(
+                "CREATE INDEX idx_active_opt_outs ON user_opt_outs(group_id, sender_uuid) WHERE opted_out = 1"
+            ))
+            conn.execute(text("CREATE INDEX ix_user_opt_outs_sender_uuid ON user_opt_outs(sender_uuid)"))
+            conn.commit()
+        repo.engine.dispose()
+
+        migrated = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        indexes = self._index_names(migrated)
+
+        assert "idx_active_opt_outs" not in indexes
+        assert "ix_user_opt_outs_sender_uuid" not in indexes
+        migrated.set_user_opt_out("g1", "u1", True)
+        assert migrated.is_user_opted_out("g1", "u1") is True
+
+    def test_unused_scheduled_times_table_dropped(self, tmp_path):
+        """Drops the scheduled_times table, which nothing reads."""
+        from sqlalchemy import text
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text(
+                "CREATE TABLE scheduled_times (id INTEGER PRIMARY KEY, schedule_id INTEGER NOT NULL, "
+                "minute_of_day INTEGER NOT NULL, day_of_week INTEGER)"
+            ))
+            conn.commit()
+        repo.engine.dispose()
+
+        migrated = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with migrated.engine.connect() as conn:
+            tables = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'"))}
+        assert "scheduled_times" not in tables
+
+    def test_dm_conversations_rebuilt_with_server_default(self, tmp_path):
+        """Rebuilds dm_conversations so SQLite stamps created_at, keeping rows."""
+        from sqlalchemy import text
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text("DROP TABLE dm_conversations"))
+            conn.execute(text("""
+                CREATE TABLE dm_conversations (
+                    id INTEGER PRIMARY KEY,
+                    user_id VARCHAR(100) NOT NULL,
+                    role SMALLINT NOT NULL,
+                    content TEXT NOT NULL,
+                    signal_timestamp BIGINT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
+                )
+            """))
+            conn.execute(text(
+                "INSERT INTO dm_conversations (user_id, role, content, created_at) "
+                "VALUES ('user1', 0, 'Hi', '2024-12-13 10:30:00.000000')"
+            ))
+            conn.commit()
+        repo.engine.dispose()
+
+        migrated = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        migrated.store_dm_message("user1", "assistant", "Hello")
+
+        history = migrated.get_dm_history("user1")
+        assert [m.content for m in history] == ["Hi", "Hello"]
+        assert history[1].created_at > history[0].created_at
+        assert "idx_dm_user_created" in self._index_names(migrated)
+
+    def test_failed_default_rebuild_keeps_original_table(self, tmp_path):
+        """A server-default rebuild whose copy fails leaves the DM history in place."""
+        from sqlalchemy import text
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text("DROP TABLE dm_conversations"))
+            conn.execute(text("""
+                CREATE TABLE dm_conversations (
+                    id INTEGER PRIMARY KEY,
+                    user_id VARCHAR(100) NOT NULL,
+                    role SMALLINT NOT NULL,
+                    content TEXT,
+                    signal_timestamp BIGINT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
+                )
+            """))
+            # NULL content violates the new table's NOT NULL, so the copy fails
+            conn.execute(text(
+                "INSERT INTO dm_conversations (user_id, role, content) VALUES ('user1', 0, NULL)"
+            ))
+            conn.commit()
+        repo.engine.dispose()
+
+        migrated = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with migrated.engine.connect() as conn:
+            tables = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'")).scalars())
+            users = conn.execute(text("SELECT user_id FROM dm_conversations")).scalars().all()
+            schema_version = conn.execute(text("SELECT schema_version FROM _migration_state")).scalar()
+            current_version = conn.execute(text("PRAGMA schema_version")).scalar()
+
+        assert "dm_conversations_old" not in tables
+        assert users == ["user1"]
+        # The stale state from the first start is kept, so the rebuild is retried
+        assert schema_version != current_version
+
+
+class TestEngineConfiguration:
+    """Tests for the engine factory's PRAGMA setup."""
+
+    def _pragma(self, repo, name):
+        from sqlalchemy import text
+        with repo.engine.connect() as conn:
+            return conn.execute(text(f"PRAGMA {name}")).scalar()
+
+    def test_pragmas_applied(self, tmp_path):
+        """Every connection gets WAL, NORMAL sync and the tuned cache."""
+        repo = DatabaseRepository(str(tmp_path / "tuned.db"), encryption_key="test_key_16_chars")
+
+        assert self._pragma(repo, "journal_mode") == "wal"
+        assert self._pragma(repo, "synchronous") == 1  # NORMAL
+        assert self._pragma(repo, "cache_size") == -131072
+        assert self._pragma(repo, "busy_timeout") == 5000
+
+    def test_file_database_uses_connection_pool(self, tmp_path):
+        """File databases reuse pooled connections instead of reopening them."""
+        from sqlalchemy.pool import QueuePool
+        from src.database.engine import POOL_SIZE
+        repo = DatabaseRepository(str(tmp_path / "pooled.db"), encryption_key="test_key_16_chars")
+
+        assert isinstance(repo.engine.pool, QueuePool)
+        assert repo.engine.pool.size() == POOL_SIZE
+        with repo.engine.connect() as conn:
+            first = conn.connection.dbapi_connection
+        with repo.engine.connect() as conn:
+            assert conn.connection.dbapi_connection is first
+
+    def test_sqlcipher_salt_and_raw_key(self, tmp_path):
+        """Reads the 16-byte file salt and derives a 32-byte hex raw key from it."""
+        from src.database.engine import derive_raw_key, read_sqlcipher_salt
+        db_file = tmp_path / "cipher.db"
+        db_file.write_bytes(bytes(range(16)) + b"encrypted pages")
+        (tmp_path / "short.db").write_bytes(b"short")
+
+        salt = read_sqlcipher_salt(str(db_file))
+        assert salt == bytes(range(16))
+        assert read_sqlcipher_salt(str(tmp_path / "short.db")) is None
+        assert read_sqlcipher_salt(str(tmp_path / "missing.db")) is None
+
+        raw_key = derive_raw_key("test_key_16_chars", salt)
+        assert len(raw_key) == 64
+        assert raw_key == derive_raw_key("test_key_16_chars", salt)
+        assert raw_key != derive_raw_key("test_key_16_chars", bytes(16))
+
+    def test_synchronous_toggle(self, tmp_path):
+        """SQLITE_SYNCHRONOUS overrides the default mode."""
+        with patch.dict(os.environ, {'SQLITE_SYNCHRONOUS': 'full'}):
+            repo = DatabaseRepository(str(tmp_path / "full.db"), encryption_key="test_key_16_chars")
+
+        assert self._pragma(repo, "synchronous") == 2  # FULL
+
+    def test_invalid_synchronous_rejected(self):
+        """Raises ValueError for an unknown synchronous mode."""
+        with patch.dict(os.environ, {'SQLITE_SYNCHRONOUS': 'SOMETIMES'}):
+            with pytest.raises(ValueError, match="SQLITE_SYNCHRONOUS"):
+                DatabaseRepository(":memory:", encryption_key="test_key_16_chars")
+
+    def test_enum_strings_converted_to_codes(self, tmp_path):
+        """Converts legacy string statuses/roles so they still read back as strings."""
+        from sqlalchemy import text
+        db_path = str(tmp_path / "legacy.db")
+        repo = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with repo.engine.connect() as conn:
+            conn.execute(text(
+                "INSERT INTO dm_conversations (user_id, role, content, created_at) "
+                "VALUES ('+15551234567', 'assistant', 'Hi', '2024-12-13 10:30:00')"
+            ))
+            # Legacy databases predate migration-state tracking
+            conn.execute(text("DROP TABLE _migration_state"))
+            conn.commit()
+        repo.engine.dispose()
+
+        migrated = DatabaseRepository(db_path, encryption_key="test_key_16_chars")
+        with migrated.engine.connect() as conn:
+            stored = conn.execute(text("SELECT role FROM dm_conversations")).scalar()
+
+        assert stored == 1
+        assert migrated.get_dm_history("+15551234567")[0].role == "assistant"
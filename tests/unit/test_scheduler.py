@@ -68,12 +68,14 @@ class TestPurgeJob:
 
         mock_repo.get_enabled_scheduled_summaries.return_value = [mock_schedule]
         mock_repo.get_pending_stats.return_value = {'messages_by_group': {"group-abc": 10}}
-        mock_repo.purge_messages_for_group.return_value = 5
+        mock_repo.purge_messages_for_groups.return_value = {"group-abc": 5}
 
         scheduler = ExportScheduler(MagicMock(), mock_repo)
         scheduler.purge_job()
 
-        mock_repo.purge_messages_for_group.assert_called()
+        cutoffs = mock_repo.purge_messages_for_groups.call_args[0][0]
+        expected = datetime.utcnow() - timedelta(hours=24)
+        assert abs((cutoffs["group-abc"] - expected).total_seconds()) < 5
 
 
 class TestPurgeExpiredMessages:
@@ -91,13 +93,13 @@ class TestPurgeExpiredMessages:
 
         mock_repo.get_enabled_scheduled_summaries.return_value = [mock_schedule]
         mock_repo.get_pending_stats.return_value = {'messages_by_group': {}}
-        mock_repo.purge_messages_for_group.return_value = 3
+        mock_repo.purge_messages_for_groups.return_value = {"group-1": 3}
 
         scheduler = ExportScheduler(MagicMock(), mock_repo)
         count = scheduler._purge_expired_messages()
 
         assert count == 3
-        mock_repo.purge_messages_for_group.assert_called_once()
+        mock_repo.purge_messages_for_groups.assert_called_once()
 
     def test_purges_orphan_groups(self):
         """Purges messages from groups without schedules."""
@@ -106,18 +108,18 @@ class TestPurgeExpiredMessages:
         mock_repo.get_pending_stats.return_value = {
             'messages_by_group': {"orphan-group": 5}
         }
-        mock_repo.purge_messages_for_group.return_value = 5
+        mock_repo.purge_messages_for_groups.return_value = {"orphan-group": 5}
 
         scheduler = ExportScheduler(MagicMock(), mock_repo)
         count = scheduler._purge_expired_messages()
 
         assert count == 5
         # Verify called with correct group_id
-        mock_repo.purge_messages_for_group.assert_called_once()
-        call_args = mock_repo.purge_messages_for_group.call_args
-        assert call_args[0][0] == "orphan-group"
-        # Verify 'before' is approximately 48 hours ago
-        before_arg = call_args[1]["before"]
+        mock_repo.purge_messages_for_groups.assert_called_once()
+        cutoffs = mock_repo.purge_messages_for_groups.call_args[0][0]
+        assert list(cutoffs) == ["orphan-group"]
+        # Verify cutoff is approximately 48 hours ago
+        before_arg = cutoffs["orphan-group"]
         expected = datetime.utcnow() - timedelta(hours=48)
         assert abs((before_arg - expected).total_seconds()) < 5
 
@@ -310,28 +312,17 @@ class TestGroupSettingsPriority:
 
         mock_repo.get_enabled_scheduled_summaries.return_value = [mock_schedule]
         mock_repo.get_pending_stats.return_value = {'messages_by_group': {}}
-        mock_repo.purge_messages_for_group.return_value = 5
-        mock_repo.get_dm_user_ids.return_value = []
+        mock_repo.purge_messages_for_groups.return_value = {"group-abc": 5}
+        mock_repo.purge_expired_dm_messages_by_retention.return_value = {}
 
         scheduler = ExportScheduler(MagicMock(), mock_repo)
         scheduler._purge_expired_messages()
 
-        # Should have been called with GroupSettings retention (24h), not schedule (72h)
-        # The first call should be for the GroupSettings purge
-        calls = mock_repo.purge_messages_for_group.call_args_list
+        # All groups are purged in one batched call
+        mock_repo.purge_messages_for_groups.assert_called_once()
+        cutoffs = mock_repo.purge_messages_for_groups.call_args[0][0]
 
-        assert len(calls) >= 1
-        # First call should be for group-abc with cutoff based on 24h
-        first_call_group_id = calls[0][0][0]
-        first_call_before = calls[0][1]["before"]
-
-        assert first_call_group_id == "group-abc"
-
-        # Verify cutoff is approximately 24 hours ago (not 72h)
+        # group-abc appears once, with the GroupSettings retention (24h), not the schedule's (72h)
+        assert list(cutoffs) == ["group-abc"]
         expected_cutoff = datetime.utcnow() - timedelta(hours=24)
-        assert abs((first_call_before - expected_cutoff).total_seconds()) < 5
-
-        # The schedule should NOT trigger a second purge for the same group
-        # because processed_groups set prevents double-processing
-        group_purge_calls = [c for c in calls if c[0][0] == "group-abc"]
-        assert len(group_purge_calls) == 1  # Only one purge for this group
+        assert abs((cutoffs["group-abc"] - expected_cutoff).total_seconds()) < 5
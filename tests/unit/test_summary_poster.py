@@ -1,5 +1,6 @@
 """Tests for src/exporter/summary_poster.py"""
 
+import time
 import pytest
 from unittest.mock import patch, MagicMock
 from datetime import datetime, timedelta
@@ -95,6 +96,24 @@ class TestGenerateAndPostSummary:
         deps["cli"].send_message.assert_called()
         deps["repo"].complete_summary_run.assert_called()
 
+    def test_queries_window_in_epoch_ms(self, mock_dependencies):
+        """Passes the summary window to the repository as epoch milliseconds."""
+        deps = mock_dependencies
+        deps["repo"].get_messages_with_reactions_for_group.return_value = []
+
+        poster = SummaryPoster(
+            deps["cli"],
+            deps["summarizer"],
+            deps["repo"],
+            deps["collector"]
+        )
+        poster.generate_and_post_summary(schedule_id=1, scheduled_time="09:00")
+
+        kwargs = deps["repo"].get_messages_with_reactions_for_group.call_args.kwargs
+        assert kwargs["group_id"] == "source-group-id"
+        assert kwargs["until_ms"] - kwargs["since_ms"] == 24 * 3600 * 1000
+        assert abs(kwargs["until_ms"] - time.time() * 1000) < 60 * 1000
+
     def test_no_messages_posts_no_activity(self, mock_dependencies):
         """Posts 'no activity' message when no messages."""
         deps = mock_dependencies
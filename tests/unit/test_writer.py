@@ -0,0 +1,86 @@
+"""Tests for src/database/writer.py"""
+
+import os
+import pytest
+from unittest.mock import patch
+
+# Set required env vars before import
+os.environ.setdefault('ENCRYPTION_KEY', 'test_encryption_key_16chars')
+
+from src.database.repository import DatabaseRepository
+from src.database.writer import MessageWriter
+
+
+class TestMessageWriter:
+    """Tests for buffered message writes."""
+
+    @pytest.fixture
+    def repo(self):
+        """Create a fresh in-memory database for each test."""
+        return DatabaseRepository(":memory:", encryption_key="test_key_16_chars")
+
+    def test_buffers_until_flush(self, repo):
+        """Messages are not written until flushed."""
+        writer = MessageWriter(repo, batch_size=10, flush_interval=60)
+        writer.add_message(1000, "u1", "g1", "Msg 1")
+        writer.add_message(2000, "u1", "g1", "Msg 2")
+
+        assert writer.pending == 2
+        assert repo.get_messages_for_group("g1") == []
+
+        assert writer.flush() == (2, 0)
+        assert writer.pending == 0
+        assert len(repo.get_messages_for_group("g1")) == 2
+
+    def test_flushes_when_batch_full(self, repo):
+        """Reaching batch_size triggers a flush."""
+        writer = MessageWriter(repo, batch_size=2, flush_interval=60)
+        writer.add_message(1000, "u1", "g1", "Msg 1")
+        writer.add_message(2000, "u1", "g1", "Msg 2")
+
+        assert writer.pending == 0
+        assert len(repo.get_messages_for_group("g1")) == 2
+
+    def test_flushes_when_window_elapsed(self, repo):
+        """A zero flush window writes every row immediately."""
+        writer = MessageWriter(repo, batch_size=100, flush_interval=0)
+        writer.add_message(1000, "u1", "g1", "Msg 1")
+
+        assert writer.pending == 0
+        assert len(repo.get_messages_for_group("g1")) == 1
+
+    def test_context_manager_flushes_on_exit(self, repo):
+        """Leaving the with-block writes buffered rows."""
+        msg, _ = repo.store_message(1000, "u1", "g1", "Target")
+
+        with MessageWriter(repo, batch_size=10, flush_interval=60) as writer:
+            writer.add_message(2000, "u2", "g1", "Msg 2")
+            writer.add_reaction(msg.id, "👍", "r1", 3000)
+
+        result = repo.get_messages_with_reactions_for_group("g1")
+        assert len(result) == 2
+        assert result[0]['reaction_count'] == 1
+
+    def test_counts_new_messages_across_flushes(self, repo):
+        """messages_stored totals new messages, including automatic flushes."""
+        writer = MessageWriter(repo, batch_size=2, flush_interval=60)
+        writer.add_message(1000, "u1", "g1", "Msg 1")
+        writer.add_message(2000, "u1", "g1", "Msg 2")  # Auto-flush
+        writer.add_message(1000, "u1", "g1", "Msg 1")  # Duplicate
+        writer.flush()
+
+        assert writer.messages_stored == 2
+
+    def test_failed_flush_keeps_rows(self, repo):
+        """Rows survive a failed write and are written by the next flush."""
+        writer = MessageWriter(repo, batch_size=10, flush_interval=60)
+        writer.add_message(1000, "u1", "g1", "Msg 1")
+
+        with patch.object(repo, 'write_batch', side_effect=RuntimeError("database is locked")):
+            with pytest.raises(RuntimeError):
+                writer.flush()
+        writer.add_message(2000, "u1", "g1", "Msg 2")
+
+        assert writer.pending == 2
+        assert writer.flush() == (2, 0)
+        assert [m.content for m in repo.get_messages_for_group("g1")] == ["Msg 1", "Msg 2"]